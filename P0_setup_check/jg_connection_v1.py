@@ -1,4 +1,7 @@
 from gremlin_python.driver.driver_remote_connection import DriverRemoteConnection
+from gremlin_python.driver.serializer import (
+    GraphBinarySerializersV1, GraphSONSerializersV2d0, GraphSONSerializersV3d0,
+)
 from gremlin_python.process.graph_traversal import GraphTraversalSource
 from gremlin_python.process.anonymous_traversal import traversal
 import sys
@@ -7,16 +10,27 @@ import asyncio
 if sys.platform.startswith('win'):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
+# Wire formats the connector can use, by name.
+SERIALIZERS = {
+    "graphbinary": GraphBinarySerializersV1,
+    "graphsonv3": GraphSONSerializersV3d0,
+    "graphsonv2": GraphSONSerializersV2d0,
+}
+
 class JanusGraphConnector:
     """
     A class to manage the connection to a JanusGraph Gremlin Server.
     """
 
-    def __init__(self, gremlin_server_url: str = "ws://localhost:8182/gremlin"):
+    def __init__(self, gremlin_server_url: str = "ws://localhost:8182/gremlin", serializer: str = "graphbinary"):
         """
-        Initialize with the Gremlin server URL.
+        Initialize with the Gremlin server URL and the message serializer
+        (graphbinary, graphsonv3 or graphsonv2).
         """
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"Unknown serializer {serializer!r}, expected one of {', '.join(SERIALIZERS)}")
         self.gremlin_server_url = gremlin_server_url
+        self.serializer = serializer
         self.conn = None
         self.g: GraphTraversalSource | None = None
 
@@ -24,9 +38,11 @@ class JanusGraphConnector:
         """
         Establishes the connection and sets up the traversal source.
         """
-        print(f"Connecting to Gremlin server at {self.gremlin_server_url}")
+        print(f"Connecting to Gremlin server at {self.gremlin_server_url} ({self.serializer})")
         try:
-            self.conn = DriverRemoteConnection(self.gremlin_server_url, 'g')
+            self.conn = DriverRemoteConnection(
+                self.gremlin_server_url, 'g', message_serializer=SERIALIZERS[self.serializer]()
+            )
             self.g = traversal().with_remote(self.conn)
             print("Connected to JanusGraph Gremlin Server.")
         except ConnectionRefusedError:
@@ -0,0 +1,313 @@
+import argparse
+import csv
+import math
+import os
+import random
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from air_routes_loader import VERTEX, EDGE
+
+# Synthetic air-routes graphs of any size, for benchmarks and capacity
+# planning.
+#
+# The graph has the shape of Kelvin Lawrence's air-routes data: continent,
+# country and airport vertices, 'contains' edges from continents and countries
+# to their airports and 'route' edges (with a 'dist' property in miles)
+# between airports. To look real it has
+#  - hub skew: airport i is the (i+1)-th busiest. Its number of routes and its
+#    chance of being picked as a destination both fall off as (i+1)^-skew
+#    (Zipf), so a few hubs have hundreds of routes and most airports a few.
+#  - geography: airports are grouped in metro clusters (airport i belongs to
+#    cluster i % clusters) scattered over the continents' land boxes, and most
+#    routes (--locality) stay within the cluster, i.e. are short.
+#
+# Memory stays bounded whatever the size: nothing is kept per airport. All of
+# an airport's properties and its location are derived from (seed, index) on
+# demand, destinations are drawn with an inverse-CDF Zipf sampler, and records
+# are written out as they are produced. The same seed always gives the same
+# graph.
+#
+# Output is Gremlin CSV, the format air_routes_loader.py and gremlin_standin.py
+# read (--vertices / --edges):
+#   python air_routes_generator.py --elements 1000000 --out data/1m
+#   python air_routes_loader.py --vertices data/1m/vertices.csv --edges data/1m/edges.csv
+#   python gremlin_standin.py --vertices data/1m/vertices.csv --edges data/1m/edges.csv
+
+# (code, name, share of the airports, (min lat, max lat), (min lon, max lon))
+CONTINENTS = [
+    ("AF", "Africa", 0.09, (-35.0, 35.0), (-17.0, 51.0)),
+    ("AN", "Antarctica", 0.01, (-85.0, -62.0), (-180.0, 180.0)),
+    ("AS", "Asia", 0.25, (5.0, 55.0), (60.0, 145.0)),
+    ("EU", "Europe", 0.20, (36.0, 70.0), (-10.0, 40.0)),
+    ("NA", "North America", 0.28, (15.0, 70.0), (-165.0, -55.0)),
+    ("OC", "Oceania", 0.06, (-45.0, -10.0), (110.0, 180.0)),
+    ("SA", "South America", 0.11, (-55.0, 12.0), (-80.0, -35.0)),
+]
+
+VERTEX_COLUMNS = [
+    ("code", "string"), ("icao", "string"), ("desc", "string"), ("city", "string"), ("region", "string"),
+    ("country", "string"), ("runways", "int"), ("longest", "int"), ("elev", "int"),
+    ("lat", "double"), ("lon", "double"), ("type", "string"),
+]
+EDGE_COLUMNS = [("dist", "int")]
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversine_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(min(1.0, a)))
+
+
+# Letters-only code for an index: AAA..ZZZ first, then AAAA.., so codes stay
+# unique for any number of airports.
+def letter_code(i: int, width: int = 3) -> str:
+    while i >= 26 ** width:
+        i -= 26 ** width
+        width += 1
+    letters = []
+    for _ in range(width):
+        i, r = divmod(i, 26)
+        letters.append(chr(ord("A") + r))
+    return "".join(reversed(letters))
+
+
+# Sum of k^-s for k = 1..n (Euler-Maclaurin), so the degree of every airport
+# can be computed without a pass over all of them.
+def _zipf_norm(n: int, s: float) -> float:
+    if n <= 0:
+        return 0.0
+    if abs(s - 1.0) < 1e-9:
+        return math.log(n) + 0.5772156649 + 1 / (2 * n)
+    return (n ** (1 - s) - 1) / (1 - s) + (1 + n ** -s) / 2
+
+
+# Draws a rank in [0, n) with probability roughly proportional to
+# (rank+1)^-s, by inverting the continuous power-law CDF.
+def _zipf_rank(rnd: random.Random, n: int, s: float) -> int:
+    u = rnd.random()
+    if abs(s - 1.0) < 1e-9:
+        x = (n + 1) ** u
+    else:
+        x = (((n + 1) ** (1 - s) - 1) * u + 1) ** (1 / (1 - s))
+    return min(n - 1, max(0, int(x) - 1))
+
+
+# The AirRoutesGenerator Class
+# Describes one synthetic graph. Nothing is generated up front: vertices(),
+# edges() and records() are generators, and every per-airport value comes
+# from a Random seeded with (seed, airport index), cached in a bounded LRU for
+# the hubs that are looked up over and over as destinations.
+class AirRoutesGenerator:
+    def __init__(self, airports: int = 3500, routes_per_airport: float = 8.0, seed: int = 42,
+                 skew: float = 1.0, locality: float = 0.7, cluster_size: int = 40, max_routes: int = 400):
+        if airports < 2:
+            raise ValueError(f"Need at least 2 airports, got {airports}")
+        self.airports = airports
+        self.routes_per_airport = routes_per_airport
+        self.seed = seed
+        self.skew = skew
+        self.locality = locality
+        self.max_routes = min(max_routes, airports - 1)
+        self.clusters = max(1, airports // cluster_size)
+        # Cluster k lies in country k % countries, so with no more countries
+        # than clusters every country contains airports.
+        self.countries = min(250, self.clusters)
+        self._scale = self._degree_scale()
+        self.airport = lru_cache(maxsize=65536)(self._airport)
+        self.country = lru_cache(maxsize=1024)(self._country)
+        self.cluster_center = lru_cache(maxsize=65536)(self._cluster_center)
+
+    # Picks the airport count for a target number of elements (vertices +
+    # edges): every airport brings itself, two 'contains' edges and its routes.
+    @classmethod
+    def for_elements(cls, elements: int, routes_per_airport: float = 8.0, **kwargs) -> "AirRoutesGenerator":
+        return cls(max(2, int(elements / (3 + routes_per_airport))), routes_per_airport, **kwargs)
+
+    # String seeds are hashed with SHA-512 by random, so unlike hash() they
+    # give the same stream in every process.
+    def _rnd(self, kind: str, n: int) -> random.Random:
+        return random.Random(f"{self.seed}:{kind}:{n}")
+
+    def _country(self, c: int) -> Tuple[str, int]:
+        rnd = self._rnd("country", c)
+        r, acc = rnd.random(), 0.0
+        for n, continent in enumerate(CONTINENTS):
+            acc += continent[2]
+            if r < acc:
+                return letter_code(c, 2), n
+        return letter_code(c, 2), len(CONTINENTS) - 1
+
+    def _cluster_center(self, k: int) -> Tuple[float, float, int]:
+        country = k % self.countries
+        _, continent = self.country(country)
+        _, _, _, (lat0, lat1), (lon0, lon1) = CONTINENTS[continent]
+        rnd = self._rnd("cluster", k)
+        return rnd.uniform(lat0, lat1), rnd.uniform(lon0, lon1), country
+
+    def _airport(self, i: int) -> Dict[str, Any]:
+        cluster = i % self.clusters
+        lat, lon, country = self.cluster_center(cluster)
+        rnd = self._rnd("airport", i)
+        code = letter_code(i)
+        country_code = letter_code(country, 2)
+        # Hubs sit at the center of their cluster, the rest around it.
+        spread = 0.3 if i < self.clusters else 2.0
+        big = i < self.airports * 0.02
+        return {
+            "code": code,
+            "icao": "X" + code,
+            "desc": f"{code} {'International ' if big else ''}Airport",
+            "city": f"City {letter_code(cluster)}",
+            "region": f"{country_code}-{rnd.randrange(1, 20)}",
+            "country": country_code,
+            "runways": rnd.randint(3, 6) if big else rnd.randint(1, 3),
+            "longest": rnd.randint(10000, 16000) if big else rnd.randint(3000, 10000),
+            "elev": rnd.randint(0, 7000),
+            "lat": round(max(-89.9, min(89.9, rnd.gauss(lat, spread))), 4),
+            "lon": round((rnd.gauss(lon, spread) + 180) % 360 - 180, 4),
+            "type": "airport",
+        }
+
+    # Finds c such that the degrees min(max_routes, c * (i+1)^-skew) add up to
+    # routes_per_airport * airports, by bisection. The first k airports are
+    # capped, so the sum is k * max_routes + c * (Z(n) - Z(k)).
+    def _degree_scale(self) -> float:
+        n, s, cap = self.airports, self.skew, self.max_routes
+        target = self.routes_per_airport * n
+        low, high = 0.0, target
+        for _ in range(100):
+            c = (low + high) / 2
+            k = min(n, int((c / cap) ** (1 / s))) if c > cap else 0
+            total = k * cap + c * (_zipf_norm(n, s) - _zipf_norm(k, s))
+            if total < target:
+                low = c
+            else:
+                high = c
+        return (low + high) / 2
+
+    # Number of routes out of airport i: proportional to its Zipf weight,
+    # scaled so the mean is about routes_per_airport, capped at max_routes.
+    def degree(self, i: int) -> int:
+        return max(1, min(self.max_routes, round(self._scale * (i + 1) ** -self.skew)))
+
+    def destinations(self, i: int) -> List[int]:
+        rnd = self._rnd("routes", i)
+        wanted = self.degree(i)
+        cluster = i % self.clusters
+        in_cluster = (self.airports - cluster + self.clusters - 1) // self.clusters
+        chosen: List[int] = []
+        seen = {i}
+        attempts = 0
+        while len(chosen) < wanted and attempts < wanted * 20:
+            attempts += 1
+            if in_cluster > 1 and rnd.random() < self.locality:
+                j = _zipf_rank(rnd, in_cluster, self.skew) * self.clusters + cluster
+            else:
+                j = _zipf_rank(rnd, self.airports, self.skew)
+            if j not in seen:
+                seen.add(j)
+                chosen.append(j)
+        return chosen
+
+    def vertices(self) -> Iterator[Tuple]:
+        for code, name, _, _, _ in CONTINENTS:
+            yield (VERTEX, f"continent-{code}", "continent", {"code": code, "desc": name, "type": "continent"})
+        for c in range(self.countries):
+            code, _ = self.country(c)
+            yield (VERTEX, f"country-{c}", "country", {"code": code, "desc": f"Country {code}", "type": "country"})
+        for i in range(self.airports):
+            yield (VERTEX, f"airport-{i}", "airport", self.airport(i))
+
+    def edges(self) -> Iterator[Tuple]:
+        n = 0
+        for i in range(self.airports):
+            country = self.cluster_center(i % self.clusters)[2]
+            continent = CONTINENTS[self.country(country)[1]][0]
+            yield (EDGE, f"e{n}", "contains", {}, f"continent-{continent}", f"airport-{i}")
+            yield (EDGE, f"e{n + 1}", "contains", {}, f"country-{country}", f"airport-{i}")
+            n += 2
+        for i in range(self.airports):
+            a = self.airport(i)
+            for j in self.destinations(i):
+                b = self.airport(j)
+                dist = round(haversine_miles(a["lat"], a["lon"], b["lat"], b["lon"]))
+                yield (EDGE, f"e{n}", "route", {"dist": dist}, f"airport-{i}", f"airport-{j}")
+                n += 1
+
+    # Every vertex, then every edge, as air_routes_loader records.
+    def records(self) -> Iterator[Tuple]:
+        yield from self.vertices()
+        yield from self.edges()
+
+
+def _header(columns: List[Tuple[str, str]], fixed: List[str]) -> List[str]:
+    return fixed + [f"{name}:{type_name}" for name, type_name in columns]
+
+
+# Streams the graph into <out_dir>/vertices.csv and <out_dir>/edges.csv.
+# Returns the two paths and the number of vertices and edges written.
+def write_gremlin_csv(generator: AirRoutesGenerator, out_dir: str,
+                      progress_every: Optional[int] = None) -> Tuple[str, str, int, int]:
+    os.makedirs(out_dir, exist_ok=True)
+    vertices_path = os.path.join(out_dir, "vertices.csv")
+    edges_path = os.path.join(out_dir, "edges.csv")
+    vertex_keys = [name for name, _ in VERTEX_COLUMNS]
+    edge_keys = [name for name, _ in EDGE_COLUMNS]
+    start = time.monotonic()
+
+    def report(n: int, what: str):
+        if progress_every and n % progress_every == 0:
+            print(f"  {n:,} {what} ({n / (time.monotonic() - start):,.0f}/s)")
+
+    vertices = 0
+    with open(vertices_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(_header(VERTEX_COLUMNS, ["~id", "~label"]))
+        for _, ext_id, label, props in generator.vertices():
+            writer.writerow([ext_id, label] + [props.get(k, "") for k in vertex_keys])
+            vertices += 1
+            report(vertices, "vertices")
+    edges = 0
+    with open(edges_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(_header(EDGE_COLUMNS, ["~id", "~from", "~to", "~label"]))
+        for _, ext_id, label, props, out_id, in_id in generator.edges():
+            writer.writerow([ext_id, out_id, in_id, label] + [props.get(k, "") for k in edge_keys])
+            edges += 1
+            report(edges, "edges")
+    return vertices_path, edges_path, vertices, edges
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic air-routes graph generator")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--airports", type=int, help="number of airports")
+    size.add_argument("--elements", type=int, help="approximate number of vertices + edges")
+    parser.add_argument("--routes", type=float, default=8.0, help="mean routes per airport")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of the hub skew")
+    parser.add_argument("--locality", type=float, default=0.7, help="share of routes within a metro cluster")
+    parser.add_argument("--max-routes", type=int, default=400, help="routes of the biggest hub")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True, help="output directory")
+    args = parser.parse_args()
+
+    options = dict(seed=args.seed, skew=args.skew, locality=args.locality, max_routes=args.max_routes)
+    if args.elements:
+        generator = AirRoutesGenerator.for_elements(args.elements, args.routes, **options)
+    else:
+        generator = AirRoutesGenerator(args.airports or 3500, args.routes, **options)
+
+    start = time.monotonic()
+    vertices_path, edges_path, vertices, edges = write_gremlin_csv(generator, args.out, progress_every=1000000)
+    elapsed = time.monotonic() - start
+    print(f"Wrote {vertices:,} vertices to {vertices_path} and {edges:,} edges to {edges_path} "
+          f"in {elapsed:.1f}s ({(vertices + edges) / elapsed:,.0f} elements/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from gremlin_python.process.graph_traversal import GraphTraversalSource, __
+from gremlin_python.process.traversal import T
+
+from connection_pool import ConnectionPool
+from janusgraph_manager import create_connection, SERIALIZERS, DEFAULT_SERIALIZER
+
+# Bulk loader for the air-routes dataset (airports, countries, continents and
+# the route / contains edges between them).
+#
+# Input is streamed, never loaded whole:
+#  - GraphML as written by TinkerPop / Kelvin Lawrence's air-routes repository
+#    (vertex label in the 'labelV' data key, edge label in 'labelE'), or
+#  - Gremlin CSV: a vertex file with ~id,~label,name:type... columns and an
+#    edge file with ~id,~from,~to,~label,name:type... columns.
+#
+# Rows are grouped into batches and every batch becomes ONE traversal with many
+# chained addV / addE steps, which the Gremlin Server runs and commits as one
+# transaction. Batches run in parallel on a pool of connections. The graph ids
+# JanusGraph assigns to new vertices are mapped from the external ids of the
+# input in memory, which is how edges find their endpoints. Vertices are all
+# loaded before the first edge batch is sent.
+#
+# With --checkpoint the progress (finished batches and the id map) is saved to
+# a file as each batch commits, and a later run with the same input and batch
+# size skips the batches that already finished. Batches that were in flight
+# when the loader stopped are not in the checkpoint and are sent again.
+#
+# When a vertex batch fails the edges are not loaded at all: their endpoints
+# would be missing from the id map, and the edge batches would be recorded as
+# done without them. The loader exits non-zero; a rerun with the checkpoint
+# retries the failed vertex batches and then loads the edges.
+
+VERTEX = "vertex"
+EDGE = "edge"
+
+GRAPHML_NS = "{http://graphml.graphdrawing.org/xmlns}"
+
+
+def _convert(value: str, type_name: str) -> Any:
+    type_name = (type_name or "string").lower()
+    if type_name in ("int", "long", "short", "byte"):
+        return int(value)
+    if type_name in ("double", "float"):
+        return float(value)
+    if type_name in ("boolean", "bool"):
+        return value.strip().lower() == "true"
+    return value
+
+
+# Streams ('vertex', ext_id, label, props) and ('edge', ext_id, label, props,
+# from_ext_id, to_ext_id) records out of a GraphML file. iterparse hands over
+# one element at a time and every node/edge is cleared once read, so memory
+# does not grow with the file.
+def iter_graphml(path: str) -> Iterator[Tuple]:
+    keys: Dict[str, Tuple[str, str]] = {}
+    graph = None
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        tag = elem.tag.replace(GRAPHML_NS, "")
+        if event == "start":
+            if tag == "graph":
+                graph = elem
+            continue
+        if tag == "key":
+            keys[elem.get("id")] = (elem.get("attr.name") or elem.get("id"), elem.get("attr.type", "string"))
+        elif tag in ("node", "edge"):
+            label = None
+            props: Dict[str, Any] = {}
+            for data in elem.findall(f"{GRAPHML_NS}data"):
+                name, type_name = keys.get(data.get("key"), (data.get("key"), "string"))
+                if name in ("labelV", "labelE"):
+                    label = data.text
+                elif data.text is not None:
+                    props[name] = _convert(data.text, type_name)
+            if tag == "node":
+                yield (VERTEX, elem.get("id"), label or "vertex", props)
+            else:
+                yield (EDGE, elem.get("id"), label or "edge", props, elem.get("source"), elem.get("target"))
+            # Drop the processed element from the tree as well, otherwise the
+            # <graph> element would keep every (empty) node alive.
+            elem.clear()
+            if graph is not None:
+                graph.clear()
+
+
+def _csv_columns(header: List[str]) -> List[Tuple[str, str]]:
+    columns = []
+    for column in header:
+        name, _, type_name = column.partition(":")
+        columns.append((name, type_name or "string"))
+    return columns
+
+
+# Streams vertex records out of a Gremlin CSV vertex file.
+def iter_csv_vertices(path: str) -> Iterator[Tuple]:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        columns = _csv_columns(next(reader))
+        for row in reader:
+            ext_id, label, props = None, "vertex", {}
+            for (name, type_name), value in zip(columns, row):
+                if name == "~id":
+                    ext_id = value
+                elif name == "~label":
+                    label = value or label
+                elif value != "":
+                    props[name] = _convert(value, type_name)
+            yield (VERTEX, ext_id, label, props)
+
+
+# Streams edge records out of a Gremlin CSV edge file.
+def iter_csv_edges(path: str) -> Iterator[Tuple]:
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        columns = _csv_columns(next(reader))
+        for row in reader:
+            ext_id, label, props, out_id, in_id = None, "edge", {}, None, None
+            for (name, type_name), value in zip(columns, row):
+                if name == "~id":
+                    ext_id = value
+                elif name == "~label":
+                    label = value or label
+                elif name == "~from":
+                    out_id = value
+                elif name == "~to":
+                    in_id = value
+                elif value != "":
+                    props[name] = _convert(value, type_name)
+            yield (EDGE, ext_id, label, props, out_id, in_id)
+
+
+# Builds one traversal adding every vertex of the batch:
+#   g.addV('airport').property('code','AUS')...as_('v0')
+#    .addV('airport').property('code','DFW')...as_('v1')
+#    .select('v0', 'v1').by(T.id)
+# and returns the map alias -> new graph id, i.e. the graph id of every row.
+def add_vertices(g: GraphTraversalSource, rows: List[Tuple]) -> List[Any]:
+    t = g
+    aliases = []
+    for i, (_, _, label, props) in enumerate(rows):
+        t = t.addV(label)
+        for key, value in props.items():
+            t = t.property(key, value)
+        alias = f"v{i}"
+        t = t.as_(alias)
+        aliases.append(alias)
+    if len(aliases) == 1:
+        return [t.id_().next()]
+    ids = t.select(*aliases).by(T.id).next()
+    return [ids[alias] for alias in aliases]
+
+
+# Builds one traversal adding every edge of the batch:
+#   g.V(out1).addE('route').to(__.V(in1)).property('dist', 809)
+#    .V(out2).addE('route').to(__.V(in2)).property('dist', 1357) ...
+# A mid-traversal V(id) jumps to the next out-vertex, so the whole batch is
+# still a single request and a single transaction.
+def add_edges(g: GraphTraversalSource, edges: List[Tuple[Any, Any, str, Dict[str, Any]]]):
+    t = g
+    for out_id, in_id, label, props in edges:
+        t = t.V(out_id).addE(label).to(__.V(in_id))
+        for key, value in props.items():
+            t = t.property(key, value)
+    t.iterate()
+
+
+# Saves and restores loader progress. Batches are numbered per phase in input
+# order. The file is a journal of JSON lines: a header with the batch size,
+# then one line per finished batch with the id map entries it produced,
+# appended and fsynced as soon as the batch has committed. addV() is not
+# idempotent, so this keeps what a crash can load twice down to the batches
+# that committed but whose line was not written yet. save() compacts the
+# journal into a single line (temp file + os.replace). A torn last line, left
+# by a crash in the middle of a write, is ignored on load.
+class Checkpoint:
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done: Dict[str, set] = {VERTEX: set(), EDGE: set()}
+        self.id_map: Dict[str, Any] = {}
+        self._journal = None
+        self._lock = threading.Lock()
+
+    def load(self, batch_size: int):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        header = json.loads(lines[0]) if lines else {}
+        if header.get("batch_size") != batch_size:
+            raise ValueError(f"Checkpoint was written with batch size {header.get('batch_size')}, not {batch_size}.")
+        for n, line in enumerate(lines[1:], start=2):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                if n == len(lines):
+                    break
+                raise ValueError(f"Checkpoint {self.path} is corrupt at line {n}.")
+            for phase, batches in entry["done"].items():
+                self.done[phase].update(batches)
+            self.id_map.update(entry["ids"])
+
+    def is_done(self, phase: str, batch_no: int) -> bool:
+        return batch_no in self.done[phase]
+
+    # Records a committed batch and the graph ids of the vertices it added.
+    def mark_done(self, phase: str, batch_no: int, batch_size: int, ids: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self.done[phase].add(batch_no)
+            if ids:
+                self.id_map.update(ids)
+            if self.path:
+                self._append({"done": {phase: [batch_no]}, "ids": ids or {}}, batch_size)
+
+    def _append(self, entry: Dict[str, Any], batch_size: int):
+        if self._journal is None:
+            # Start from a compacted file, so the journal only ever grows by
+            # the batches of this run.
+            self._save(batch_size)
+            self._journal = open(self.path, "a", encoding="utf-8")
+        self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def save(self, batch_size: int):
+        with self._lock:
+            if self.path:
+                self._save(batch_size)
+
+    def _save(self, batch_size: int):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        entry = {"done": {phase: sorted(batches) for phase, batches in self.done.items()}, "ids": self.id_map}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"batch_size": batch_size}) + "\n")
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+# Counts loaded rows per phase and prints throughput.
+class Progress:
+    def __init__(self, every: float = 2.0):
+        self.every = every
+        self.start = time.perf_counter()
+        self.rows = {VERTEX: 0, EDGE: 0}
+        self.skipped_edges = 0
+        self.failed_batches = 0
+        self._last_report = self.start
+        self._lock = threading.Lock()
+
+    def skip_edge(self):
+        with self._lock:
+            self.skipped_edges += 1
+
+    def fail_batch(self):
+        with self._lock:
+            self.failed_batches += 1
+
+    def add(self, phase: str, n: int):
+        with self._lock:
+            self.rows[phase] += n
+            now = time.perf_counter()
+            if now - self._last_report >= self.every:
+                self._last_report = now
+                self.report()
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return sum(self.rows.values()) / elapsed if elapsed else 0.0
+
+    def report(self, final: bool = False):
+        elapsed = time.perf_counter() - self.start
+        prefix = "Done" if final else "Progress"
+        print(f"{prefix}: {self.rows[VERTEX]} vertices, {self.rows[EDGE]} edges in {elapsed:.1f}s "
+              f"({self.rate():,.0f} rows/sec), {self.skipped_edges} edges skipped, "
+              f"{self.failed_batches} batches failed")
+
+
+# The AirRoutesLoader Class
+# Groups the incoming records into batches and runs them on a thread pool, one
+# pooled connection per worker. At most 2 * workers batches are queued at any
+# time, so a huge input file is read only as fast as it can be written.
+class AirRoutesLoader:
+    def __init__(self, pool: ConnectionPool, workers: int = 4, batch_size: int = 200,
+                 checkpoint: Optional[Checkpoint] = None, progress: Optional[Progress] = None):
+        self.pool = pool
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.progress = progress or Progress()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.Semaphore(workers * 2)
+        self._pending: List[Future] = []
+
+    @property
+    def id_map(self) -> Dict[str, Any]:
+        return self.checkpoint.id_map
+
+    def load(self, records: Iterable[Tuple]):
+        phase = VERTEX
+        batch: List[Tuple] = []
+        batch_no = {VERTEX: 0, EDGE: 0}
+        try:
+            for record in records:
+                if record[0] != phase:
+                    # Edges need the graph ids of their endpoints, so every
+                    # vertex batch must have finished before edges start.
+                    self._flush(phase, batch, batch_no)
+                    batch = []
+                    self._wait_all()
+                    if phase == VERTEX and self.progress.failed_batches:
+                        raise RuntimeError(f"{self.progress.failed_batches} vertex batches failed, edges not loaded; "
+                                           f"rerun with the checkpoint to retry them")
+                    phase = record[0]
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self._flush(phase, batch, batch_no)
+                    batch = []
+            self._flush(phase, batch, batch_no)
+            self._wait_all()
+        finally:
+            self._executor.shutdown(wait=True)
+            self.checkpoint.save(self.batch_size)
+        self.progress.report(final=True)
+
+    def _flush(self, phase: str, batch: List[Tuple], batch_no: Dict[str, int]):
+        if not batch:
+            return
+        number = batch_no[phase]
+        batch_no[phase] += 1
+        if self.checkpoint.is_done(phase, number):
+            return
+        self._slots.acquire()
+        run = self._load_vertices if phase == VERTEX else self._load_edges
+        future = self._executor.submit(self._run_batch, run, phase, number, batch)
+        self._pending.append(future)
+
+    def _run_batch(self, run: Callable, phase: str, number: int, batch: List[Tuple]):
+        try:
+            with self.pool.lease() as g:
+                loaded, ids = run(g, batch)
+            self.checkpoint.mark_done(phase, number, self.batch_size, ids)
+            self.progress.add(phase, loaded)
+        except Exception as e:
+            self.progress.fail_batch()
+            print(f"ERROR: {phase} batch {number} failed: {e}")
+        finally:
+            self._slots.release()
+
+    # Both return the rows loaded and the id map entries of new vertices.
+    def _load_vertices(self, g: GraphTraversalSource, batch: List[Tuple]) -> Tuple[int, Dict[str, Any]]:
+        ids = add_vertices(g, batch)
+        return len(batch), {str(record[1]): graph_id for record, graph_id in zip(batch, ids)}
+
+    def _load_edges(self, g: GraphTraversalSource, batch: List[Tuple]) -> Tuple[int, Dict[str, Any]]:
+        edges = []
+        for _, _, label, props, out_ext, in_ext in batch:
+            out_id = self.id_map.get(str(out_ext))
+            in_id = self.id_map.get(str(in_ext))
+            if out_id is None or in_id is None:
+                self.progress.skip_edge()
+                continue
+            edges.append((out_id, in_id, label, props))
+        if edges:
+            add_edges(g, edges)
+        return len(edges), {}
+
+    def _wait_all(self):
+        for future in self._pending:
+            future.result()
+        self._pending = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel bulk loader for the air-routes graph")
+    parser.add_argument("--url", default="ws://localhost:8182/gremlin")
+    parser.add_argument("--graphml", help="GraphML file with vertices and edges")
+    parser.add_argument("--vertices", help="Gremlin CSV vertex file")
+    parser.add_argument("--edges", help="Gremlin CSV edge file")
+    parser.add_argument("--workers", type=int, default=4, help="parallel batches / pooled connections")
+    parser.add_argument("--batch-size", type=int, default=200, help="elements per traversal")
+    parser.add_argument("--checkpoint", help="JSON file to save progress to and resume from")
+    parser.add_argument("--serializer", default=DEFAULT_SERIALIZER, choices=list(SERIALIZERS))
+    args = parser.parse_args()
+
+    if not args.graphml and not args.vertices:
+        parser.error("either --graphml or --vertices (and optionally --edges) is required")
+
+    def records() -> Iterator[Tuple]:
+        if args.graphml:
+            yield from iter_graphml(args.graphml)
+        else:
+            yield from iter_csv_vertices(args.vertices)
+            if args.edges:
+                yield from iter_csv_edges(args.edges)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    checkpoint.load(args.batch_size)
+    if checkpoint.id_map:
+        print(f"Resuming from {args.checkpoint}: {len(checkpoint.id_map)} vertices already loaded")
+
+    pool = ConnectionPool(lambda: create_connection(args.url, args.serializer), min_size=1, max_size=args.workers)
+    try:
+        pool.fill()
+        loader = AirRoutesLoader(pool, workers=args.workers, batch_size=args.batch_size, checkpoint=checkpoint)
+        loader.load(records())
+    except Exception as e:
+        print(f"Load failed: {e}")
+        sys.exit(1)
+    finally:
+        pool.close()
+    if loader.progress.failed_batches:
+        print(f"Load incomplete: {loader.progress.failed_batches} batches failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
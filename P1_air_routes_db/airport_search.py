@@ -0,0 +1,399 @@
+import asyncio
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from gremlin_python.process.graph_traversal import GraphTraversalSource, __
+from gremlin_python.process.traversal import T
+
+from graph_snapshot import GraphSnapshot
+from janusgraph_crud import GraphCRUDOperations, iter_result_batches
+
+# Autocomplete over airport codes, cities and names, for GET /airports/search.
+#
+# Every airport is indexed under a few keys, all case and accent folded:
+# its IATA and ICAO codes and each word of its city and name ('desc'). The
+# keys live in one sorted list of (key, field, row) entries, so all keys
+# starting with a prefix are one binary search and a slice, and a word ->
+# rows inverted index answers the complete words of a multi-word query
+# ("new yo" = rows with the word 'new' and a word starting with 'yo').
+# Matches are ranked by the best field they matched on (exact code, code
+# prefix, city, name) and then by route degree, so the hubs come first.
+#
+# Short prefixes ('a', 'ne') match a large slice of the keys, so the ranked
+# matches of single-word queries are cached per word, up to TOP_CACHED of
+# them, and warm() fills the cache for every one- and two-letter prefix
+# ahead of time. Longer words match few keys and are cheap to rank.
+#
+# The index is updated in place: upsert() and remove() only touch the keys
+# of one airport (and drop the cached prefixes of those keys), and sync()
+# diffs a full list of airports against the index and applies just the
+# changes, which is how AirportSearchService takes in each rebuild after the
+# first one.
+
+SEARCH_FIELDS = ["code", "icao", "city", "desc", "country"]
+
+# Match quality per field, best first.
+EXACT_CODE, CODE, CITY, NAME = 0, 1, 2, 3
+MATCHED = ("code", "code", "city", "name")
+
+# Ranked matches kept per cached prefix, which is also the largest ?limit=.
+TOP_CACHED = 100
+WARM_PREFIX_LENGTH = 2
+MAX_CACHED_PREFIXES = 50000
+
+_WORD = re.compile(r"[0-9a-z]+")
+
+
+def fold(text: Any) -> str:
+    text = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def words(text: Any) -> List[str]:
+    return _WORD.findall(fold(text)) if text else []
+
+
+def _entry(vertex: Dict[str, Any], degree: int) -> Dict[str, Any]:
+    entry = {"id": vertex["id"]}
+    for key in SEARCH_FIELDS:
+        value = vertex.get(key)
+        entry[key] = value[0] if isinstance(value, list) and value else value
+    entry["degree"] = degree
+    return entry
+
+
+# The (key, field) pairs an airport is indexed under.
+def _keys(entry: Dict[str, Any]) -> Set[Tuple[str, int]]:
+    keys = set()
+    for field in ("code", "icao"):
+        if entry.get(field):
+            keys.add((fold(entry[field]), CODE))
+    for word in words(entry.get("city")):
+        keys.add((word, CITY))
+    for word in words(entry.get("desc")):
+        keys.add((word, NAME))
+    return keys
+
+
+# The AirportSearchIndex Class
+# Rows are reused slots in self.entries (None once removed); ids maps vertex
+# ids to rows. Writers hold the lock, readers too, as every read is short.
+class AirportSearchIndex:
+    def __init__(self):
+        self.entries: List[Optional[Dict[str, Any]]] = []
+        self.ids: Dict[Any, int] = {}
+        self._keys: List[Tuple[str, int, int]] = []
+        self._words: Dict[str, Set[int]] = {}
+        self._free: List[int] = []
+        self._ranked: Dict[str, List[Tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+        self.updated_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # Drops the cached prefixes of the keys of an airport being changed.
+    def _invalidate(self, entry: Dict[str, Any]):
+        if not self._ranked:
+            return
+        for key, _ in _keys(entry):
+            for end in range(1, len(key) + 1):
+                self._ranked.pop(key[:end], None)
+
+    def _unindex(self, row: int):
+        self._invalidate(self.entries[row])
+        for key, field in _keys(self.entries[row]):
+            slot = bisect_left(self._keys, (key, field, row))
+            if slot < len(self._keys) and self._keys[slot] == (key, field, row):
+                del self._keys[slot]
+            if field != CODE:
+                rows = self._words.get(key)
+                if rows is not None:
+                    rows.discard(row)
+                    if not rows:
+                        del self._words[key]
+        self.entries[row] = None
+
+    def _index(self, row: int, entry: Dict[str, Any]):
+        self._invalidate(entry)
+        self.entries[row] = entry
+        for key, field in _keys(entry):
+            insort(self._keys, (key, field, row))
+            if field != CODE:
+                self._words.setdefault(key, set()).add(row)
+
+    def _upsert(self, entry: Dict[str, Any]) -> bool:
+        row = self.ids.get(entry["id"])
+        if row is not None:
+            if self.entries[row] == entry:
+                return False
+            self._unindex(row)
+        elif self._free:
+            row = self.ids[entry["id"]] = self._free.pop()
+        else:
+            row = self.ids[entry["id"]] = len(self.entries)
+            self.entries.append(None)
+        self._index(row, entry)
+        return True
+
+    def _remove(self, vertex_id: Any) -> bool:
+        row = self.ids.pop(vertex_id, None)
+        if row is None:
+            return False
+        self._unindex(row)
+        self._free.append(row)
+        return True
+
+    # Adds or replaces one airport (a normalized vertex) and its route degree.
+    def upsert(self, vertex: Dict[str, Any], degree: int = 0) -> bool:
+        with self._lock:
+            changed = self._upsert(_entry(vertex, degree))
+            self.updated_at = time.time()
+            return changed
+
+    # Applies a write to one airport: the fields of vertex (scalars or lists)
+    # replace those indexed, the others and the route degree are kept. An
+    # unknown id is added with degree 0.
+    def update(self, vertex: Dict[str, Any]) -> bool:
+        with self._lock:
+            row = self.ids.get(vertex["id"])
+            current = self.entries[row] if row is not None else {"degree": 0}
+            merged = {**{key: current.get(key) for key in SEARCH_FIELDS}, **vertex}
+            changed = self._upsert(_entry(merged, current["degree"]))
+            self.updated_at = time.time()
+            return changed
+
+    def remove(self, vertex_id: Any) -> bool:
+        with self._lock:
+            removed = self._remove(vertex_id)
+            self.updated_at = time.time()
+            return removed
+
+    # Rebuilds everything from scratch in one sort, for the first load and
+    # for syncs that change a large part of the airports.
+    def _rebuild(self, entries: List[Dict[str, Any]]):
+        self.entries = list(entries)
+        self.ids = {entry["id"]: row for row, entry in enumerate(self.entries)}
+        self._free = []
+        self._ranked = {}
+        keys, index = [], {}
+        for row, entry in enumerate(self.entries):
+            for key, field in _keys(entry):
+                keys.append((key, field, row))
+                if field != CODE:
+                    index.setdefault(key, set()).add(row)
+        keys.sort()
+        self._keys, self._words = keys, index
+
+    # Makes the index hold exactly these (vertex, degree) pairs, touching
+    # only the airports that were added, changed or removed, unless they are
+    # more than a tenth of the index. Returns the number of each.
+    def sync(self, airports: Iterable[Tuple[Dict[str, Any], int]]) -> Dict[str, int]:
+        entries = {}
+        for vertex, degree in airports:
+            entry = _entry(vertex, degree)
+            entries[entry["id"]] = entry
+        with self._lock:
+            removed = [i for i in self.ids if i not in entries]
+            added = [e for i, e in entries.items() if i not in self.ids]
+            changed = [e for i, e in entries.items() if i in self.ids and self.entries[self.ids[i]] != e]
+            counts = {"added": len(added), "changed": len(changed), "removed": len(removed)}
+            if len(added) + len(changed) + len(removed) > len(self.ids) // 10:
+                self._rebuild(list(entries.values()))
+            else:
+                for vertex_id in removed:
+                    self._remove(vertex_id)
+                for entry in added + changed:
+                    self._upsert(entry)
+            self.updated_at = time.time()
+        return counts
+
+    # Rows with a key starting with prefix, with the best field matched.
+    def _prefix_rows(self, prefix: str) -> Dict[int, int]:
+        rows: Dict[int, int] = {}
+        keys = self._keys
+        slot = bisect_left(keys, (prefix,))
+        while slot < len(keys) and keys[slot][0].startswith(prefix):
+            key, field, row = keys[slot]
+            if field == CODE and key == prefix:
+                field = EXACT_CODE
+            if field < rows.get(row, NAME + 1):
+                rows[row] = field
+            slot += 1
+        return rows
+
+    def _rank(self, matches: Dict[int, int], limit: int) -> List[Tuple[int, int]]:
+        entries = self.entries
+        return heapq.nsmallest(limit, matches.items(),
+                               key=lambda m: (m[1], -entries[m[0]]["degree"], str(entries[m[0]]["code"])))
+
+    # The best TOP_CACHED (row, field) matches of one word, cached.
+    def _ranked_prefix(self, prefix: str) -> List[Tuple[int, int]]:
+        ranked = self._ranked.get(prefix)
+        if ranked is None:
+            ranked = self._rank(self._prefix_rows(prefix), TOP_CACHED)
+            if len(self._ranked) >= MAX_CACHED_PREFIXES:
+                self._ranked.clear()
+            self._ranked[prefix] = ranked
+        return ranked
+
+    # The best limit airports for q, each with the field it matched on.
+    def search(self, q: str, limit: int = 10) -> List[Dict[str, Any]]:
+        terms = words(q)
+        if not terms:
+            return []
+        with self._lock:
+            if len(terms) == 1 and limit <= TOP_CACHED:
+                ranked = self._ranked_prefix(terms[0])[:limit]
+            else:
+                matches = self._prefix_rows(terms[-1])
+                for word in terms[:-1]:
+                    rows = self._words.get(word, ())
+                    matches = {row: field for row, field in matches.items() if row in rows}
+                    if not matches:
+                        return []
+                ranked = self._rank(matches, limit)
+            return [{**self.entries[row], "matched": MATCHED[field]} for row, field in ranked]
+
+    # Ranks every prefix of up to WARM_PREFIX_LENGTH letters ahead of time, one
+    # prefix per lock hold so searches are not held up.
+    def warm(self) -> int:
+        with self._lock:
+            prefixes = {key[:end] for key, _, _ in self._keys
+                        for end in range(1, min(len(key), WARM_PREFIX_LENGTH) + 1)}
+        for prefix in sorted(prefixes):
+            with self._lock:
+                self._ranked_prefix(prefix)
+        return len(prefixes)
+
+
+# (normalized vertex, route degree) of every label vertex, read through
+# GraphCRUDOperations with the route degrees counted in a second streamed pass.
+def load_from_graph(g: GraphTraversalSource, label: str = "airport", edge_label: str = "route",
+                    batch_size: int = 2000) -> List[Tuple[Dict[str, Any], int]]:
+    crud = GraphCRUDOperations(g)
+    vertices = [v for batch in crud.iter_vertex_batches(label, batch_size, SEARCH_FIELDS) for v in batch]
+    query = g.V().hasLabel(label).project("id", "degree").by(T.id).by(__.bothE(edge_label).count())
+    try:
+        degrees = {row["id"]: row["degree"] for batch in iter_result_batches(g, query, batch_size, "search_degrees") for row in batch}
+    except Exception as e:
+        raise RuntimeError(f"Failed to count route degrees: {e}")
+    return [(vertex, degrees.get(vertex["id"], 0)) for vertex in vertices]
+
+
+# Same as load_from_graph, from the in-memory snapshot. Degrees are 0 when
+# the snapshot does not hold the route edges.
+def load_from_snapshot(snapshot: GraphSnapshot, label: str = "airport", edge_label: Optional[str] = "route"
+                       ) -> List[Tuple[Dict[str, Any], int]]:
+    airports = []
+    for row in snapshot.label_rows(label):
+        degree = sum(1 for _ in snapshot.adjacent(row, "both", edge_label)) if edge_label else 0
+        airports.append((snapshot.vertex_at(row, SEARCH_FIELDS), degree))
+    return airports
+
+
+# The AirportSearchService Class
+# Owns the AirportSearchIndex and resyncs it every refresh_interval seconds
+# in the background and on every snapshot refresh, like GraphStatsService.
+# The index object stays the same, so single-airport upsert()/remove() from
+# write paths apply at once.
+class AirportSearchService:
+    def __init__(self, manager, snapshots=None, refresh_interval: float = 600.0, label: str = "airport",
+                 edge_label: str = "route"):
+        self.manager = manager
+        self.snapshots = snapshots
+        self.refresh_interval = refresh_interval
+        self.label = label
+        self.edge_label = edge_label
+        self.index = AirportSearchIndex()
+        self.ready = False
+        self._refresh_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.last_sync: Optional[Dict[str, int]] = None
+        self.last_source: Optional[str] = None
+        if snapshots is not None and snapshots.covers_label(label):
+            snapshots.add_listener(self._on_snapshot)
+
+    def _snapshot(self) -> Optional[GraphSnapshot]:
+        if self.snapshots is None or not self.snapshots.covers_label(self.label):
+            return None
+        return self.snapshots.current()
+
+    # Runs on the thread that refreshed the snapshot.
+    def _on_snapshot(self, snapshot: GraphSnapshot):
+        try:
+            self.refresh()
+        except RuntimeError as e:
+            print(e)
+
+    # Blocking: reloads the airports and syncs the index with them.
+    def refresh(self) -> Dict[str, int]:
+        with self._refresh_lock:
+            try:
+                snapshot = self._snapshot()
+                if snapshot is not None:
+                    edge_label = self.edge_label if self.snapshots.covers_edge_label(self.edge_label) else None
+                    airports = load_from_snapshot(snapshot, self.label, edge_label)
+                    source = "snapshot"
+                else:
+                    with self.manager.lease() as g:
+                        airports = load_from_graph(g, self.label, self.edge_label)
+                    source = "graph"
+                counts = self.index.sync(airports)
+                self.index.warm()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise RuntimeError(f"Failed to refresh the airport search index: {e}")
+            self.ready = True
+            self.refreshes += 1
+            self.last_error = None
+            self.last_sync = counts
+            self.last_source = source
+            return counts
+
+    async def refresh_async(self) -> Dict[str, int]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.refresh)
+
+    async def start(self):
+        self._task = asyncio.ensure_future(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh_async()
+            except RuntimeError as e:
+                print(e)
+            if self.refresh_interval <= 0:
+                return
+            await asyncio.sleep(self.refresh_interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "airports": len(self.index),
+            "updated_at": self.index.updated_at,
+            "source": self.last_source,
+            "refresh_interval": self.refresh_interval,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_sync": self.last_sync,
+        }
@@ -0,0 +1,326 @@
+import random
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from gremlin_python.process.graph_traversal import GraphTraversalSource, __
+from gremlin_python.process.traversal import Cardinality
+
+from graph_snapshot import GraphSnapshot, build_csr
+from janusgraph_crud import iter_result_batches, wire_serializer
+from metrics import observe_traversal
+
+# NumPy is optional: with it the PageRank and connected components kernels
+# run vectorized (pip install numpy), without it the same algorithms run as
+# plain Python loops over the same arrays, just slower.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Whole-graph analytics over the route network, computed in-process.
+#
+# OLAP traversals through the Gremlin Server (pageRank(), connectedComponent()
+# with a GraphComputer) are far too slow for this graph size, so the route
+# edges are exported once into a RouteMatrix (edge lists plus CSR adjacency,
+# vertices renumbered 0..n-1) and the algorithms run on that:
+#  - PageRank by power iteration, with dangling vertices spreading their rank
+#    evenly;
+#  - approximate betweenness centrality: Brandes' algorithm from a random
+#    sample of source vertices, scaled up by n / samples;
+#  - weakly connected components.
+# AnalyticsJob runs the stages, times every one of them (export, each
+# algorithm, write-back) and can write the scores back as vertex properties
+# in batches.
+
+
+# The RouteMatrix Class
+# The exported edges: edge e goes from row sources[e] to row targets[e], ids
+# maps rows back to vertex ids. out_offsets / out_targets is the CSR form.
+class RouteMatrix:
+    def __init__(self, ids: List[Any], sources: array, targets: array):
+        self.ids = ids
+        self.sources = sources
+        self.targets = targets
+        self.out_offsets, self.out_targets, _ = build_csr(len(ids), sources, targets)
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.sources)
+
+
+# Builds a RouteMatrix from vertex ids and (out id, in id) pairs. Edges with an
+# endpoint outside ids are left out.
+def build_route_matrix(ids: List[Any], edges) -> RouteMatrix:
+    rows = {vertex_id: row for row, vertex_id in enumerate(ids)}
+    sources, targets = array("l"), array("l")
+    for out_id, in_id in edges:
+        out_row, in_row = rows.get(out_id), rows.get(in_id)
+        if out_row is not None and in_row is not None:
+            sources.append(out_row)
+            targets.append(in_row)
+    return RouteMatrix(list(ids), sources, targets)
+
+
+# Exports the vertex_label vertices and the edge_label edges between them from
+# the server, both streamed in batches.
+def export_from_graph(g: GraphTraversalSource, vertex_label: str = "airport", edge_label: str = "route",
+                      batch_size: int = 5000) -> RouteMatrix:
+    ids_query = g.V().hasLabel(vertex_label).id_()
+    ids = [i for batch in iter_result_batches(g, ids_query, batch_size, "analytics_ids") for i in batch]
+    query = g.E().hasLabel(edge_label).project("out", "in").by(__.outV().id_()).by(__.inV().id_())
+    edges = ((e["out"], e["in"])
+             for batch in iter_result_batches(g, query, batch_size, "analytics_edges") for e in batch)
+    return build_route_matrix(ids, edges)
+
+
+# Same as export_from_graph, from the in-memory snapshot.
+def export_from_snapshot(snapshot: GraphSnapshot, vertex_label: str = "airport",
+                         edge_label: str = "route") -> RouteMatrix:
+    rows = list(snapshot.label_rows(vertex_label))
+    ids = [snapshot.ids[row] for row in rows]
+    edges = ((snapshot.ids[row], snapshot.ids[target])
+             for row in rows for target, _ in snapshot.adjacent(row, "out", edge_label))
+    return build_route_matrix(ids, edges)
+
+
+def pagerank(matrix: RouteMatrix, damping: float = 0.85, tolerance: float = 1e-8,
+             max_iterations: int = 100) -> List[float]:
+    n = matrix.vertex_count
+    if n == 0:
+        return []
+    if np is not None:
+        sources = np.asarray(matrix.sources, dtype=np.int64)
+        targets = np.asarray(matrix.targets, dtype=np.int64)
+        out_degree = np.bincount(sources, minlength=n).astype(float)
+        dangling = out_degree == 0
+        inverse = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+        rank = np.full(n, 1.0 / n)
+        for _ in range(max_iterations):
+            spread = np.bincount(targets, weights=(rank * inverse)[sources], minlength=n)
+            updated = (1 - damping) / n + damping * (spread + rank[dangling].sum() / n)
+            delta = np.abs(updated - rank).sum()
+            rank = updated
+            if delta < tolerance:
+                break
+        return rank.tolist()
+
+    out_degree = [0] * n
+    for s in matrix.sources:
+        out_degree[s] += 1
+    dangling = [row for row in range(n) if out_degree[row] == 0]
+    rank = [1.0 / n] * n
+    for _ in range(max_iterations):
+        share = [r / d if d else 0.0 for r, d in zip(rank, out_degree)]
+        spread = [0.0] * n
+        for s, t in zip(matrix.sources, matrix.targets):
+            spread[t] += share[s]
+        base = (1 - damping) / n + damping * sum(rank[row] for row in dangling) / n
+        updated = [base + damping * x for x in spread]
+        delta = sum(abs(a - b) for a, b in zip(updated, rank))
+        rank = updated
+        if delta < tolerance:
+            break
+    return rank
+
+
+# Weakly connected components. Returns the component of every row, numbered
+# from 0 by decreasing size.
+def connected_components(matrix: RouteMatrix) -> List[int]:
+    n = matrix.vertex_count
+    if np is not None:
+        # Min-label propagation over both edge directions with pointer
+        # jumping: every round each vertex takes the smallest label around it.
+        sources = np.asarray(matrix.sources, dtype=np.int64)
+        targets = np.asarray(matrix.targets, dtype=np.int64)
+        labels = np.arange(n)
+        while True:
+            updated = labels.copy()
+            np.minimum.at(updated, targets, labels[sources])
+            np.minimum.at(updated, sources, labels[targets])
+            updated = updated[updated]
+            if np.array_equal(updated, labels):
+                break
+            labels = updated
+        roots = labels.tolist()
+    else:
+        parent = list(range(n))
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        for s, t in zip(matrix.sources, matrix.targets):
+            a, b = find(s), find(t)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+        roots = [find(x) for x in range(n)]
+
+    sizes: Dict[int, int] = {}
+    for root in roots:
+        sizes[root] = sizes.get(root, 0) + 1
+    numbering = {root: i for i, root in enumerate(sorted(sizes, key=lambda r: (-sizes[r], r)))}
+    return [numbering[root] for root in roots]
+
+
+# Approximate betweenness centrality (directed, unweighted): Brandes'
+# dependency accumulation from `samples` random sources, scaled by
+# n / samples. With samples >= n it is exact. The breadth-first searches are
+# plain Python loops over the CSR arrays either way.
+def betweenness(matrix: RouteMatrix, samples: int = 64, seed: int = 42) -> List[float]:
+    n = matrix.vertex_count
+    offsets, adjacency = matrix.out_offsets, matrix.out_targets
+    sources = list(range(n)) if samples >= n else random.Random(seed).sample(range(n), samples)
+    centrality = [0.0] * n
+    for s in sources:
+        order = [s]
+        predecessors: List[List[int]] = [[] for _ in range(n)]
+        paths = [0] * n
+        paths[s] = 1
+        distance = [-1] * n
+        distance[s] = 0
+        head = 0
+        while head < len(order):
+            v = order[head]
+            head += 1
+            for slot in range(offsets[v], offsets[v + 1]):
+                w = adjacency[slot]
+                if distance[w] < 0:
+                    distance[w] = distance[v] + 1
+                    order.append(w)
+                if distance[w] == distance[v] + 1:
+                    paths[w] += paths[v]
+                    predecessors[w].append(v)
+        dependency = [0.0] * n
+        for w in reversed(order):
+            for v in predecessors[w]:
+                dependency[v] += paths[v] / paths[w] * (1 + dependency[w])
+            if w != s:
+                centrality[w] += dependency[w]
+    scale = n / len(sources) if sources else 0.0
+    return [c * scale for c in centrality]
+
+
+# Writes the scores back as single-valued vertex properties, batch_size
+# vertices per request: g.V(a).property(...).V(b).property(...)... Returns the
+# number of vertices written.
+def write_back(g: GraphTraversalSource, ids: List[Any], scores: Dict[str, List[Any]],
+               batch_size: int = 200) -> int:
+    written = 0
+    for start in range(0, len(ids), batch_size):
+        traversal = None
+        for row in range(start, min(start + batch_size, len(ids))):
+            traversal = g.V(ids[row]) if traversal is None else traversal.V(ids[row])
+            for key, values in scores.items():
+                traversal = traversal.property(Cardinality.single, key, values[row])
+        with observe_traversal("analytics_write_back") as record:
+            record.leased(wire_serializer(g), waited=False)
+            traversal.iterate()
+            record.received(0)
+        written += min(batch_size, len(ids) - start)
+    return written
+
+
+# The AnalyticsResult Class
+# Scores of one run, by vertex, with the timing report of its stages.
+class AnalyticsResult:
+    def __init__(self, source: str, matrix: RouteMatrix, scores: Dict[str, List[Any]], timings: Dict[str, float]):
+        self.source = source
+        self.computed_at = time.time()
+        self.ids = matrix.ids
+        self.vertex_count = matrix.vertex_count
+        self.edge_count = matrix.edge_count
+        self.scores = scores
+        self.timings = timings
+        self.written = 0
+        self._rows = {str(vertex_id): row for row, vertex_id in enumerate(self.ids)}
+
+    def vertex(self, vertex_id: Any) -> Optional[Dict[str, Any]]:
+        row = self._rows.get(str(vertex_id))
+        if row is None:
+            return None
+        return {"id": self.ids[row], **{key: values[row] for key, values in self.scores.items()}}
+
+    def top(self, metric: str, limit: int = 10) -> List[Dict[str, Any]]:
+        values = self.scores[metric]
+        rows = sorted(range(len(values)), key=lambda row: values[row], reverse=True)[:limit]
+        return [self.vertex(self.ids[row]) for row in rows]
+
+    def report(self) -> Dict[str, Any]:
+        components = self.scores.get("component", [])
+        return {
+            "computed_at": self.computed_at,
+            "source": self.source,
+            "vectorized": np is not None,
+            "vertices": self.vertex_count,
+            "edges": self.edge_count,
+            "components": max(components) + 1 if components else 0,
+            "largest_component": components.count(0) if components else 0,
+            "written": self.written,
+            "timings": {stage: round(seconds, 4) for stage, seconds in self.timings.items()},
+        }
+
+
+# The AnalyticsJob Class
+# Runs export -> PageRank -> betweenness -> components (-> write-back) and
+# keeps the last result for the API. The export reads the snapshot when one
+# is being served and holds the edge label, the server otherwise. Runs are
+# blocking and serialized.
+class AnalyticsJob:
+    METRICS = ("pagerank", "betweenness", "component")
+
+    def __init__(self, manager, snapshots=None, vertex_label: str = "airport", edge_label: str = "route",
+                 betweenness_samples: int = 64, write_batch_size: int = 200):
+        self.manager = manager
+        self.snapshots = snapshots
+        self.vertex_label = vertex_label
+        self.edge_label = edge_label
+        self.betweenness_samples = betweenness_samples
+        self.write_batch_size = write_batch_size
+        self._lock = threading.Lock()
+        self.result: Optional[AnalyticsResult] = None
+
+    def _export(self) -> Tuple[str, RouteMatrix]:
+        snapshot = None
+        if self.snapshots is not None and self.snapshots.covers_edge_label(self.edge_label):
+            snapshot = self.snapshots.current()
+        if snapshot is not None:
+            return "snapshot", export_from_snapshot(snapshot, self.vertex_label, self.edge_label)
+        with self.manager.lease() as g:
+            return "graph", export_from_graph(g, self.vertex_label, self.edge_label)
+
+    def run(self, write: bool = False) -> AnalyticsResult:
+        with self._lock:
+            timings: Dict[str, float] = {}
+            try:
+                start = time.monotonic()
+                source, matrix = self._export()
+                timings["export"] = time.monotonic() - start
+
+                scores: Dict[str, List[Any]] = {}
+                for metric, kernel in (
+                    ("pagerank", lambda: pagerank(matrix)),
+                    ("betweenness", lambda: betweenness(matrix, self.betweenness_samples)),
+                    ("component", lambda: connected_components(matrix)),
+                ):
+                    start = time.monotonic()
+                    scores[metric] = kernel()
+                    timings[metric] = time.monotonic() - start
+
+                result = AnalyticsResult(source, matrix, scores, timings)
+                if write:
+                    start = time.monotonic()
+                    with self.manager.lease() as g:
+                        result.written = write_back(g, matrix.ids, scores, self.write_batch_size)
+                    timings["write_back"] = time.monotonic() - start
+            except Exception as e:
+                raise RuntimeError(f"Analytics run failed: {e}")
+            self.result = result
+            return result
@@ -1,61 +1,1126 @@
+import os
+import hmac
+import json
+import itertools
 import uvicorn
-from fastapi import FastAPI, HTTPException, status, Depends
+from fastapi import FastAPI, HTTPException, status, Depends, Request, Response, Query, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from contextlib import asynccontextmanager
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, AsyncIterator
 
 from janusgraph_manager import janus_graph_manager
-from janusgraph_crud import GraphCRUDOperations
-from gremlin_python.process.graph_traversal import GraphTraversalSource
+from metrics import registry as metrics_registry
+from slow_queries import SlowQueryLog, profile_request
+from connection_pool import ConnectionUnavailableError
+from deadlines import Deadline, DeadlineExceededError, set_deadline, current_deadline
+from single_flight import SingleFlight
+from vertex_cache import TTLCache, VertexReadCache
+from graph_snapshot import SnapshotReplica, GraphSnapshot
+from graph_stats import GraphStatsService, GraphStats
+from analytics import AnalyticsJob
+from geo_index import AirportIndexService, nearby_from_graph
+from airport_search import AirportSearchService
+from route_search import shortest_hops, shortest_weighted, route_distance, best_route
+from janusgraph_crud import VertexNotFoundError, VertexUpsert, EdgeUpsert, WriteRejectedError
+from write_queue import WriteBehindQueue, WriteQueueFullError
+from janusgraph_async_crud import AsyncGraphCRUDOperations
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+# Connection settings, overridable through environment variables so the pool
+# can be sized per deployment without code changes.
+# JANUSGRAPH_URL may list several Gremlin Servers of the same cluster,
+# comma separated; traversals are then load balanced over them (see
+# load_balancer.py).
+JANUSGRAPH_URL = os.getenv("JANUSGRAPH_URL", "ws://localhost:8182/gremlin")
+JANUSGRAPH_URLS = [url.strip() for url in JANUSGRAPH_URL.split(",") if url.strip()]
+POOL_MIN_SIZE = int(os.getenv("JANUSGRAPH_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("JANUSGRAPH_POOL_MAX_SIZE", "8"))
+POOL_IDLE_TIMEOUT = float(os.getenv("JANUSGRAPH_POOL_IDLE_TIMEOUT", "300"))
+POOL_LEASE_TIMEOUT = float(os.getenv("JANUSGRAPH_POOL_LEASE_TIMEOUT", "10"))
+# With several servers: failures in a row that eject one, how often an
+# ejected one is probed and how long a probe may take (seconds), how fast
+# the latency a server is judged on is forgotten (seconds), and hedged reads
+# of single vertices (JANUSGRAPH_HEDGE_DELAY_MS after which a second server
+# is asked, 0 = off, for at most JANUSGRAPH_HEDGE_BUDGET of the reads).
+LB_EJECT_AFTER = int(os.getenv("JANUSGRAPH_EJECT_AFTER", "3"))
+LB_PROBE_INTERVAL = float(os.getenv("JANUSGRAPH_PROBE_INTERVAL", "5"))
+LB_PROBE_TIMEOUT = float(os.getenv("JANUSGRAPH_PROBE_TIMEOUT", "2"))
+LB_DECAY_TIME = float(os.getenv("JANUSGRAPH_LATENCY_DECAY", "10"))
+HEDGE_DELAY_MS = float(os.getenv("JANUSGRAPH_HEDGE_DELAY_MS", "0"))
+HEDGE_BUDGET = float(os.getenv("JANUSGRAPH_HEDGE_BUDGET", "0.1"))
+# Wire format: graphbinary, graphsonv3 or graphsonv2.
+JANUSGRAPH_SERIALIZER = os.getenv("JANUSGRAPH_SERIALIZER", "graphbinary")
+# Vertices per page (one traversal each) when streaming NDJSON.
+STREAM_BATCH_SIZE = int(os.getenv("JANUSGRAPH_STREAM_BATCH_SIZE", "500"))
+
+# Request deadlines (see deadlines.py), in milliseconds: the default of the
+# endpoints that query JanusGraph, overridden per endpoint below. A client may
+# ask for another one with the X-Request-Timeout-Ms header, up to
+# DEADLINE_MAX_MS. A missed deadline is answered with 504 and the server is
+# told to stop through evaluationTimeout. 0 means no deadline.
+DEFAULT_DEADLINE_MS = float(os.getenv("DEADLINE_DEFAULT_MS", "30000"))
+MAX_DEADLINE_MS = float(os.getenv("DEADLINE_MAX_MS", "120000"))
+ENDPOINT_DEADLINES_MS = {
+    "/vertices": float(os.getenv("DEADLINE_VERTICES_MS", "10000")),
+    "/vertices/{vertex_id}": float(os.getenv("DEADLINE_VERTEX_MS", "2000")),
+    "/vertices/batch": float(os.getenv("DEADLINE_VERTEX_BATCH_MS", "5000")),
+    "/vertices/{vertex_id}/neighborhood": float(os.getenv("DEADLINE_NEIGHBORHOOD_MS", "15000")),
+    "/routes/shortest": float(os.getenv("DEADLINE_ROUTES_MS", "10000")),
+    "POST /vertices": float(os.getenv("DEADLINE_WRITE_MS", "5000")),
+    "POST /edges": float(os.getenv("DEADLINE_WRITE_MS", "5000")),
+    "POST /vertices/bulk": float(os.getenv("DEADLINE_BULK_WRITE_MS", "30000")),
+    "POST /edges/bulk": float(os.getenv("DEADLINE_BULK_WRITE_MS", "30000")),
+}
+DEADLINE_HEADER = "X-Request-Timeout-Ms"
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Page sizes for GET /vertices?limit=&cursor= keyset pagination.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+# Response header carrying the cursor of the next page.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Most ids accepted by one POST /vertices/batch call.
+MAX_BATCH_IDS = 5000
+# Most elements accepted by one POST /vertices/bulk or /edges/bulk call.
+MAX_BULK_WRITES = int(os.getenv("MAX_BULK_WRITES", "10000"))
+
+# In-process read cache, switchable per endpoint: VERTEX_CACHE_ENABLED covers
+# GET /vertices/{vertex_id}, LABEL_CACHE_ENABLED covers GET /vertices?label=.
+vertex_read_cache = VertexReadCache(
+    vertex_cache=TTLCache(
+        max_size=int(os.getenv("VERTEX_CACHE_SIZE", "50000")),
+        ttl=float(os.getenv("VERTEX_CACHE_TTL", "300")),
+        negative_ttl=float(os.getenv("VERTEX_CACHE_NEGATIVE_TTL", "30")),
+    ) if _env_flag("VERTEX_CACHE_ENABLED", "1") else None,
+    label_cache=TTLCache(
+        max_size=int(os.getenv("LABEL_CACHE_SIZE", "32")),
+        ttl=float(os.getenv("LABEL_CACHE_TTL", "300")),
+    ) if _env_flag("LABEL_CACHE_ENABLED", "1") else None,
+)
+
+def _env_list(name: str, default: str = "") -> List[str]:
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+# Optional read replica (see graph_snapshot.py). With SNAPSHOT_ENABLED=1 the
+# vertices and the SNAPSHOT_EDGE_LABELS edges are copied into memory at startup
+# and every SNAPSHOT_REFRESH_INTERVAL seconds, and vertex reads are answered
+# from the copy. SNAPSHOT_VERTEX_LABELS limits the copy to some labels,
+# SNAPSHOT_MAX_AGE (seconds, 0 = no limit) stops serving a copy that could not
+# be refreshed for too long.
+graph_snapshot = SnapshotReplica(
+    janus_graph_manager,
+    refresh_interval=float(os.getenv("SNAPSHOT_REFRESH_INTERVAL", "300")),
+    max_age=float(os.getenv("SNAPSHOT_MAX_AGE", "0")),
+    vertex_labels=_env_list("SNAPSHOT_VERTEX_LABELS"),
+    edge_labels=_env_list("SNAPSHOT_EDGE_LABELS", "route"),
+) if _env_flag("SNAPSHOT_ENABLED", "0") else None
+
+# GET /routes/shortest: default and largest ?max_hops=, the edge property
+# reported as the distance of a fewest-hops route, and the bounds of the
+# server-side search used without a snapshot (traversers expanded, candidate
+# paths ranked for ?weight=), see janusgraph_crud.build_route_query.
+DEFAULT_ROUTE_HOPS = int(os.getenv("ROUTE_DEFAULT_HOPS", "4"))
+MAX_ROUTE_HOPS = int(os.getenv("ROUTE_MAX_HOPS", "6"))
+ROUTE_DISTANCE_KEY = os.getenv("ROUTE_DISTANCE_KEY", "dist")
+ROUTE_SEARCH_BUDGET = int(os.getenv("ROUTE_SEARCH_BUDGET", "10000"))
+ROUTE_CANDIDATES = int(os.getenv("ROUTE_CANDIDATES", "100"))
+
+# GET /vertices/{vertex_id}/neighborhood: deepest ?hops=, default and largest
+# ?limit= (vertices per level), and the per-request caps on the vertices
+# returned over all levels and on the edges the server walks for one level.
+NEIGHBORHOOD_MAX_HOPS = int(os.getenv("NEIGHBORHOOD_MAX_HOPS", "3"))
+DEFAULT_NEIGHBORHOOD_LIMIT = 500
+MAX_NEIGHBORHOOD_LIMIT = 5000
+NEIGHBORHOOD_MAX_VERTICES = int(os.getenv("NEIGHBORHOOD_MAX_VERTICES", "10000"))
+NEIGHBORHOOD_MAX_EDGES = int(os.getenv("NEIGHBORHOOD_MAX_EDGES", "100000"))
+
+# Precomputed statistics behind GET /stats/* (see graph_stats.py), recomputed
+# every STATS_REFRESH_INTERVAL seconds, and counted from the snapshot when it
+# is enabled. STATS_ENABLED=0 turns the background scans off.
+graph_stats = GraphStatsService(
+    janus_graph_manager,
+    snapshots=graph_snapshot,
+    refresh_interval=float(os.getenv("STATS_REFRESH_INTERVAL", "600")),
+    hub_label=os.getenv("STATS_HUB_LABEL", "airport"),
+    route_label=os.getenv("STATS_ROUTE_LABEL", "route"),
+    country_key=os.getenv("STATS_COUNTRY_KEY", "country"),
+) if _env_flag("STATS_ENABLED", "1") else None
+
+# In-process analytics over the route network (see analytics.py), run on
+# demand with POST /analytics/run.
+analytics_job = AnalyticsJob(
+    janus_graph_manager,
+    snapshots=graph_snapshot,
+    vertex_label=os.getenv("ANALYTICS_VERTEX_LABEL", "airport"),
+    edge_label=os.getenv("ANALYTICS_EDGE_LABEL", "route"),
+    betweenness_samples=int(os.getenv("ANALYTICS_BETWEENNESS_SAMPLES", "64")),
+    write_batch_size=int(os.getenv("ANALYTICS_WRITE_BATCH_SIZE", "200")),
+)
+
+# In-memory lat/lon index behind GET /airports/nearby (see geo_index.py),
+# rebuilt every AIRPORT_INDEX_REFRESH_INTERVAL seconds and on every snapshot
+# refresh. AIRPORT_INDEX_ENABLED=0 sends every query to the server.
+airport_index = AirportIndexService(
+    janus_graph_manager,
+    snapshots=graph_snapshot,
+    refresh_interval=float(os.getenv("AIRPORT_INDEX_REFRESH_INTERVAL", "600")),
+    label=os.getenv("AIRPORT_INDEX_LABEL", "airport"),
+) if _env_flag("AIRPORT_INDEX_ENABLED", "1") else None
+# Autocomplete index behind GET /airports/search (see airport_search.py),
+# resynced every AIRPORT_SEARCH_REFRESH_INTERVAL seconds and on every snapshot
+# refresh. AIRPORT_SEARCH_ENABLED=0 turns it off.
+airport_search = AirportSearchService(
+    janus_graph_manager,
+    snapshots=graph_snapshot,
+    refresh_interval=float(os.getenv("AIRPORT_SEARCH_REFRESH_INTERVAL", "600")),
+    label=os.getenv("AIRPORT_SEARCH_LABEL", "airport"),
+    edge_label=os.getenv("AIRPORT_SEARCH_ROUTE_LABEL", "route"),
+) if _env_flag("AIRPORT_SEARCH_ENABLED", "1") else None
+MAX_SEARCH_RESULTS = 100
+
+# Write-behind queue of POST /vertices, /edges and their /bulk variants (see
+# write_queue.py): writes are grouped into one traversal and transaction of
+# up to WRITE_MAX_BATCH_SIZE elements, sent at the latest WRITE_MAX_LINGER_MS
+# after the oldest one arrived, WRITE_MAX_IN_FLIGHT groups at a time. Past
+# WRITE_MAX_PENDING queued writes new ones are answered 503.
+# WRITE_QUEUE_ENABLED=0 sends the writes of each request as their own
+# traversal instead.
+write_queue = WriteBehindQueue(
+    janus_graph_manager,
+    max_batch_size=int(os.getenv("WRITE_MAX_BATCH_SIZE", "500")),
+    max_linger=float(os.getenv("WRITE_MAX_LINGER_MS", "5")) / 1000.0,
+    max_pending=int(os.getenv("WRITE_MAX_PENDING", "50000")),
+    max_in_flight=int(os.getenv("WRITE_MAX_IN_FLIGHT", "4")),
+    write_timeout=float(os.getenv("WRITE_TIMEOUT_MS", "30000")) / 1000.0,
+) if _env_flag("WRITE_QUEUE_ENABLED", "1") else None
+
+# Committed writes drop the cached copies of the vertices written and of the
+# lists of their label, and airports are updated in the search index at
+# once. The snapshot, the statistics and the geo index see them on their
+# next refresh.
+def _on_writes(writes: List[Any], ids: List[Any]):
+    for write, element_id in zip(writes, ids):
+        if not isinstance(write, VertexUpsert):
+            continue
+        vertex_read_cache.invalidate_vertex(element_id, write.label)
+        if airport_search is not None and write.label == airport_search.label:
+            airport_search.index.update({"id": element_id, **write.match, **write.properties})
+
+if write_queue is not None:
+    write_queue.add_listener(_on_writes)
+# Largest ?radius_km= (about half the Earth's circumference) and ?k=.
+MAX_NEARBY_RADIUS_KM = 20040.0
+MAX_NEARBY_AIRPORTS = 1000
+
+# Per-traversal latency histograms, rows, payload bytes and errors (see
+# metrics.py), scraped from GET /metrics. METRICS_ENABLED=0 stops recording.
+metrics_registry.enabled = _env_flag("METRICS_ENABLED", "1")
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Gauges and counters read from the pool, the read cache and the snapshot
+# at scrape time.
+def _service_metrics():
+    collected = []
+    if janus_graph_manager.is_connected():
+        pool = janus_graph_manager.pool_stats()
+        collected += [
+            ("graph_pool_connections", "gauge", "Open pooled connections by state.",
+             [({"state": "in_use"}, pool["in_use"]), ({"state": "idle"}, pool["idle"]),
+              ({"state": "unhealthy"}, pool["unhealthy"])]),
+            ("graph_pool_leases_total", "counter", "Connections leased from the pool.",
+             [({}, pool["total_leases"])]),
+            ("graph_pool_waits_total", "counter", "Leases that had to wait for a free connection.",
+             [({}, pool["total_waits"])]),
+            ("graph_pool_lease_timeouts_total", "counter", "Leases that gave up waiting.",
+             [({}, pool["lease_timeouts"])]),
+        ]
+        endpoints = pool.get("endpoints", [])
+        if endpoints:
+            collected += [
+                ("graph_endpoint_up", "gauge", "Whether a Gremlin Server is in rotation (not ejected).",
+                 [({"endpoint": e["url"]}, 0 if e["ejected"] else 1) for e in endpoints]),
+                ("graph_endpoint_latency_seconds", "gauge", "Peak-EWMA lease latency the balancer judges a server on.",
+                 [({"endpoint": e["url"]}, e["latency_ms"] / 1000.0) for e in endpoints]),
+                ("graph_endpoint_in_flight", "gauge", "Leases in flight per Gremlin Server.",
+                 [({"endpoint": e["url"]}, e["in_flight"]) for e in endpoints]),
+                ("graph_endpoint_leases_total", "counter", "Leases per Gremlin Server.",
+                 [({"endpoint": e["url"]}, e["leases"]) for e in endpoints]),
+                ("graph_endpoint_ejections_total", "counter", "Times a Gremlin Server was ejected.",
+                 [({"endpoint": e["url"]}, e["ejections"]) for e in endpoints]),
+                ("graph_hedged_reads_total", "counter", "Reads sent to a second Gremlin Server, by winner.",
+                 [({"winner": "first"}, pool["hedging"]["hedged"] - pool["hedging"]["hedge_wins"]),
+                  ({"winner": "hedge"}, pool["hedging"]["hedge_wins"])]),
+            ]
+    cache_samples = []
+    for endpoint, cache in vertex_read_cache.stats().items():
+        for outcome in ("hits", "negative_hits", "misses"):
+            if outcome in cache:
+                cache_samples.append(({"endpoint": endpoint, "outcome": outcome}, cache[outcome]))
+    collected.append(("read_cache_lookups_total", "counter", "Read cache lookups by outcome.", cache_samples))
+    if write_queue is not None:
+        writes = write_queue.status()
+        collected += [
+            ("graph_write_queue_pending", "gauge", "Writes waiting in the write-behind queue.",
+             [({}, writes["pending"])]),
+            ("graph_write_batches_total", "counter", "Write batches committed.", [({}, writes["batches"])]),
+            ("graph_writes_total", "counter", "Writes by outcome.",
+             [({"outcome": "written"}, writes["written"]), ({"outcome": "failed"}, writes["failed"]),
+              ({"outcome": "abandoned"}, writes["abandoned"])]),
+        ]
+    snapshot = graph_snapshot.current() if graph_snapshot is not None else None
+    if snapshot is not None:
+        collected += [
+            ("graph_snapshot_version", "gauge", "Version of the snapshot being served.", [({}, snapshot.version)]),
+            ("graph_snapshot_age_seconds", "gauge", "Age of the snapshot being served.", [({}, snapshot.age())]),
+        ]
+    return collected
+
+metrics_registry.add_collector(_service_metrics)
+
+# Slow query log behind GET /debug/slow-queries (see slow_queries.py): CRUD
+# traversals slower than SLOW_QUERY_THRESHOLD_MS (0 = never) are re-run with
+# profile() in the background, at most once every SLOW_QUERY_MIN_INTERVAL
+# seconds per query shape, and the last SLOW_QUERY_LOG_SIZE profiles are
+# kept. The debug endpoints and ?profile=true need the DEBUG_ADMIN_TOKEN in
+# the X-Admin-Token header; without a token they are disabled. So do the
+# endpoints that export the whole graph on demand (POST /snapshot/refresh,
+# POST /analytics/run).
+slow_query_log = SlowQueryLog(
+    janus_graph_manager,
+    threshold_ms=float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "1000")),
+    size=int(os.getenv("SLOW_QUERY_LOG_SIZE", "100")),
+    min_interval=float(os.getenv("SLOW_QUERY_MIN_INTERVAL", "60")),
+)
+metrics_registry.add_hook(slow_query_log.on_traversal)
+DEBUG_ADMIN_TOKEN = os.getenv("DEBUG_ADMIN_TOKEN", "")
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+
+# Headers telling clients that a response came from the snapshot and how
+# stale it may be.
+SNAPSHOT_VERSION_HEADER = "X-Snapshot-Version"
+SNAPSHOT_AGE_HEADER = "X-Snapshot-Age"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Starting app, connecting to JanusGraph...")
-    await janus_graph_manager.connect()
+    await janus_graph_manager.connect(
+        JANUSGRAPH_URLS,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        idle_timeout=POOL_IDLE_TIMEOUT,
+        lease_timeout=POOL_LEASE_TIMEOUT,
+        serializer=JANUSGRAPH_SERIALIZER,
+        eject_after=LB_EJECT_AFTER,
+        probe_interval=LB_PROBE_INTERVAL,
+        probe_timeout=LB_PROBE_TIMEOUT,
+        decay_time=LB_DECAY_TIME,
+        hedge_delay=HEDGE_DELAY_MS / 1000.0,
+        hedge_budget=HEDGE_BUDGET,
+    )
+    if graph_snapshot is not None:
+        await graph_snapshot.start()
+    if graph_stats is not None:
+        await graph_stats.start()
+    if airport_index is not None:
+        await airport_index.start()
+    if airport_search is not None:
+        await airport_search.start()
+    if write_queue is not None:
+        await write_queue.start()
     yield
+    # Queued writes are sent before the connections go away.
+    if write_queue is not None:
+        await write_queue.stop()
+    slow_query_log.close()
+    if airport_search is not None:
+        await airport_search.stop()
+    if airport_index is not None:
+        await airport_index.stop()
+    if graph_stats is not None:
+        await graph_stats.stop()
+    if graph_snapshot is not None:
+        await graph_snapshot.stop()
     print("Shutting down, closing JanusGraph connection...")
-    janus_graph_manager.close()
+    await run_in_threadpool(janus_graph_manager.close)
 
 # # The 'lifespan' context manager is registered here for startup/shutdown
 app = FastAPI(lifespan=lifespan, title="JanusGraph Air Routes API v1.0")
 
-async def get_graph_traversal_source() -> GraphTraversalSource:
-    try:
-        return janus_graph_manager.get_g()
-    except RuntimeError as e:
-        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+def is_admin(token: Optional[str]) -> bool:
+    return bool(DEBUG_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, DEBUG_ADMIN_TOKEN)
 
-async def get_graph_crud_ops(
-    g: GraphTraversalSource = Depends(get_graph_traversal_source)
-) -> GraphCRUDOperations:
-    return GraphCRUDOperations(g)
+# ?profile=true on any endpoint that runs CRUD traversals captures the
+# profile() of each of them in the slow query log, whatever their duration.
+# An async dependency runs in the request's own context, so the flag it sets
+# is seen by the traversals of this request only.
+async def get_profile_flag(
+    profile: bool = Query(False, description="Capture the profile() of this request's traversals (admin only)"),
+    admin_token: Optional[str] = Header(None, alias=ADMIN_TOKEN_HEADER),
+) -> bool:
+    if profile and not is_admin(admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail=f"?profile=true needs a valid {ADMIN_TOKEN_HEADER} header.")
+    profile_request(profile)
+    return profile
+
+# The deadline of a request: the X-Request-Timeout-Ms header when given,
+# otherwise the endpoint's entry of ENDPOINT_DEADLINES_MS (by method and
+# route path, then by route path) or DEFAULT_DEADLINE_MS. Like the profile flag it is set in the request's own
+# context, where the pool and the CRUD layer read it (see deadlines.py).
+async def get_deadline(
+    request: Request,
+    timeout_ms: Optional[float] = Header(None, alias=DEADLINE_HEADER, gt=0, le=MAX_DEADLINE_MS),
+) -> Optional[Deadline]:
+    if timeout_ms is None:
+        path = getattr(request.scope.get("route"), "path", None)
+        timeout_ms = ENDPOINT_DEADLINES_MS.get(f"{request.method} {path}",
+                                               ENDPOINT_DEADLINES_MS.get(path, DEFAULT_DEADLINE_MS))
+    deadline = Deadline(timeout_ms / 1000.0) if timeout_ms > 0 else None
+    set_deadline(deadline)
+    return deadline
+
+def deadline_exceeded(e: DeadlineExceededError) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+
+# Identical traversals in flight at the same time are sent to JanusGraph once
+# and share the result (see single_flight.py). SINGLE_FLIGHT_ENABLED=0 turns it
+# off.
+single_flight = SingleFlight() if _env_flag("SINGLE_FLIGHT_ENABLED", "1") else None
+
+# The CRUD layer of the handlers. Instead of holding a connection for the
+# whole request, AsyncGraphCRUDOperations leases one from the pool on the
+# event loop for each traversal it sends (waiting costs no thread when the
+# pool is busy), and the handlers await their traversals, so thousands of
+# in-flight queries do not need thousands of threadpool workers.
+# Cache hits and coalesced calls never touch the pool at all.
+async def get_async_graph_crud_ops(
+    profile: bool = Depends(get_profile_flag),
+    deadline: Optional[Deadline] = Depends(get_deadline),
+) -> AsyncGraphCRUDOperations:
+    if not janus_graph_manager.is_connected():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Not connected to JanusGraph.")
+    return AsyncGraphCRUDOperations(connections=janus_graph_manager, single_flight=single_flight)
+
+# Parses the ?fields=code,city query parameter into the list of property keys
+# to fetch. id and label are always returned, so they are dropped from the
+# list rather than being looked up as properties. None means every property.
+def get_fields(fields: Optional[str] = Query(None, description="Comma-separated property keys to return")) -> Optional[List[str]]:
+    if not fields:
+        return None
+    keys = []
+    for key in fields.split(","):
+        key = key.strip()
+        if key and key not in ("id", "label") and key not in keys:
+            keys.append(key)
+    return keys or None
+
+# The snapshot to answer a read from, or None to go to JanusGraph.
+def current_snapshot() -> Optional[GraphSnapshot]:
+    return graph_snapshot.current() if graph_snapshot is not None else None
+
+# Adds the version and age of the snapshot a response was served from.
+def mark_snapshot(response: Response, snapshot: GraphSnapshot):
+    response.headers[SNAPSHOT_VERSION_HEADER] = str(snapshot.version)
+    response.headers[SNAPSHOT_AGE_HEADER] = f"{snapshot.age():.1f}"
 
 # Returns a simple status to indicate the API is reachable.
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
+# Utilization of the JanusGraph connection pool (size, leased, idle, waits,
+# evictions ...); with several Gremlin Servers summed over them, plus the
+# latency, load and ejection state of each one.
+@app.get("/pool/stats")
+async def pool_stats():
+    try:
+        return janus_graph_manager.pool_stats()
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+# How many calls were coalesced into an identical in-flight traversal.
+@app.get("/singleflight/stats")
+async def single_flight_stats():
+    if single_flight is None:
+        return {"enabled": False}
+    return single_flight.stats()
+
+# Queue length, batches and outcome counters of the write-behind queue.
+@app.get("/writes/stats")
+async def write_stats():
+    if write_queue is None:
+        return {"enabled": False}
+    return write_queue.status()
+
+# Hit/miss/eviction counters of the read cache, per endpoint.
+@app.get("/cache/stats")
+async def cache_stats():
+    return vertex_read_cache.stats()
+
+# Everything above plus the traversal histograms, in the Prometheus text
+# format.
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type=PROMETHEUS_MEDIA_TYPE)
+
+# Guards the /debug endpoints and the on-demand full-graph jobs: 404 while
+# no DEBUG_ADMIN_TOKEN is set, 403 without the right X-Admin-Token header.
+def require_admin(admin_token: Optional[str] = Header(None, alias=ADMIN_TOKEN_HEADER)):
+    if not DEBUG_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are not enabled.")
+    if not is_admin(admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"A valid {ADMIN_TOKEN_HEADER} header is required.")
+
+# The captured profiles, newest first: the query shape, what triggered the
+# capture, its duration as the API saw it, the traversal, and the duration
+# and traverser counts of every step as the server measured them on the
+# re-run ('status' is pending until the re-run is done). Filter with ?query=
+# and ?trigger=threshold|request.
+@app.get("/debug/slow-queries", dependencies=[Depends(require_admin)])
+async def slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    query: Optional[str] = None,
+    trigger: Optional[str] = Query(None, pattern="^(threshold|request)$"),
+):
+    return {**slow_query_log.stats(), "slow_queries": slow_query_log.entries(limit, query, trigger)}
+
+@app.get("/debug/slow-queries/{entry_id}", dependencies=[Depends(require_admin)])
+async def slow_query(entry_id: int):
+    entry = slow_query_log.get(entry_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"No slow query {entry_id}.")
+    return entry
+
+@app.delete("/debug/slow-queries", dependencies=[Depends(require_admin)], status_code=status.HTTP_204_NO_CONTENT)
+async def clear_slow_queries():
+    slow_query_log.clear()
+
+# Version, age, size and memory footprint of the in-memory snapshot.
+@app.get("/snapshot/stats")
+async def snapshot_stats():
+    if graph_snapshot is None:
+        return {"enabled": False}
+    return graph_snapshot.stats()
+
+# Rebuilds the snapshot now instead of waiting for the next refresh. Admin
+# only, as it exports the whole graph.
+@app.post("/snapshot/refresh", dependencies=[Depends(require_admin)])
+async def refresh_snapshot():
+    if graph_snapshot is None:
+        raise HTTPException(status_code=404, detail="The snapshot is not enabled.")
+    try:
+        snapshot = await graph_snapshot.refresh_async()
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return snapshot.stats()
+
+# The precomputed statistics, or 404 when they are disabled and 503 until the
+# first computation is done.
+def current_stats() -> GraphStats:
+    if graph_stats is None:
+        raise HTTPException(status_code=404, detail="Statistics are not enabled.")
+    stats = graph_stats.current()
+    if stats is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Statistics have not been computed yet.")
+    return stats
+
+# Totals and per-label counts, with the state of the background refresh.
+@app.get("/stats")
+async def stats_summary():
+    return {**current_stats().summary(), "refresh": graph_stats.status()}
+
+# Vertex and edge counts per label.
+@app.get("/stats/labels")
+async def stats_labels():
+    stats = current_stats()
+    return {**stats.header(), "vertices": stats.vertex_labels, "edges": stats.edge_labels}
+
+# Airports per country, most first; 'limit' keeps the top ones.
+@app.get("/stats/countries")
+async def stats_countries(limit: Optional[int] = Query(None, ge=1)):
+    stats = current_stats()
+    countries = stats.countries
+    if limit is not None:
+        countries = dict(itertools.islice(countries.items(), limit))
+    return {**stats.header(), "countries": countries}
+
+# The airports with the most routes (in + out).
+@app.get("/stats/hubs")
+async def stats_hubs(limit: int = Query(10, ge=1, le=1000)):
+    stats = current_stats()
+    return {**stats.header(), "hubs": stats.degrees[:limit]}
+
+# Route degree of one airport, from the degree view.
+@app.get("/stats/degree/{vertex_id}")
+async def stats_degree(vertex_id: str):
+    stats = current_stats()
+    entry = stats.by_id.get(vertex_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"No degree for vertex {vertex_id}.")
+    return {**stats.header(), **entry}
+
+# Recomputes the statistics now instead of waiting for the next refresh.
+@app.post("/stats/refresh")
+async def refresh_stats():
+    if graph_stats is None:
+        raise HTTPException(status_code=404, detail="Statistics are not enabled.")
+    try:
+        stats = await graph_stats.refresh_async()
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return stats.summary()
+
+# Runs PageRank, approximate betweenness and connected components over the
+# route edges and returns the timing report of every stage. With
+# ?write_back=true the scores are also stored as the 'pagerank',
+# 'betweenness' and 'component' properties of the vertices, and the read
+# cache is dropped so the new properties show up. Blocking work, so it runs
+# on the threadpool; concurrent runs wait for each other. Admin only: a run
+# exports the whole graph and may write to every airport.
+@app.post("/analytics/run", dependencies=[Depends(require_admin)])
+async def run_analytics(write_back: bool = False):
+    try:
+        result = await run_in_threadpool(analytics_job.run, write_back)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if write_back:
+        vertex_read_cache.clear()
+    return result.report()
+
+def analytics_result():
+    if analytics_job.result is None:
+        raise HTTPException(status_code=404, detail="Analytics have not been run yet.")
+    return analytics_job.result
+
+# Report of the last run.
+@app.get("/analytics")
+async def analytics_report():
+    return analytics_result().report()
+
+# The vertices with the highest score of one metric in the last run.
+@app.get("/analytics/top")
+async def analytics_top(
+    metric: str = Query("pagerank", pattern="^(pagerank|betweenness)$"),
+    limit: int = Query(10, ge=1, le=1000),
+):
+    result = analytics_result()
+    return {"computed_at": result.computed_at, "metric": metric, "vertices": result.top(metric, limit)}
+
+# Scores of one vertex in the last run.
+@app.get("/analytics/vertices/{vertex_id}")
+async def analytics_vertex(vertex_id: str):
+    result = analytics_result()
+    scores = result.vertex(vertex_id)
+    if scores is None:
+        raise HTTPException(status_code=404, detail=f"Vertex {vertex_id} was not part of the last run.")
+    return {"computed_at": result.computed_at, **scores}
+
 # Retrieves a list of vertices from the graph.
 # - Can optionally filter vertices by their 'label'.
-# - Uses the GraphCRUDOperations to perform the query.
+# - Uses the AsyncGraphCRUDOperations to perform the query on the event loop.
 # - Returns a list of dictionaries, where each dictionary represents a vertex.
+# - With 'fields' only those properties are fetched from the server.
+# - Label-filtered listings are served from the read cache when enabled.
+# - Full listings are served from the snapshot when enabled and it holds the
+#   label (X-Snapshot-Version / X-Snapshot-Age headers), built on the
+#   threadpool so a large listing does not hold up the event loop.
+# - With 'limit' and/or 'cursor' only one page is returned, ordered by id. The
+#   cursor of the next page comes back in the X-Next-Cursor header (absent on
+#   the last page) and is passed as ?cursor= to fetch that page.
+# - With ?stream=true or an "Accept: application/x-ndjson" header the vertices
+#   are streamed instead, one JSON object per line, see stream_vertices().
 @app.get("/vertices", response_model=List[Dict[str, Any]])
-def read_vertices(label: Optional[str] = None, crud: GraphCRUDOperations = Depends(get_graph_crud_ops)):
+async def read_vertices(
+    request: Request,
+    response: Response,
+    label: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    fields: Optional[List[str]] = Depends(get_fields),
+    crud: AsyncGraphCRUDOperations = Depends(get_async_graph_crud_ops),
+):
+    paginated = limit is not None or cursor is not None
+    if stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        if paginated:
+            raise HTTPException(status_code=400, detail="limit/cursor cannot be combined with streaming.")
+        return await stream_vertices(crud, label, fields)
+    if not paginated and graph_snapshot is not None and graph_snapshot.covers_label(label):
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            mark_snapshot(response, snapshot)
+            return await run_in_threadpool(snapshot.vertices, label, fields)
+    try:
+        if not paginated:
+            return await vertex_read_cache.get_all_vertices(crud, label, fields)
+        page, next_cursor = await crud.get_vertex_page(label, limit or DEFAULT_PAGE_SIZE, cursor, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DeadlineExceededError as e:
+        raise deadline_exceeded(e)
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return page
+
+# Streams vertices as NDJSON, one keyset page of STREAM_BATCH_SIZE vertices
+# (see get_vertex_page) per traversal, each fetched only once the previous
+# one has been written to the client. A slow reader therefore holds back the
+# queries instead of letting results pile up in memory: at most one page is
+# held whatever the size of the graph. A connection is leased per page only.
+# The first page is fetched before the response starts, which lets a failing
+# query still return a proper error; once streaming has started the status
+# line is gone and an error simply ends the stream. Every page gets the
+# request's deadline afresh, so a long export is not cut off by it. Vertices
+# written while the stream runs show up when their id is not passed yet.
+async def stream_vertices(crud: AsyncGraphCRUDOperations, label: Optional[str],
+                          fields: Optional[List[str]] = None) -> StreamingResponse:
+    deadline = current_deadline()
     try:
-        return crud.get_all_vertices(label)
+        first, cursor = await crud.get_vertex_page(label, STREAM_BATCH_SIZE, None, fields)
+    except DeadlineExceededError as e:
+        raise deadline_exceeded(e)
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    async def ndjson_lines() -> AsyncIterator[str]:
+        page, next_cursor = first, cursor
+        while True:
+            if page:
+                yield "".join(json.dumps(jsonable_encoder(row)) + "\n" for row in page)
+            if not next_cursor:
+                return
+            if deadline is not None:
+                set_deadline(Deadline(deadline.timeout))
+            page, next_cursor = await crud.get_vertex_page(label, STREAM_BATCH_SIZE, next_cursor, fields)
+
+    return StreamingResponse(ndjson_lines(), media_type=NDJSON_MEDIA_TYPE)
+
 # Retrieves a single vertex by its unique ID.
-# - Uses the GraphCRUDOperations to perform the lookup.
+# - Uses the AsyncGraphCRUDOperations to perform the lookup.
+# - With 'fields' only those properties are fetched from the server.
+# - Served from the snapshot when enabled and it has the vertex; a vertex
+#   missing from the snapshot may be newer than it and is looked up.
+# - Served from the read cache when enabled, including cached misses.
 # - Returns a dictionary representing the vertex if found.
 # - Raises a 404 Not Found error if the vertex does not exist.
 @app.get("/vertices/{vertex_id}", response_model=Dict[str, Any])
-def read_vertex(vertex_id: str, crud: GraphCRUDOperations = Depends(get_graph_crud_ops)):
+async def read_vertex(
+    vertex_id: str,
+    response: Response,
+    fields: Optional[List[str]] = Depends(get_fields),
+    crud: AsyncGraphCRUDOperations = Depends(get_async_graph_crud_ops),
+):
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        vertex = snapshot.vertex(vertex_id, fields)
+        if vertex is not None:
+            mark_snapshot(response, snapshot)
+            return vertex
     try:
-        return crud.get_vertex_by_id(vertex_id)
+        return await vertex_read_cache.get_vertex_by_id(crud, vertex_id, fields)
+    except DeadlineExceededError as e:
+        raise deadline_exceeded(e)
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except RuntimeError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
+# Streams the neighborhood of a vertex as NDJSON, one line per level:
+# {"level": 0, "vertices": [the vertex], ...} first, then the vertices 1, 2
+# ... hops away, each line {"level": n, "vertices": [...], "truncated": bool}.
+# - Follows edge_label edges ('route' by default, every label when empty) in
+#   'direction' (out, in or both).
+# - Every vertex appears once, at its smallest distance.
+# - 'limit' caps the vertices of each level, NEIGHBORHOOD_MAX_VERTICES those
+#   of the whole response and NEIGHBORHOOD_MAX_EDGES the edges the server
+#   walks per level, so a hub cannot make one request run away. 'truncated'
+#   tells that a level hit its limit.
+# - Each level is its own traversal and holds a pooled connection only while
+#   it runs, see AsyncGraphCRUDOperations.iter_neighborhood().
+# - Served from the snapshot when enabled and it holds the edge label
+#   (X-Snapshot-Version / X-Snapshot-Age headers).
+# - The first line is produced before the response starts, so an unknown
+#   vertex still gets a 404; later failures end the stream.
+@app.get("/vertices/{vertex_id}/neighborhood")
+async def read_neighborhood(
+    vertex_id: str,
+    hops: int = Query(1, ge=1, le=NEIGHBORHOOD_MAX_HOPS),
+    direction: str = Query("out", pattern="^(out|in|both)$"),
+    edge_label: str = "route",
+    limit: int = Query(DEFAULT_NEIGHBORHOOD_LIMIT, ge=1, le=MAX_NEIGHBORHOOD_LIMIT),
+    fields: Optional[List[str]] = Depends(get_fields),
+    crud: AsyncGraphCRUDOperations = Depends(get_async_graph_crud_ops),
+) -> StreamingResponse:
+    snapshot = current_snapshot()
+    if snapshot is not None and edge_label and graph_snapshot.covers_edge_label(edge_label):
+        row = snapshot.row(vertex_id)
+        if row is not None:
+            def snapshot_lines() -> Iterator[str]:
+                yield json.dumps(jsonable_encoder(
+                    {"level": 0, "vertices": [snapshot.vertex_at(row, fields)], "truncated": False})) + "\n"
+                levels = snapshot.neighborhood(row, hops, direction, edge_label, limit, NEIGHBORHOOD_MAX_VERTICES)
+                for level, (rows, truncated) in enumerate(levels, start=1):
+                    vertices = [snapshot.vertex_at(r, fields) for r in rows]
+                    yield json.dumps(jsonable_encoder(
+                        {"level": level, "vertices": vertices, "truncated": truncated})) + "\n"
+
+            response = StreamingResponse(snapshot_lines(), media_type=NDJSON_MEDIA_TYPE)
+            mark_snapshot(response, snapshot)
+            return response
+
+    levels = crud.iter_neighborhood(vertex_id, hops, direction, edge_label or None, limit,
+                                    NEIGHBORHOOD_MAX_VERTICES, NEIGHBORHOOD_MAX_EDGES, fields)
+    try:
+        first = await levels.__anext__()
+    except VertexNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DeadlineExceededError as e:
+        raise deadline_exceeded(e)
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def ndjson_lines() -> AsyncIterator[str]:
+        yield json.dumps(jsonable_encoder(first)) + "\n"
+        async for line in levels:
+            yield json.dumps(jsonable_encoder(line)) + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type=NDJSON_MEDIA_TYPE)
+
+# Request and response bodies of POST /vertices/batch.
+class VertexBatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+    fields: Optional[List[str]] = None
+
+class VertexBatchResponse(BaseModel):
+    vertices: Dict[str, Optional[Dict[str, Any]]]
+    not_found: List[str]
+
+# Retrieves many vertices by id in one call.
+# - All ids are resolved with a single g.V(*ids) traversal instead of one
+#   GET /vertices/{vertex_id} round trip per id.
+# - 'vertices' is keyed by the requested ids; an id that does not exist maps
+#   to null and is also listed in 'not_found'.
+# - Duplicate ids are looked up once.
+# - With the snapshot enabled only the ids it does not have go to JanusGraph.
+@app.post("/vertices/batch", response_model=VertexBatchResponse)
+async def read_vertex_batch(
+    body: VertexBatchRequest,
+    response: Response,
+    crud: AsyncGraphCRUDOperations = Depends(get_async_graph_crud_ops),
+):
+    ids = list(dict.fromkeys(body.ids))
+    fields = get_fields(",".join(body.fields)) if body.fields else None
+    vertices: Dict[str, Optional[Dict[str, Any]]] = {}
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        vertices = {vertex_id: snapshot.vertex(vertex_id, fields) for vertex_id in ids}
+        ids = [vertex_id for vertex_id, vertex in vertices.items() if vertex is None]
+        mark_snapshot(response, snapshot)
+    try:
+        if ids:
+            vertices.update(await crud.get_vertices_by_ids(ids, fields))
+    except DeadlineExceededError as e:
+        raise deadline_exceeded(e)
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "vertices": vertices,
+        "not_found": [vertex_id for vertex_id, vertex in vertices.items() if vertex is None],
+    }
+
+# Request and response bodies of the write endpoints. A vertex is identified
+# by its label and match, the properties that make its natural key (e.g.
+# {"code": "AUS"} for an airport); an edge by its label and the ids of its
+# two vertices.
+class VertexWrite(BaseModel):
+    label: str = Field(..., min_length=1)
+    match: Dict[str, Any]
+    properties: Dict[str, Any] = {}
+
+class EdgeWrite(BaseModel):
+    label: str = Field(..., min_length=1)
+    from_id: str
+    to_id: str
+    properties: Dict[str, Any] = {}
+
+class VertexBulkRequest(BaseModel):
+    vertices: List[VertexWrite] = Field(..., min_length=1, max_length=MAX_BULK_WRITES)
+
+class EdgeBulkRequest(BaseModel):
+    edges: List[EdgeWrite] = Field(..., min_length=1, max_length=MAX_BULK_WRITES)
+
+class WriteResponse(BaseModel):
+    id: Any
+    label: str
+
+class BulkWriteResponse(BaseModel):
+    ids: List[Any]
+    errors: Dict[int, str]
+
+def _check_keys(properties: Dict[str, Any]):
+    reserved = [key for key in properties if key in ("id", "label")]
+    if reserved:
+        raise HTTPException(status_code=400, detail=f"'{reserved[0]}' cannot be written as a property.")
+
+def vertex_upsert(body: VertexWrite) -> VertexUpsert:
+    _check_keys(body.match)
+    _check_keys(body.properties)
+    try:
+        return VertexUpsert(body.label, body.match, body.properties)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def edge_upsert(body: EdgeWrite) -> EdgeUpsert:
+    _check_keys(body.properties)
+    return EdgeUpsert(body.label, body.from_id, body.to_id, body.properties)
+
+def write_failed(e: Exception) -> HTTPException:
+    if isinstance(e, DeadlineExceededError):
+        return deadline_exceeded(e)
+    if isinstance(e, (ConnectionUnavailableError, WriteQueueFullError)):
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    if isinstance(e, WriteRejectedError):
+        return HTTPException(status_code=422, detail=str(e))
+    return HTTPException(status_code=500, detail=str(e))
+
+# Writes through the write-behind queue, or as one traversal of their own
+# when it is disabled. Returns the element ids in order, a failed write
+# leaving its exception in its place. Raises when every write failed.
+async def write_elements(crud: AsyncGraphCRUDOperations, writes: List[Any],
+                         deadline: Optional[Deadline]) -> List[Any]:
+    try:
+        if write_queue is not None:
+            results = await write_queue.submit(writes, deadline, return_exceptions=True)
+        else:
+            results = await crud.upsert_elements(writes)
+            _on_writes(writes, results)
+    except RuntimeError as e:
+        raise write_failed(e)
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures and len(failures) == len(results):
+        raise write_failed(failures[0])
+    return results
+
+# Creates or updates one vertex: the vertex of 'label' whose 'match'
+# properties have those values gets 'properties' set, and is created with
+# both when there is none (mergeV()). Sending the same write twice is the
+# same as sending it once, so a write that timed out can simply be retried.
+# - Answered with the vertex id once the batch holding the write has been
+#   committed (see write_queue.py).
+# - 'id' and 'label' cannot be used as property keys (400).
+# - 422 when JanusGraph refuses the write, 503 when the queue is full or
+#   the server unreachable, 504 past the deadline (the write may still be
+#   committed).
+@app.post("/vertices", response_model=WriteResponse)
+async def write_vertex(
+    body: VertexWrite,
+    deadline: Optional[Deadline] = Depends(get_deadline),
+    crud: AsyncGraphCRUDOperations = Depends(get_async_graph_crud_ops),
+):
+    ids = await write_elements(crud, [vertex_upsert(body)], deadline)
+    return {"id": ids[0], "label": body.label}
+
+# Creates or updates the 'label' edge from from_id to to_id, with
+# 'properties' set (mergeE()). Both vertices must exist (422 otherwise).
+# Same answers as POST /vertices.
+@app.post("/edges", response_model=WriteResponse)
+async def write_edge(
+    body: EdgeWrite,
+    deadline: Optional[Deadline] = Depends(get_deadline),
+    crud: AsyncGraphCRUDOperations = Depends(get_async_graph_crud_ops),
+):
+    ids = await write_elements(crud, [edge_upsert(body)], deadline)
+    return {"id": ids[0], "label": body.label}
+
+# Answers a bulk write: 200 when everything was written, 207 when some
+# writes failed ('ids' then has null at their index and 'errors' the
+# reason, keyed by index).
+def bulk_response(results: List[Any], response: Response) -> Dict[str, Any]:
+    errors = {i: str(result) for i, result in enumerate(results) if isinstance(result, Exception)}
+    if errors:
+        response.status_code = status.HTTP_207_MULTI_STATUS
+    return {"ids": [None if i in errors else result for i, result in enumerate(results)], "errors": errors}
+
+# Upserts up to MAX_BULK_WRITES vertices, as POST /vertices does one. The
+# writes go through the queue together and may be split over several
+# batches, so a bulk write is not one transaction: each write either is
+# committed or has its error.
+@app.post("/vertices/bulk", response_model=BulkWriteResponse)
+async def write_vertices(
+    body: VertexBulkRequest,
+    response: Response,
+    deadline: Optional[Deadline] = Depends(get_deadline),
+    crud: AsyncGraphCRUDOperations = Depends(get_async_graph_crud_ops),
+):
+    writes = [vertex_upsert(vertex) for vertex in body.vertices]
+    return bulk_response(await write_elements(crud, writes, deadline), response)
+
+# Upserts up to MAX_BULK_WRITES edges, as POST /edges does one. Same
+# answers as POST /vertices/bulk.
+@app.post("/edges/bulk", response_model=BulkWriteResponse)
+async def write_edges(
+    body: EdgeBulkRequest,
+    response: Response,
+    deadline: Optional[Deadline] = Depends(get_deadline),
+    crud: AsyncGraphCRUDOperations = Depends(get_async_graph_crud_ops),
+):
+    writes = [edge_upsert(edge) for edge in body.edges]
+    return bulk_response(await write_elements(crud, writes, deadline), response)
+
+class RouteResponse(BaseModel):
+    hops: int
+    distance: Optional[float]
+    weight: Optional[str]
+    path: List[Dict[str, Any]]
+
+# The in-memory search of GET /routes/shortest: the route as (rows, edges)
+# or None, and its distance. Blocking, a Dijkstra over the whole snapshot
+# can take a while, so it runs on the threadpool.
+def snapshot_route(snapshot, source: int, target: int, weight: Optional[str], edge_label: str, max_hops: int,
+                   distance_key: str):
+    if weight:
+        found = shortest_weighted(snapshot, source, target, weight, edge_label, max_hops)
+        return found if found is not None else (None, None)
+    route = shortest_hops(snapshot, source, target, edge_label, max_hops)
+    return route, route_distance(snapshot, route[1], distance_key) if route is not None else None
+
+# Finds the shortest route between two vertices.
+# - Fewest hops by default; with ?weight=dist the smallest total of that edge
+#   property instead. Either way the route has at most max_hops hops and
+#   'distance' is its total ROUTE_DISTANCE_KEY (or weight) along the edges.
+# - Only edge_label edges are followed, in their direction.
+# - 'path' lists the vertices from 'from' to 'to'; 'fields' restricts their
+#   properties.
+# - With the snapshot enabled and holding edge_label edges the search runs in
+#   memory (bidirectional BFS / Dijkstra, see route_search.py) and is exact.
+#   Otherwise a bounded repeat() traversal runs on JanusGraph; its weighted
+#   search only ranks the first ROUTE_CANDIDATES routes it finds.
+# - Raises a 404 when an endpoint does not exist or there is no route.
+@app.get("/routes/shortest", response_model=RouteResponse)
+async def shortest_route(
+    response: Response,
+    from_id: str = Query(..., alias="from"),
+    to_id: str = Query(..., alias="to"),
+    max_hops: int = Query(DEFAULT_ROUTE_HOPS, ge=1, le=MAX_ROUTE_HOPS),
+    weight: Optional[str] = None,
+    edge_label: str = "route",
+    fields: Optional[List[str]] = Depends(get_fields),
+    crud: AsyncGraphCRUDOperations = Depends(get_async_graph_crud_ops),
+):
+    distance_key = weight or ROUTE_DISTANCE_KEY
+    no_route = f"No route from {from_id} to {to_id} within {max_hops} hops."
+    snapshot = current_snapshot()
+    if snapshot is not None and graph_snapshot.covers_edge_label(edge_label):
+        source, target = snapshot.row(from_id), snapshot.row(to_id)
+        # Endpoints missing from the snapshot may be newer than it.
+        if source is not None and target is not None:
+            try:
+                route, distance = await run_in_threadpool(snapshot_route, snapshot, source, target, weight,
+                                                          edge_label, max_hops, distance_key)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            mark_snapshot(response, snapshot)
+            if route is None:
+                raise HTTPException(status_code=404, detail=no_route)
+            rows, edges = route
+            return {"hops": len(edges), "distance": distance, "weight": weight,
+                    "path": [snapshot.vertex_at(row, fields) for row in rows]}
+    try:
+        if from_id == to_id:
+            candidates = [([from_id], [])]
+        else:
+            candidates = await crud.get_route_paths(from_id, to_id, edge_label, max_hops, distance_key,
+                                                    weighted=bool(weight), budget=ROUTE_SEARCH_BUDGET,
+                                                    candidates=ROUTE_CANDIDATES)
+        found = best_route(candidates, weighted=bool(weight))
+        ids = [str(i) for i in found[0]] if found is not None else [from_id, to_id]
+        vertices = await crud.get_vertices_by_ids(ids, fields)
+    except DeadlineExceededError as e:
+        raise deadline_exceeded(e)
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    missing = [vertex_id for vertex_id, vertex in vertices.items() if vertex is None]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Vertex {missing[0]} not found.")
+    if found is None and candidates:
+        raise HTTPException(status_code=400, detail=f"The routes found have no numeric '{weight}' property.")
+    if found is None:
+        raise HTTPException(status_code=404, detail=no_route)
+    return {"hops": len(ids) - 1, "distance": found[1], "weight": weight,
+            "path": [vertices[vertex_id] for vertex_id in ids]}
+
+def _nearby_on_server(lat: float, lon: float, radius_km: float, k: int) -> List[Dict[str, Any]]:
+    with janus_graph_manager.lease() as g:
+        return nearby_from_graph(g, lat, lon, radius_km, k, airport_index.label if airport_index else "airport")
+
+# Finds the k airports closest to a point within radius_km, closest first,
+# each with its 'distance_km'.
+# - Served from the in-memory airport index (see geo_index.py), 'source' is
+#   'index' and 'index' tells where it was built from and how old it is.
+# - While the index is cold (still being built, or disabled) the query runs
+#   on JanusGraph with a lat/lon bounding box instead, 'source' is 'server'.
+@app.get("/airports/nearby")
+async def nearby_airports(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(200.0, gt=0, le=MAX_NEARBY_RADIUS_KM),
+    k: int = Query(10, ge=1, le=MAX_NEARBY_AIRPORTS),
+):
+    index = airport_index.current() if airport_index is not None else None
+    if index is not None:
+        return {"source": "index", "index": index.header(), "airports": index.nearby(lat, lon, radius_km, k)}
+    try:
+        airports = await run_in_threadpool(_nearby_on_server, lat, lon, radius_km, k)
+    except ConnectionUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"source": "server", "index": None, "airports": airports}
+
+# Autocomplete over airport codes, cities and names.
+# - Every word of q must match a word of the airport, the last one as a
+#   prefix ("new yo", "lhr", "egll", "heathrow").
+# - Exact code matches come first, then code prefixes, city and name
+#   matches, each ordered by route degree; 'matched' tells which.
+# - Raises a 503 until the index has been built.
+@app.get("/airports/search")
+async def search_airports(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=MAX_SEARCH_RESULTS),
+):
+    if airport_search is None:
+        raise HTTPException(status_code=404, detail="Airport search is not enabled.")
+    if not airport_search.ready:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="The airport search index has not been built yet.")
+    return {"q": q, "airports": airport_search.index.search(q, limit)}
+
+# State of the search index and of its last resync.
+@app.get("/airports/search/stats")
+async def airport_search_stats():
+    if airport_search is None:
+        return {"enabled": False}
+    return {"enabled": True, **airport_search.status()}
+
 if __name__ == "__main__":
     # "app:app" refers to the 'app' object inside the 'app.py' file
     uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,329 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+import httpx
+from gremlin_python.process.graph_traversal import __
+from gremlin_python.process.traversal import T
+
+if sys.platform.startswith('win'):
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+# End-to-end benchmark of the Air Routes API.
+#
+# Starts the stand-in Gremlin endpoint (gremlin_standin.py) in a child process,
+# seeded with a synthetic air-routes graph, points the API at it and drives the
+# FastAPI app in-process through httpx's ASGI transport, so the numbers cover
+# routing, dependencies, caches, the connection pool, the driver and the wire
+# format, but no HTTP socket. Each scenario is run at every concurrency level
+# for a fixed time after a warm-up; throughput and p50/p95/p99 latency are
+# printed and saved as JSON, tagged with the git commit.
+#
+# Comparing against an earlier result file shows regressions between commits:
+#   python bench_api.py --output before.json
+#   (change something)
+#   python bench_api.py --baseline before.json
+# The exit code is 1 when a case got slower than --tolerance allows.
+#
+# The route scenarios ask GET /routes/shortest for pairs of hubs (the 5% of
+# airports with the most routes) and of remote airports (the 25% with the
+# fewest), by hops and by distance.
+#
+# Requests still in flight when a case's time is up are waited for, each up
+# to --request-timeout seconds; those that take longer count as timeouts. A
+# case in which no request completed is marked FAILED, is never compared
+# with a baseline and makes the exit code 1, so a scenario too slow for the
+# window cannot pass for a result.
+#
+# --url skips the stand-in and uses a running Gremlin Server / JanusGraph
+# instead. --env KEY=VALUE sets API settings before the app is imported. The
+# vertex and label read caches are off unless turned on that way
+# (--env VERTEX_CACHE_ENABLED=1 --env LABEL_CACHE_ENABLED=1): with them on,
+# vertex_by_id and vertices_airport mostly measure cache hits.
+
+# API settings of every run, before the --env ones.
+DEFAULT_SETTINGS = {"VERTEX_CACHE_ENABLED": "0", "LABEL_CACHE_ENABLED": "0"}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(HERE, "bench_results")
+
+
+def route_path(rnd: random.Random, ids: List[Any], weight: str = "") -> str:
+    a, b = rnd.sample(ids, 2)
+    return f"/routes/shortest?from={a}&to={b}" + (f"&weight={weight}" if weight else "")
+
+
+# name -> builds the request path, given a random generator and the airport
+# ids grouped as "all", "hubs" and "remote".
+SCENARIOS: Dict[str, Callable[[random.Random, Dict[str, List[Any]]], str]] = {
+    "vertices": lambda rnd, ids: "/vertices",
+    "vertices_airport": lambda rnd, ids: "/vertices?label=airport",
+    "vertex_by_id": lambda rnd, ids: f"/vertices/{rnd.choice(ids['all'])}",
+    "route_hub_hub": lambda rnd, ids: route_path(rnd, ids["hubs"]),
+    "route_remote_remote": lambda rnd, ids: route_path(rnd, ids["remote"]),
+    "route_dist_hub_hub": lambda rnd, ids: route_path(rnd, ids["hubs"], "dist"),
+    "route_dist_remote_remote": lambda rnd, ids: route_path(rnd, ids["remote"], "dist"),
+}
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+# Starts gremlin_standin.py and waits for it to report that it is listening.
+def start_standin(port: int, airports: int, routes: int, seed: int) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "gremlin_standin.py"), "--port", str(port),
+         "--airports", str(airports), "--routes", str(routes), "--seed", str(seed)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    line = proc.stdout.readline()
+    if not line.startswith("Gremlin stand-in"):
+        proc.kill()
+        raise RuntimeError("Gremlin stand-in failed to start")
+    print(line.strip())
+    return proc
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))] * 1000
+
+
+async def run_case(client: httpx.AsyncClient, scenario: str, ids: Dict[str, List[Any]], concurrency: int,
+                   duration: float, warmup: float, seed: int, request_timeout: float) -> Dict[str, Any]:
+    make_path = SCENARIOS[scenario]
+    latencies: List[float] = []
+    errors = 0
+    timeouts = 0
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    async def worker(n: int):
+        nonlocal errors, timeouts
+        rnd = random.Random(seed * 1000 + n)
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= deadline:
+                return
+            timed_out = False
+            try:
+                response = await asyncio.wait_for(client.get(make_path(rnd, ids)), request_timeout)
+                failed = response.status_code >= 400
+            except asyncio.TimeoutError:
+                failed = timed_out = True
+            except Exception:
+                failed = True
+            # Counted when answered inside the window, or after it: a request
+            # slower than the warm-up still shows up.
+            if time.perf_counter() >= measure_from:
+                if timed_out:
+                    timeouts += 1
+                elif failed:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - t0)
+
+    # Also waits for the requests still in flight at the deadline, so the
+    # time counted is until the last of them was answered.
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - measure_from
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "failed": not latencies,
+        "requests": len(latencies) + errors + timeouts,
+        "errors": errors,
+        "timeouts": timeouts,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    # The app reads its settings from the environment at import time.
+    import app as api
+
+    results = []
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+            ids = await airport_groups(api.janus_graph_manager)
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    result = await run_case(client, scenario, ids, concurrency, args.duration, args.warmup,
+                                            args.seed, args.request_timeout)
+                    print_row(result)
+                    results.append(result)
+    return results
+
+
+# Airport ids, all of them and the hubs / remote ones by number of routes.
+async def airport_groups(manager) -> Dict[str, List[Any]]:
+    def degrees():
+        with manager.lease() as g:
+            return (g.V().hasLabel("airport").project("id", "routes")
+                    .by(T.id).by(__.outE("route").count()).toList())
+
+    rows = sorted(await asyncio.get_running_loop().run_in_executor(None, degrees),
+                  key=lambda r: r["routes"], reverse=True)
+    if len(rows) < 2:
+        raise RuntimeError("The graph has too few airports to look up")
+    ids = [r["id"] for r in rows]
+    connected = [r["id"] for r in rows if r["routes"] > 0]
+    return {
+        "all": ids,
+        "hubs": connected[:max(2, len(ids) // 20)],
+        "remote": connected[-max(2, len(ids) // 4):],
+    }
+
+
+def print_header():
+    print(f"{'scenario':<26}{'conc':>5}{'requests':>10}{'errors':>8}{'timeouts':>9}{'rps':>10}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+
+
+def print_row(r: Dict[str, Any]):
+    print(f"{r['scenario']:<26}{r['concurrency']:>5}{r['requests']:>10}{r['errors']:>8}{r['timeouts']:>9}"
+          f"{r['throughput_rps']:>10.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}{r['max_ms']:>9.2f}"
+          f"{'  FAILED' if r['failed'] else ''}")
+
+
+# Prints the change of every case against the baseline file and returns the
+# cases that lost more than `tolerance` throughput or gained more than
+# `tolerance` p99 latency. Failed cases, on either side, are not compared.
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float,
+            settings: Dict[str, str]) -> List[str]:
+    before = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"\nAgainst {baseline.get('commit', '?')}:")
+    if baseline.get("config", {}).get("settings") != settings:
+        print(f"  (run with other API settings: {baseline.get('config', {}).get('settings')})")
+    for r in results:
+        b = before.get((r["scenario"], r["concurrency"]))
+        if b is None or r["failed"] or b.get("failed") or not b["throughput_rps"] or not b["p99_ms"]:
+            continue
+        rps = r["throughput_rps"] / b["throughput_rps"] - 1
+        p99 = r["p99_ms"] / b["p99_ms"] - 1
+        slower = rps < -tolerance or p99 > tolerance
+        name = f"{r['scenario']}@{r['concurrency']}"
+        print(f"  {name:<32} rps {rps:+7.1%}  p99 {p99:+7.1%}{'  REGRESSION' if slower else ''}")
+        if slower:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Air Routes API end-to-end benchmark")
+    parser.add_argument("--url", help="use this Gremlin endpoint instead of starting the stand-in")
+    parser.add_argument("--airports", type=int, default=1000, help="synthetic graph size")
+    parser.add_argument("--routes", type=int, default=8, help="synthetic routes per airport")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--serializer", default="graphbinary")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda s: [x for x in s.split(",") if x])
+    parser.add_argument("--concurrency", default="1,8,32", type=lambda s: [int(x) for x in s.split(",")])
+    parser.add_argument("--duration", type=float, default=5.0, help="measured seconds per case")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unmeasured seconds before each case")
+    parser.add_argument("--request-timeout", type=float, default=30.0,
+                        help="seconds after which a request counts as a timeout")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="API setting")
+    parser.add_argument("--output", help="result file (default bench_results/api-<commit>-<time>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    standin = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        standin = start_standin(port, args.airports, args.routes, args.seed)
+        url = f"ws://localhost:{port}/gremlin"
+
+    settings = {"JANUSGRAPH_URL": url, "JANUSGRAPH_SERIALIZER": args.serializer, **DEFAULT_SETTINGS}
+    settings.update(kv.split("=", 1) for kv in args.env)
+    os.environ.update(settings)
+
+    caches = [name for name in DEFAULT_SETTINGS if settings[name].strip().lower() in ("1", "true", "yes", "on")]
+    print(f"Read caches on: {', '.join(caches)} (vertex_by_id and vertices_airport measure cache hits)"
+          if caches else "Read caches off")
+    try:
+        print_header()
+        results = asyncio.run(run_benchmark(args))
+    finally:
+        if standin is not None:
+            standin.terminate()
+            standin.wait()
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "standin": standin is not None,
+            "airports": args.airports,
+            "routes": args.routes,
+            "seed": args.seed,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "settings": {k: v for k, v in settings.items() if k != "JANUSGRAPH_URL"},
+            "request_timeout": args.request_timeout,
+        },
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"api-{commit}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+    failed = [f"{r['scenario']}@{r['concurrency']}" for r in results if r["failed"]]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance, report["config"]["settings"])
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline: {', '.join(regressions)}")
+    if failed:
+        print(f"\n{len(failed)} case(s) without a single completed request: {', '.join(failed)}")
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any
+
+from janusgraph_manager import janus_graph_manager
+from janusgraph_crud import GraphCRUDOperations
+from janusgraph_async_crud import AsyncGraphCRUDOperations
+
+if sys.platform.startswith('win'):
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+# Compares the two ways the API can run a vertex lookup:
+#  - threadpool: what a plain `def` handler does, every in-flight request
+#    occupies a worker thread blocked in .toList() / .next().
+#  - async: what the `async def` handlers do, requests await promise() on the
+#    event loop and only the driver's own executor threads are used.
+# Both paths share the same connection pool, so the difference measured is the
+# cost of the waiting model. Reports throughput, latency and peak thread count.
+
+
+# Samples threading.active_count() in the background and keeps the maximum.
+class ThreadSampler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def summarize(name: str, latencies: List[float], elapsed: float, peak_threads: int, errors: int) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+    return {
+        "path": name,
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+        "peak_threads": peak_threads,
+    }
+
+
+def run_threadpool(vertex_id: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one():
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            with janus_graph_manager.lease() as g:
+                GraphCRUDOperations(g).get_vertex_by_id(vertex_id)
+        except RuntimeError:
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(requests):
+                executor.submit(one)
+        elapsed = time.perf_counter() - start
+    return summarize("threadpool", latencies, elapsed, sampler.peak, errors)
+
+
+async def run_async(vertex_id: str, requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                async with janus_graph_manager.lease_async() as g:
+                    await AsyncGraphCRUDOperations(g).get_vertex_by_id(vertex_id)
+            except RuntimeError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+    return summarize("async", latencies, elapsed, sampler.peak, errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Threadpool vs async CRUD benchmark")
+    parser.add_argument("--url", default="ws://localhost:8182/gremlin")
+    parser.add_argument("--vertex-id", required=True, help="id of an existing vertex to look up")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=8)
+    args = parser.parse_args()
+
+    asyncio.run(janus_graph_manager.connect(args.url, min_size=args.pool_size, max_size=args.pool_size))
+    try:
+        results = [
+            run_threadpool(args.vertex_id, args.requests, args.concurrency),
+            asyncio.run(run_async(args.vertex_id, args.requests, args.concurrency)),
+        ]
+    finally:
+        janus_graph_manager.close()
+
+    print(f"{'path':<12}{'req/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}{'threads':>10}{'errors':>8}")
+    for r in results:
+        print(f"{r['path']:<12}{r['throughput_rps']:>10.1f}{r['mean_ms']:>10.2f}{r['p50_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{r['peak_threads']:>10}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
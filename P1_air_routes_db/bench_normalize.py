@@ -0,0 +1,59 @@
+import argparse
+import random
+import timeit
+from typing import Any, Dict, List
+
+from gremlin_python.process.traversal import T
+
+from janusgraph_crud import normalize_result, normalize_results, normalize_columns
+
+# Micro-benchmark of the result normalizers over synthetic valueMap(True)
+# output shaped like the air-routes data: T.id / T.label keys, single-valued
+# properties wrapped in one-element lists and the odd multi-valued property.
+# Compares the per-row normalize_result loop the API used to run with the bulk
+# normalize_results and the columnar normalize_columns. No server needed.
+
+AIRPORT_KEYS = ['code', 'icao', 'city', 'desc', 'region', 'runways', 'longest', 'elev', 'country', 'lat', 'lon', 'type']
+COUNTRY_KEYS = ['code', 'desc', 'type']
+
+
+def synthetic_rows(n: int, seed: int = 42) -> List[Dict[Any, Any]]:
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(n):
+        if i % 20 == 0:
+            row = {T.id: i, T.label: 'country'}
+            row.update({k: [f"{k}-{i}"] for k in COUNTRY_KEYS})
+        else:
+            row = {T.id: i, T.label: 'airport'}
+            row.update({k: [rnd.random()] for k in AIRPORT_KEYS})
+            if i % 50 == 0:
+                row['alias'] = [f"A{i}", f"B{i}"]
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="normalize_result micro-benchmark")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.rows)
+    assert normalize_results(rows) == [normalize_result(r) for r in rows]
+
+    candidates = {
+        "normalize_result (per row)": lambda: [normalize_result(r) for r in rows],
+        "normalize_results (bulk)": lambda: normalize_results(rows),
+        "normalize_columns (columnar)": lambda: normalize_columns(rows),
+    }
+    baseline = None
+    print(f"{'variant':<32}{'ms':>10}{'rows/s':>14}{'speedup':>10}")
+    for name, fn in candidates.items():
+        seconds = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        baseline = baseline or seconds
+        print(f"{name:<32}{seconds * 1000:>10.2f}{args.rows / seconds:>14,.0f}{baseline / seconds:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import List
+
+from gremlin_python.process.traversal import T, Order
+
+from janusgraph_manager import janus_graph_manager
+from janusgraph_crud import GraphCRUDOperations, encode_cursor
+
+if sys.platform.startswith('win'):
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+# Measures how the latency of fetching one page grows with page depth for
+#  - offset paging: order().by(T.id).range(offset, offset + n), the server has
+#    to produce and skip every vertex before the requested page;
+#  - keyset paging: GraphCRUDOperations.get_vertex_page with the cursor of the
+#    previous page, the server filters on id > last id and takes the top n.
+# The cursor for a deep keyset page is derived from the id found at that
+# position (not timed), so both variants fetch exactly the same page.
+
+
+def time_calls(fn, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keyset vs offset pagination benchmark")
+    parser.add_argument("--url", default="ws://localhost:8182/gremlin")
+    parser.add_argument("--label", default="airport")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 50, 100, 200])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(janus_graph_manager.connect(args.url, min_size=1, max_size=1))
+    n = args.page_size
+    print(f"{'page':>6}{'offset':>10}{'offset ms':>12}{'keyset ms':>12}")
+    try:
+        with janus_graph_manager.lease() as g:
+            crud = GraphCRUDOperations(g)
+            base = g.V().hasLabel(args.label) if args.label else g.V()
+            total = base.clone().count().next()
+            for page in args.pages:
+                offset = (page - 1) * n
+                if offset >= total:
+                    print(f"{page:>6}{offset:>10}  beyond the {total} vertices, skipped")
+                    continue
+
+                def offset_page():
+                    return base.clone().order().by(T.id, Order.asc).range_(offset, offset + n).valueMap(True).toList()
+
+                cursor = None
+                if offset:
+                    last_id = base.clone().order().by(T.id, Order.asc).range_(offset - 1, offset).id_().next()
+                    cursor = encode_cursor(last_id)
+
+                def keyset_page():
+                    return crud.get_vertex_page(args.label, n, cursor)
+
+                offset_ms = statistics.median(time_calls(offset_page, args.repeat))
+                keyset_ms = statistics.median(time_calls(keyset_page, args.repeat))
+                print(f"{page:>6}{offset:>10}{offset_ms:>12.2f}{keyset_ms:>12.2f}")
+    finally:
+        janus_graph_manager.close()
+
+
+if __name__ == "__main__":
+    main()
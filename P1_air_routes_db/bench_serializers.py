@@ -0,0 +1,116 @@
+import argparse
+import json
+import struct
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+from gremlin_python.driver.request import RequestMessage
+from gremlin_python.process.traversal import T, Traverser
+from gremlin_python.structure.graph import Graph
+from gremlin_python.structure.io import graphbinaryV1, graphsonV2d0, graphsonV3d0
+
+from janusgraph_manager import SERIALIZERS, make_serializer
+from bench_normalize import synthetic_rows
+
+# Compares the wire formats the manager can be configured with (see
+# janusgraph_manager.SERIALIZERS) on the kind of data the API moves around:
+# valueMap(True) maps of air-routes vertices. For every format it measures
+#  - the size of the request for a g.V().hasLabel('airport').valueMap(True)
+#    traversal and the time to encode it,
+#  - the bytes of the response frames the server would send for the result
+#    (one frame per batch of --batch-size results, like the server's
+#    resultIterationBatchSize) and how long the driver takes to decode them.
+# Response frames are produced with gremlin-python's own writers; their encode
+# time is reported too, as a rough proxy of the server side cost. No server is
+# needed, the numbers only depend on the payload.
+
+GRAPHBINARY_VERSION = 0x81
+
+
+def _graphbinary_response(writer: graphbinaryV1.GraphBinaryWriter, data: List[Any]) -> bytes:
+    buf = bytearray([GRAPHBINARY_VERSION])
+    graphbinaryV1.UuidIO.dictify(uuid.uuid4(), writer, buf, as_value=True, nullable=True)
+    buf.extend(struct.pack(">i", 200))
+    graphbinaryV1.StringIO.dictify("", writer, buf, as_value=True, nullable=True)
+    graphbinaryV1.MapIO.dictify({}, writer, buf, as_value=True, nullable=False)
+    graphbinaryV1.MapIO.dictify({}, writer, buf, as_value=True, nullable=False)
+    writer.to_dict(data, buf)
+    return bytes(buf)
+
+
+def _graphson_response(writer, data: List[Any]) -> bytes:
+    message = {
+        "requestId": str(uuid.uuid4()),
+        "status": {"code": 200, "message": "", "attributes": {}},
+        "result": {"data": writer.to_dict(data), "meta": {}},
+    }
+    return json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+
+# GraphSON 2 has no typed maps, so the server writes T.id / T.label keys as
+# the plain strings 'id' / 'label'. The payload is adapted the same way.
+def _string_keys(row: Dict[Any, Any]) -> Dict[str, Any]:
+    return {(k.name if isinstance(k, T) else k): v for k, v in row.items()}
+
+
+def response_encoders() -> Dict[str, Callable[[List[Any]], bytes]]:
+    gb = graphbinaryV1.GraphBinaryWriter()
+    gs3 = graphsonV3d0.GraphSONWriter()
+    gs2 = graphsonV2d0.GraphSONWriter()
+    return {
+        "graphbinary": lambda data: _graphbinary_response(gb, data),
+        "graphsonv3": lambda data: _graphson_response(gs3, data),
+        "graphsonv2": lambda data: _graphson_response(
+            gs2, [Traverser(_string_keys(t.object), t.bulk) for t in data]),
+    }
+
+
+# serialize_message rewrites the args of the message it is given, so every
+# call gets a fresh one.
+def valuemap_request() -> RequestMessage:
+    bytecode = Graph().traversal().V().hasLabel('airport').valueMap(True).bytecode
+    return RequestMessage(processor='traversal', op='bytecode',
+                          args={'gremlin': bytecode, 'aliases': {'g': 'g'}})
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GraphBinary vs GraphSON serializer benchmark")
+    parser.add_argument("--rows", type=int, default=20000, help="vertices in the result")
+    parser.add_argument("--batch-size", type=int, default=64, help="results per response frame")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    traversers = [Traverser(row, 1) for row in synthetic_rows(args.rows)]
+    frames = [traversers[i:i + args.batch_size] for i in range(0, len(traversers), args.batch_size)]
+    encoders = response_encoders()
+
+    print(f"{'format':<13}{'req B':>8}{'req us':>9}{'resp MB':>10}{'B/row':>8}"
+          f"{'encode ms':>11}{'decode ms':>11}{'decode rows/s':>15}")
+    for name in SERIALIZERS:
+        serializer = make_serializer(name)
+        request_bytes = serializer.serialize_message(str(uuid.uuid4()), valuemap_request())
+        request_us = timed(lambda: serializer.serialize_message(str(uuid.uuid4()), valuemap_request()),
+                           args.repeat * 100) * 1e6
+
+        encode = encoders[name]
+        payload = [encode(frame) for frame in frames]
+        size = sum(len(p) for p in payload)
+        encode_s = timed(lambda: [encode(frame) for frame in frames], args.repeat)
+        decode_s = timed(lambda: [serializer.deserialize_message(p) for p in payload], args.repeat)
+
+        print(f"{name:<13}{len(request_bytes):>8}{request_us:>9.1f}{size / 1e6:>10.2f}{size / args.rows:>8.0f}"
+              f"{encode_s * 1000:>11.1f}{decode_s * 1000:>11.1f}{args.rows / decode_s:>15,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from typing import Any, Dict, List
+
+from janusgraph_manager import janus_graph_manager
+from janusgraph_crud import VertexUpsert, EdgeUpsert
+from write_queue import WriteBehindQueue
+
+if sys.platform.startswith('win'):
+    asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+# Measures the write-behind queue at different max batch sizes: `concurrency`
+# writers each upsert one element at a time, the way API clients calling
+# POST /vertices and POST /edges do, and the queue groups their writes into
+# traversals of up to batch-size elements. For every batch size a fresh set
+# of vertices is written, then a chain of edges between them, then the same
+# vertices again (matched, not created). Reports elements/sec, the latency
+# until each write was acknowledged and the batches actually sent.
+
+
+def summarize(name: str, batch_size: int, latencies: List[float], elapsed: float, errors: int,
+              queue: WriteBehindQueue, batches_before: int, written_before: int) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    def pct(p: float) -> float:
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+    batches = queue.batches - batches_before
+    return {
+        "phase": name,
+        "batch_size": batch_size,
+        "elements": len(latencies) + errors,
+        "errors": errors,
+        "elements_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": pct(0.50),
+        "p99_ms": pct(0.99),
+        "batches": batches,
+        "average_batch": (queue.written - written_before) / batches if batches else 0.0,
+    }
+
+
+async def run_phase(name: str, queue: WriteBehindQueue, writes: List[Any], concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    ids: List[Any] = [None] * len(writes)
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    batches_before, written_before = queue.batches, queue.written
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ids[i] = (await queue.submit([writes[i]]))[0]
+            except RuntimeError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(len(writes))))
+    elapsed = time.perf_counter() - start
+    result = summarize(name, queue.max_batch_size, latencies, elapsed, errors, queue, batches_before, written_before)
+    result["ids"] = ids
+    return result
+
+
+async def run_batch_size(batch_size: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    queue = WriteBehindQueue(janus_graph_manager, max_batch_size=batch_size, max_linger=args.linger_ms / 1000.0,
+                             max_in_flight=args.in_flight)
+    await queue.start()
+    try:
+        run = uuid.uuid4().hex[:8]
+        vertices = [VertexUpsert(args.label, {"code": f"{run}-{i}"}, {"city": f"Bench {i}"})
+                    for i in range(args.elements)]
+        created = await run_phase("create", queue, vertices, args.concurrency)
+        ids = [i for i in created.pop("ids") if i is not None]
+        edges = [EdgeUpsert(args.edge_label, ids[i], ids[i + 1], {"dist": i}) for i in range(len(ids) - 1)]
+        linked = await run_phase("edges", queue, edges, args.concurrency)
+        linked.pop("ids")
+        matched = await run_phase("upsert", queue, vertices, args.concurrency)
+        matched.pop("ids")
+    finally:
+        await queue.stop()
+    return [created, linked, matched]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write-behind queue throughput by batch size")
+    parser.add_argument("--url", default="ws://localhost:8182/gremlin")
+    parser.add_argument("--batch-sizes", default="1,10,50,100,500", help="comma-separated max batch sizes")
+    parser.add_argument("--elements", type=int, default=2000, help="vertices written per batch size")
+    parser.add_argument("--concurrency", type=int, default=500, help="writers waiting at the same time")
+    parser.add_argument("--linger-ms", type=float, default=5.0)
+    parser.add_argument("--in-flight", type=int, default=4, help="batches sent at the same time")
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--label", default="bench_airport")
+    parser.add_argument("--edge-label", default="bench_route")
+    args = parser.parse_args()
+
+    asyncio.run(janus_graph_manager.connect(args.url, min_size=args.pool_size, max_size=args.pool_size))
+    results = []
+    try:
+        for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+            results += asyncio.run(run_batch_size(batch_size, args))
+    finally:
+        janus_graph_manager.close()
+
+    print(f"{'batch':>6} {'phase':<8}{'elem/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}"
+          f"{'batches':>9}{'avg':>8}{'errors':>8}")
+    for r in results:
+        print(f"{r['batch_size']:>6} {r['phase']:<8}{r['elements_per_s']:>10.1f}{r['mean_ms']:>10.2f}"
+              f"{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}{r['batches']:>9}{r['average_batch']:>8.1f}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
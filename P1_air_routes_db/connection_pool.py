@@ -0,0 +1,469 @@
+import asyncio
+import queue
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from gremlin_python.structure.graph import Graph
+from gremlin_python.driver.driver_remote_connection import DriverRemoteConnection
+from gremlin_python.process.graph_traversal import GraphTraversalSource
+
+from deadlines import DeadlineExceededError, current_deadline
+
+# Health states a pooled connection can be in. A connection starts HEALTHY,
+# becomes UNHEALTHY when a traversal on it fails with a transport level error
+# (socket closed, connection reset ...) and is then closed and replaced the
+# next time the pool looks at it instead of being handed out again.
+HEALTHY = "healthy"
+UNHEALTHY = "unhealthy"
+
+# Longest the close of a connection waits for a response still on its way
+# (a traversal abandoned at its deadline) before closing the websocket.
+CLOSE_DRAIN_TIMEOUT = 30.0
+
+# Returned by ConnectionPool._try_lease_locked when the caller has reserved a
+# slot and should open a new connection outside the lock.
+_OPEN_NEW = object()
+
+
+# Raised when no connection can be handed out: the pool is closed, not set up
+# yet, or every connection stayed busy for the whole lease timeout. It is a
+# RuntimeError like every other failure of this layer; the API maps it to 503
+# Service Unavailable instead of treating it as a failed query.
+class ConnectionUnavailableError(RuntimeError):
+    pass
+
+
+def _resolve_waiter(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+# Walks the exception chain (__cause__ / __context__) looking for an OSError.
+# Errors reported by the Gremlin Server itself (bad traversal, vertex not
+# found ...) arrive as GremlinServerError and leave the websocket usable, so
+# only network level failures should mark a connection as unhealthy. The CRUD
+# layer re-raises everything as RuntimeError, which is why the chain is walked.
+def is_connection_error(exc: Optional[BaseException]) -> bool:
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, OSError):
+            return True
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+# Whether a connection leased when exc was raised must be replaced rather
+# than handed out again: on a transport level failure, and when the caller
+# gave up on a traversal still in flight on it (a missed deadline, or a
+# cancelled request), since the driver would make the next traversal wait
+# for the abandoned response.
+def must_replace(exc: Optional[BaseException]) -> bool:
+    if isinstance(exc, asyncio.CancelledError):
+        return True
+    if isinstance(exc, DeadlineExceededError):
+        return exc.abandoned
+    return is_connection_error(exc)
+
+
+# One entry of the pool: the DriverRemoteConnection, the traversal source bound
+# to it and the bookkeeping the pool needs to decide whether the connection can
+# be leased, must be replaced or has been idle long enough to be evicted.
+class PooledConnection:
+    def __init__(self, connection: DriverRemoteConnection):
+        self.connection = connection
+        self.g: GraphTraversalSource = Graph().traversal().withRemote(connection)
+        self.state = HEALTHY
+        self.in_use = False
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.lease_count = 0
+        # Set by a LoadBalancer: the Endpoint the connection was leased from
+        # and when.
+        self.endpoint = None
+        self.leased_at: Optional[float] = None
+
+    def is_usable(self) -> bool:
+        return self.state == HEALTHY and not self.connection.is_closed()
+
+    # The driver closes its websocket by running an event loop of its own,
+    # which cannot be done from a thread that is already running one (a
+    # release() from the async CRUD path), so the close is handed to a
+    # short-lived thread there. That thread first lets a response still in
+    # flight arrive, so the driver is not torn down under its own receive.
+    def close(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._close()
+        else:
+            threading.Thread(target=self._close, args=(CLOSE_DRAIN_TIMEOUT,), daemon=True).start()
+
+    def _close(self, drain_timeout: float = 0.0):
+        try:
+            if drain_timeout:
+                self._drain(drain_timeout)
+            self.connection.close()
+        except Exception:
+            # The connection is being thrown away, a failure to close it
+            # cleanly must not break the caller that is replacing it.
+            pass
+
+    # The driver puts its websocket back in its own queue once the last
+    # response frame is in; waiting for it there waits for that response.
+    def _drain(self, timeout: float):
+        sockets = self.connection._client._pool
+        try:
+            socket = sockets.get(timeout=timeout)
+        except queue.Empty:
+            return
+        sockets.put_nowait(socket)
+
+
+# The ConnectionPool Class
+# Keeps between min_size and max_size DriverRemoteConnection objects, each one
+# with its own websocket, and leases them out one request at a time. Callers
+# that find every connection busy wait (up to lease_timeout seconds) for one to
+# be returned. Connections above min_size that sit idle for longer than
+# idle_timeout seconds are closed so a burst of traffic does not keep sockets
+# open forever. All state is guarded by a single Condition because FastAPI
+# runs sync dependencies on a threadpool.
+class ConnectionPool:
+    def __init__(
+        self,
+        factory: Callable[[], DriverRemoteConnection],
+        min_size: int = 2,
+        max_size: int = 8,
+        idle_timeout: float = 300.0,
+        lease_timeout: float = 10.0,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.lease_timeout = lease_timeout
+
+        self._lock = threading.Condition()
+        self._connections: List[PooledConnection] = []
+        # Number of connections currently being opened outside the lock. They
+        # count towards max_size so concurrent callers cannot overshoot it.
+        self._opening = 0
+        self._closed = False
+        # (event loop, future) pairs of coroutines waiting in acquire_async().
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        # Connections taken out of the pool but not closed yet. Closing one can
+        # block on the driver, so it happens after the lock is released, see
+        # _close_discarded().
+        self._discarded: List[PooledConnection] = []
+
+        # Utilization counters, read through stats().
+        self._total_leases = 0
+        self._total_waits = 0
+        self._total_wait_time = 0.0
+        self._lease_timeouts = 0
+        self._opened = 0
+        self._evicted = 0
+        self._replaced = 0
+
+    # Opens min_size connections up front so the first requests do not pay
+    # the websocket handshake. Any failure closes what was already opened.
+    def fill(self):
+        try:
+            while len(self._connections) < self.min_size:
+                self._connections.append(self._open())
+        except Exception:
+            self.close()
+            raise
+
+    def _open(self) -> PooledConnection:
+        pooled = PooledConnection(self._factory())
+        self._opened += 1
+        return pooled
+
+    # Leases a connection for exclusive use. An idle healthy connection is
+    # preferred; unusable ones found on the way are dropped; a new one is
+    # opened when the pool is below max_size; otherwise the caller waits for
+    # release() to notify it.
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        timeout, bounded = self._lease_timeout(timeout)
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        try:
+            with self._lock:
+                while True:
+                    pooled = self._try_lease_locked(start, waited)
+                    if pooled is _OPEN_NEW:
+                        break
+                    if pooled is not None:
+                        return pooled
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._raise_lease_timeout(timeout, bounded)
+                    waited = True
+                    self._lock.wait(remaining)
+        finally:
+            self._close_discarded()
+
+        # Open the websocket without holding the lock so other callers can
+        # keep leasing and returning connections in the meantime.
+        return self._open_and_lease(start, waited)
+
+    # The asyncio flavour of acquire(). Waiting callers park on a future that
+    # release() resolves from whichever thread returns a connection, so a
+    # request waiting for the pool costs no thread. Opening a new websocket
+    # blocks, so that part runs on the default executor. When the caller is
+    # cancelled meanwhile (the losing attempt of a hedged read, see
+    # LoadBalancer) the open still completes; the connection it leased then
+    # goes straight back to the pool instead of staying leased forever.
+    async def acquire_async(self, timeout: Optional[float] = None) -> PooledConnection:
+        timeout, bounded = self._lease_timeout(timeout)
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        deadline = start + timeout
+        waited = False
+        while True:
+            try:
+                with self._lock:
+                    pooled = self._try_lease_locked(start, waited)
+                    if pooled is None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._raise_lease_timeout(timeout, bounded)
+                        waiter = loop.create_future()
+                        self._async_waiters.append((loop, waiter))
+            finally:
+                self._close_discarded()
+            if pooled is _OPEN_NEW:
+                opening = loop.run_in_executor(None, self._open_and_lease, start, waited)
+                try:
+                    return await asyncio.shield(opening)
+                except asyncio.CancelledError:
+                    opening.add_done_callback(self._release_abandoned)
+                    raise
+            if pooled is not None:
+                return pooled
+            waited = True
+            try:
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # A wake-up meant for us must not get lost with the request.
+                with self._lock:
+                    self._notify_locked()
+                raise
+            finally:
+                with self._lock:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    # Done callback of an open whose caller was cancelled: the connection was
+    # leased for nobody, so it is returned right away.
+    def _release_abandoned(self, opening: asyncio.Future):
+        if opening.cancelled() or opening.exception() is not None:
+            return
+        self.release(opening.result())
+
+    # Returns an idle healthy connection marked as leased, _OPEN_NEW when the
+    # caller has reserved a slot to open a new connection, or None when the
+    # pool is exhausted. Must be called with the lock held.
+    def _try_lease_locked(self, start: float, waited: bool):
+        if self._closed:
+            raise ConnectionUnavailableError("Connection pool is closed.")
+
+        for pooled in list(self._connections):
+            if pooled.in_use:
+                continue
+            if not pooled.is_usable():
+                self._discard(pooled)
+                self._replaced += 1
+                continue
+            return self._lease(pooled, start, waited)
+
+        if len(self._connections) + self._opening < self.max_size:
+            self._opening += 1
+            return _OPEN_NEW
+        return None
+
+    # How long a lease may wait: timeout (lease_timeout by default), cut
+    # short by the deadline of the request when that comes first, in which
+    # case bounded is True.
+    def _lease_timeout(self, timeout: Optional[float]) -> Tuple[float, bool]:
+        timeout = self.lease_timeout if timeout is None else timeout
+        request_deadline = current_deadline()
+        if request_deadline is not None and request_deadline.remaining() < timeout:
+            return request_deadline.remaining(), True
+        return timeout, False
+
+    def _raise_lease_timeout(self, timeout: float, bounded: bool = False):
+        self._lease_timeouts += 1
+        if bounded:
+            raise DeadlineExceededError(
+                f"Deadline exceeded after {timeout * 1000:.0f} ms waiting for a JanusGraph connection."
+            )
+        raise ConnectionUnavailableError(
+            f"Timed out after {timeout:.1f}s waiting for a JanusGraph connection "
+            f"(pool size {self.max_size})."
+        )
+
+    def _open_and_lease(self, start: float, waited: bool) -> PooledConnection:
+        try:
+            pooled = self._open()
+        except Exception as e:
+            with self._lock:
+                self._opening -= 1
+                self._notify_locked()
+            raise RuntimeError(f"Failed to open JanusGraph connection: {e}")
+        with self._lock:
+            self._opening -= 1
+            self._connections.append(pooled)
+            return self._lease(pooled, start, waited)
+
+    # Wakes one thread blocked in acquire() and one coroutine parked in
+    # acquire_async(). Whoever loses the race simply goes back to waiting.
+    def _notify_locked(self):
+        self._lock.notify()
+        while self._async_waiters:
+            loop, waiter = self._async_waiters.pop(0)
+            if not waiter.done():
+                loop.call_soon_threadsafe(_resolve_waiter, waiter)
+                break
+
+    def _lease(self, pooled: PooledConnection, start: float, waited: bool) -> PooledConnection:
+        pooled.in_use = True
+        pooled.lease_count += 1
+        self._total_leases += 1
+        if waited:
+            self._total_waits += 1
+            self._total_wait_time += time.monotonic() - start
+        return pooled
+
+    # Returns a leased connection. Passing failed=True marks it unhealthy so
+    # it is closed instead of being leased again. Idle eviction piggybacks on
+    # release so no background thread is needed.
+    def release(self, pooled: PooledConnection, failed: bool = False):
+        with self._lock:
+            pooled.in_use = False
+            pooled.last_used = time.monotonic()
+            if failed:
+                pooled.state = UNHEALTHY
+            if self._closed or pooled.state != HEALTHY:
+                if pooled.state != HEALTHY:
+                    self._replaced += 1
+                self._discard(pooled)
+            self._evict_idle_locked()
+            self._notify_locked()
+        self._close_discarded()
+
+    # Context manager around acquire()/release() that marks the connection
+    # unhealthy when the body fails in a way that leaves it unusable, see
+    # must_replace().
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        pooled = self.acquire(timeout)
+        failed = False
+        try:
+            yield pooled.g
+        except BaseException as e:
+            failed = must_replace(e)
+            raise
+        finally:
+            self.release(pooled, failed=failed)
+
+    # async with pool.lease_async() as g: ... is the asyncio flavour of lease().
+    @asynccontextmanager
+    async def lease_async(self, timeout: Optional[float] = None):
+        pooled = await self.acquire_async(timeout)
+        failed = False
+        try:
+            yield pooled.g
+        except BaseException as e:
+            failed = must_replace(e)
+            raise
+        finally:
+            self.release(pooled, failed=failed)
+
+    # Closes idle connections above min_size that have not been used for
+    # idle_timeout seconds. Returns how many were closed.
+    def evict_idle(self) -> int:
+        with self._lock:
+            evicted = self._evict_idle_locked()
+        self._close_discarded()
+        return evicted
+
+    def _evict_idle_locked(self) -> int:
+        now = time.monotonic()
+        evicted = 0
+        for pooled in list(self._connections):
+            if len(self._connections) <= self.min_size:
+                break
+            if not pooled.in_use and now - pooled.last_used >= self.idle_timeout:
+                self._discard(pooled)
+                self._evicted += 1
+                evicted += 1
+        return evicted
+
+    # Takes the connection out of the pool. Must be called with the lock
+    # held; the connection is closed by _close_discarded() once it is free.
+    def _discard(self, pooled: PooledConnection):
+        if pooled in self._connections:
+            self._connections.remove(pooled)
+        self._discarded.append(pooled)
+
+    def _close_discarded(self):
+        with self._lock:
+            discarded, self._discarded = self._discarded, []
+        for pooled in discarded:
+            pooled.close()
+
+    # Any healthy connection's traversal source, without leasing it. The
+    # driver can multiplex requests over one connection, so this is safe for
+    # scripts and one-off calls; request handlers should use lease().
+    def any_g(self) -> GraphTraversalSource:
+        with self._lock:
+            usable = [p for p in self._connections if p.is_usable()]
+            if usable:
+                # Prefer a connection nobody has leased right now.
+                return min(usable, key=lambda p: p.in_use).g
+        pooled = self.acquire()
+        self.release(pooled)
+        return pooled.g
+
+    # Snapshot of the pool's utilization counters.
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_use = sum(1 for p in self._connections if p.in_use)
+            unhealthy = sum(1 for p in self._connections if p.state != HEALTHY)
+            size = len(self._connections)
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": size,
+                "in_use": in_use,
+                "idle": size - in_use,
+                "unhealthy": unhealthy,
+                "utilization": in_use / self.max_size,
+                "total_leases": self._total_leases,
+                "total_waits": self._total_waits,
+                "avg_wait_ms": (self._total_wait_time / self._total_waits * 1000) if self._total_waits else 0.0,
+                "lease_timeouts": self._lease_timeouts,
+                "opened": self._opened,
+                "evicted": self._evicted,
+                "replaced": self._replaced,
+            }
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            for pooled in list(self._connections):
+                if not pooled.in_use:
+                    self._discard(pooled)
+            self._lock.notify_all()
+            for loop, waiter in self._async_waiters:
+                loop.call_soon_threadsafe(_resolve_waiter, waiter)
+            self._async_waiters.clear()
+        self._close_discarded()
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Iterator, Optional
+
+# Request deadlines.
+#
+# Without a bound, one runaway traversal (a GET /vertices without a label on
+# a big graph) holds a pooled connection for as long as the server takes,
+# and every request queued behind it waits too. A Deadline is the point in
+# time by which a request must be answered; the API sets one per request
+# (see app.py) and everything underneath reads it from a context variable,
+# so it does not have to be threaded through every call:
+#  - ConnectionPool.acquire*() waits for a free connection only until the
+#    deadline;
+#  - AsyncGraphCRUDOperations sends the time left as the request's
+#    evaluationTimeout, so the Gremlin Server stops evaluating at the
+#    deadline as well, and stops waiting for the response itself at the
+#    deadline whatever the server does. A connection abandoned with a
+#    response still on its way is replaced, not handed out again.
+# A missed deadline raises DeadlineExceededError, answered with 504.
+
+# Gremlin Server status code of an evaluation that hit evaluationTimeout.
+SERVER_TIMEOUT_STATUS = 598
+
+
+# Raised when a deadline passed before the work was done. abandoned tells
+# that a request was still in flight on a connection when the caller gave up.
+class DeadlineExceededError(RuntimeError):
+    def __init__(self, message: str, abandoned: bool = False):
+        super().__init__(message)
+        self.abandoned = abandoned
+
+
+# The Deadline Class
+class Deadline:
+    __slots__ = ("timeout", "expires_at")
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceededError(f"Deadline of {self.timeout * 1000:.0f} ms exceeded.")
+
+    # The request options that make the Gremlin Server give up at the
+    # deadline too. evaluationTimeout is in milliseconds, 0 would mean none.
+    def request_options(self) -> Dict[str, Any]:
+        return {"evaluationTimeout": max(1, int(self.remaining() * 1000))}
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+# Sets the deadline of the current context (the request); None removes it.
+def set_deadline(deadline: Optional[Deadline]):
+    _current_deadline.set(deadline)
+
+
+# with deadline_scope(2.0): ... for scripts and background jobs.
+@contextmanager
+def deadline_scope(timeout: float) -> Iterator[Deadline]:
+    deadline = Deadline(timeout)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def _consume(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
+
+
+# Awaits aw, giving up at the deadline. With abandoned=True aw is a future
+# for a request in flight on a connection: it is shielded, not cancelled,
+# so the driver can still complete it, and the error raised tells the pool
+# to replace the connection.
+async def wait_within(aw: Awaitable[Any], deadline: Optional[Deadline], abandoned: bool = False) -> Any:
+    if deadline is None:
+        return await aw
+    if abandoned:
+        aw = asyncio.ensure_future(aw)
+        aw.add_done_callback(_consume)
+        waited = asyncio.shield(aw)
+    else:
+        waited = aw
+    try:
+        return await asyncio.wait_for(waited, deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceededError(f"Deadline of {deadline.timeout * 1000:.0f} ms exceeded.", abandoned)
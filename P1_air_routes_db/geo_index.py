@@ -0,0 +1,308 @@
+import asyncio
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Tuple
+
+from gremlin_python.process.graph_traversal import GraphTraversalSource, __
+from gremlin_python.process.traversal import P
+
+from graph_snapshot import GraphSnapshot
+from janusgraph_crud import iter_result_batches
+
+# NumPy is optional, as in analytics.py: with it the distance filter runs
+# vectorized over the candidate airports, without it the same filter is a
+# plain Python loop.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# "Airports within 200 km of X", for GET /airports/nearby.
+#
+# The airports' lat/lon are kept in memory in an AirportIndex, sorted by
+# latitude. A query turns the radius into a bounding box (latitude band plus
+# longitude range, wrapping at the antimeridian), binary searches the band,
+# keeps the candidates inside the longitude range and computes the haversine
+# distance of just those, so only a thin slice of the airports is ever
+# looked at. AirportIndexService rebuilds the index in the background, from
+# the snapshot when one is served (and on every snapshot refresh) or with a
+# streamed pass over the graph otherwise. Until the first build is done
+# nearby_from_graph answers with the same bounding box as has() filters on
+# the server.
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Properties returned with every airport, besides id, lat and lon.
+AIRPORT_FIELDS = ("code", "desc", "city", "country")
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+
+# The box around (lat, lon) holding every point within radius_km:
+# (lowest lat, highest lat, longitude ranges). The longitude ranges are None
+# when the circle reaches a pole (every longitude), otherwise one range, or
+# two when the box crosses the antimeridian.
+def bounding_box(lat: float, lon: float, radius_km: float
+                 ) -> Tuple[float, float, Optional[List[Tuple[float, float]]]]:
+    angle = radius_km / EARTH_RADIUS_KM
+    lat_lo, lat_hi = lat - math.degrees(angle), lat + math.degrees(angle)
+    if lat_lo <= -90 or lat_hi >= 90 or angle >= math.pi / 2:
+        return max(lat_lo, -90.0), min(lat_hi, 90.0), None
+    spread = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(lat)))))
+    lon_lo, lon_hi = lon - spread, lon + spread
+    if lon_lo < -180:
+        return lat_lo, lat_hi, [(lon_lo + 360, 180.0), (-180.0, lon_hi)]
+    if lon_hi > 180:
+        return lat_lo, lat_hi, [(lon_lo, 180.0), (-180.0, lon_hi - 360)]
+    return lat_lo, lat_hi, [(lon_lo, lon_hi)]
+
+
+def _airport_entry(vertex_id: Any, lat: float, lon: float, fields: Dict[str, Any], distance: float
+                   ) -> Dict[str, Any]:
+    return {"id": vertex_id, **fields, "lat": lat, "lon": lon, "distance_km": round(distance, 3)}
+
+
+def _is_coordinate(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+# The AirportIndex Class
+# One immutable index: row i is the airport at lats[i] / lons[i], with
+# lats sorted ascending.
+class AirportIndex:
+    def __init__(self, source: str, airports: List[Tuple[Any, float, float, Dict[str, Any]]],
+                 snapshot_version: Optional[int] = None):
+        self.source = source
+        self.snapshot_version = snapshot_version
+        self.built_at = time.time()
+        self.build_seconds = 0.0
+        airports = sorted((a for a in airports if _is_coordinate(a[1]) and _is_coordinate(a[2])),
+                          key=lambda a: a[1])
+        self.ids = [a[0] for a in airports]
+        self.fields = [a[3] for a in airports]
+        self.lats = [float(a[1]) for a in airports]
+        self.lons = [float(a[2]) for a in airports]
+        if np is not None:
+            self._lats = np.asarray(self.lats, dtype=float)
+            self._lons = np.asarray(self.lons, dtype=float)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def header(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "snapshot_version": self.snapshot_version,
+            "built_at": self.built_at,
+            "age_seconds": round(max(0.0, time.time() - self.built_at), 3),
+        }
+
+    # The k airports closest to (lat, lon) within radius_km, closest first.
+    def nearby(self, lat: float, lon: float, radius_km: float, k: int = 10) -> List[Dict[str, Any]]:
+        lat_lo, lat_hi, lon_ranges = bounding_box(lat, lon, radius_km)
+        start, end = bisect_left(self.lats, lat_lo), bisect_right(self.lats, lat_hi)
+        if start >= end:
+            return []
+        if np is not None:
+            rows, distances = self._nearby_vectorized(lat, lon, radius_km, k, start, end, lon_ranges)
+        else:
+            rows, distances = self._nearby_python(lat, lon, radius_km, k, start, end, lon_ranges)
+        return [_airport_entry(self.ids[row], self.lats[row], self.lons[row], self.fields[row], d)
+                for row, d in zip(rows, distances)]
+
+    def _nearby_vectorized(self, lat, lon, radius_km, k, start, end, lon_ranges):
+        rows = np.arange(start, end)
+        lons = self._lons[start:end]
+        if lon_ranges is not None:
+            inside = np.zeros(len(rows), dtype=bool)
+            for lo, hi in lon_ranges:
+                inside |= (lons >= lo) & (lons <= hi)
+            rows, lons = rows[inside], lons[inside]
+        p1, p2 = math.radians(lat), np.radians(self._lats[rows])
+        a = (np.sin((p2 - p1) / 2) ** 2
+             + math.cos(p1) * np.cos(p2) * np.sin(np.radians(lons - lon) / 2) ** 2)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+        within = distances <= radius_km
+        rows, distances = rows[within], distances[within]
+        if len(rows) > k:
+            closest = np.argpartition(distances, k - 1)[:k]
+            rows, distances = rows[closest], distances[closest]
+        order = np.argsort(distances, kind="stable")
+        return rows[order].tolist(), distances[order].tolist()
+
+    def _nearby_python(self, lat, lon, radius_km, k, start, end, lon_ranges):
+        found = []
+        for row in range(start, end):
+            row_lon = self.lons[row]
+            if lon_ranges is not None and not any(lo <= row_lon <= hi for lo, hi in lon_ranges):
+                continue
+            distance = haversine_km(lat, lon, self.lats[row], row_lon)
+            if distance <= radius_km:
+                found.append((distance, row))
+        found.sort()
+        found = found[:k]
+        return [row for _, row in found], [d for d, _ in found]
+
+
+def _row_fields(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: row[key][0] if row[key] else None for key in AIRPORT_FIELDS}
+
+
+def _airport_projection(traversal):
+    traversal = traversal.project("id", "lat", "lon", *AIRPORT_FIELDS).by(__.id_()).by("lat").by("lon")
+    for key in AIRPORT_FIELDS:
+        traversal = traversal.by(__.values(key).fold())
+    return traversal
+
+
+# Builds the index from every label vertex with a lat and a lon, streamed in
+# batches of batch_size.
+def build_from_graph(g: GraphTraversalSource, label: str = "airport", batch_size: int = 5000) -> AirportIndex:
+    start = time.monotonic()
+    query = _airport_projection(g.V().hasLabel(label).has("lat").has("lon"))
+    airports = [(row["id"], row["lat"], row["lon"], _row_fields(row))
+                for batch in iter_result_batches(g, query, batch_size, "airport_index") for row in batch]
+    index = AirportIndex("graph", airports)
+    index.build_seconds = time.monotonic() - start
+    return index
+
+
+# Same as build_from_graph, from the in-memory snapshot.
+def build_from_snapshot(snapshot: GraphSnapshot, label: str = "airport") -> AirportIndex:
+    start = time.monotonic()
+    lat, lon = snapshot.columns.get("lat"), snapshot.columns.get("lon")
+    airports = []
+    if lat is not None and lon is not None:
+        columns = [(key, snapshot.columns.get(key)) for key in AIRPORT_FIELDS]
+        for row in snapshot.label_rows(label):
+            fields = {key: column.get(row) if column is not None else None for key, column in columns}
+            airports.append((snapshot.ids[row], lat.get(row), lon.get(row), fields))
+    index = AirportIndex("snapshot", airports, snapshot.version)
+    index.build_seconds = time.monotonic() - start
+    return index
+
+
+# The cold path: the bounding box becomes has() range filters, so the server
+# only sends back the airports inside it, and the exact distances are
+# computed here.
+def nearby_from_graph(g: GraphTraversalSource, lat: float, lon: float, radius_km: float, k: int = 10,
+                      label: str = "airport", batch_size: int = 2000) -> List[Dict[str, Any]]:
+    lat_lo, lat_hi, lon_ranges = bounding_box(lat, lon, radius_km)
+    traversal = g.V().hasLabel(label).has("lat", P.gte(lat_lo)).has("lat", P.lte(lat_hi))
+    if lon_ranges is not None:
+        traversal = traversal.or_(*[__.has("lon", P.gte(lo)).has("lon", P.lte(hi)) for lo, hi in lon_ranges])
+    found = []
+    try:
+        query = _airport_projection(traversal.has("lon"))
+        for batch in iter_result_batches(g, query, batch_size, "nearby_airports"):
+            for row in batch:
+                if not (_is_coordinate(row["lat"]) and _is_coordinate(row["lon"])):
+                    continue
+                distance = haversine_km(lat, lon, row["lat"], row["lon"])
+                if distance <= radius_km:
+                    found.append((distance, row))
+    except Exception as e:
+        raise RuntimeError(f"Failed to find nearby airports: {e}")
+    found.sort(key=lambda f: f[0])
+    return [_airport_entry(row["id"], row["lat"], row["lon"], _row_fields(row), d) for d, row in found[:k]]
+
+
+# The AirportIndexService Class
+# Owns the current AirportIndex and rebuilds it every refresh_interval
+# seconds in the background, and whenever the snapshot is refreshed when
+# that holds the airports, like GraphStatsService. A failed rebuild keeps
+# the previous index and is reported in status().
+class AirportIndexService:
+    def __init__(self, manager, snapshots=None, refresh_interval: float = 600.0, label: str = "airport"):
+        self.manager = manager
+        self.snapshots = snapshots
+        self.refresh_interval = refresh_interval
+        self.label = label
+        self._index: Optional[AirportIndex] = None
+        self._refresh_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        if snapshots is not None and snapshots.covers_label(label):
+            snapshots.add_listener(self._on_snapshot)
+
+    def _snapshot(self) -> Optional[GraphSnapshot]:
+        if self.snapshots is None or not self.snapshots.covers_label(self.label):
+            return None
+        return self.snapshots.current()
+
+    # Runs on the thread that refreshed the snapshot.
+    def _on_snapshot(self, snapshot: GraphSnapshot):
+        try:
+            self.refresh()
+        except RuntimeError as e:
+            print(e)
+
+    # The current index, or None while it is cold.
+    def current(self) -> Optional[AirportIndex]:
+        return self._index
+
+    # Blocking: builds a new index and swaps it in.
+    def refresh(self) -> AirportIndex:
+        with self._refresh_lock:
+            try:
+                snapshot = self._snapshot()
+                if snapshot is not None:
+                    index = build_from_snapshot(snapshot, self.label)
+                else:
+                    with self.manager.lease() as g:
+                        index = build_from_graph(g, self.label)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise RuntimeError(f"Failed to build the airport index: {e}")
+            self._index = index
+            self.refreshes += 1
+            self.last_error = None
+            return index
+
+    async def refresh_async(self) -> AirportIndex:
+        return await asyncio.get_running_loop().run_in_executor(None, self.refresh)
+
+    # The first build does not hold up startup; queries go to the server
+    # until it is done.
+    async def start(self):
+        self._task = asyncio.ensure_future(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh_async()
+            except RuntimeError as e:
+                print(e)
+            if self.refresh_interval <= 0:
+                return
+            await asyncio.sleep(self.refresh_interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        index = self._index
+        return {
+            "refresh_interval": self.refresh_interval,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "airports": len(index) if index is not None else None,
+            "build_seconds": round(index.build_seconds, 3) if index is not None else None,
+        }
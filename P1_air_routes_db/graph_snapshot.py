@@ -0,0 +1,511 @@
+import asyncio
+import sys
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from gremlin_python.process.graph_traversal import GraphTraversalSource, __
+from gremlin_python.process.traversal import T
+
+from janusgraph_crud import normalize_results, value_map, iter_result_batches
+
+# In-process read replica of the graph.
+#
+# A GraphSnapshot is an immutable copy of the vertices and of the edges of a
+# few labels (the 'route' edges by default) laid out for fast reads:
+#  - vertex ids in one array, with a dict from id to row number;
+#  - the adjacency in CSR form (compressed sparse row) for both directions:
+#    offsets[row]..offsets[row + 1] is the slice of the targets array holding
+#    the neighbours of that row, and the matching slice of the edge array
+#    points at the edge's row in the edge columns;
+#  - properties as interned columns: every distinct value is stored once in a
+#    table and each row keeps a small int code into it (-1 when the row has no
+#    value), so 3,500 airports in 240 countries hold 240 country strings.
+# Lookups are array indexing and dict gets, i.e. microseconds, and a snapshot
+# never changes once built, so any number of threads can read it.
+#
+# A SnapshotReplica pulls a new snapshot from JanusGraph at startup and then
+# every refresh_interval seconds, and swaps it in atomically. Every snapshot
+# carries a version number and its build time, which the API reports with the
+# responses it serves from memory.
+
+NO_VALUE = -1
+
+
+# The PropertyColumn Class
+# One property (or the label) of every row, dictionary encoded. Multi-valued
+# properties are interned as tuples and handed back as lists.
+class PropertyColumn:
+    def __init__(self):
+        self.values: List[Any] = []
+        self.codes = array("i")
+        self._index: Dict[Any, int] = {}
+
+    def append(self, value: Any):
+        if value is None:
+            self.codes.append(NO_VALUE)
+            return
+        if isinstance(value, list):
+            value = tuple(value)
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    # Pads the column with missing values up to n rows.
+    def pad(self, n: int):
+        if len(self.codes) < n:
+            self.codes.extend([NO_VALUE] * (n - len(self.codes)))
+
+    def code_of(self, value: Any) -> int:
+        return self._index.get(tuple(value) if isinstance(value, list) else value, NO_VALUE)
+
+    def get(self, row: int) -> Any:
+        code = self.codes[row]
+        if code == NO_VALUE:
+            return None
+        value = self.values[code]
+        return list(value) if isinstance(value, tuple) else value
+
+    # Drops the value -> code index, which is only needed while interning and
+    # by code_of(). Property columns are frozen once built; label columns keep
+    # it for label lookups.
+    def freeze(self):
+        self._index = {}
+
+    def nbytes(self) -> int:
+        return (sys.getsizeof(self.codes) + sys.getsizeof(self.values)
+                + sum(sys.getsizeof(v) for v in self.values))
+
+
+# Lays edges out in CSR form for one direction. keys[e] is the row an edge
+# starts from, values[e] the row it points to; returns (offsets, targets,
+# edge rows) with the edges of every row grouped together (counting sort).
+def build_csr(rows: int, keys: array, values: array) -> Tuple[array, array, array]:
+    offsets = array("l", [0]) * (rows + 1)
+    for k in keys:
+        offsets[k + 1] += 1
+    for i in range(rows):
+        offsets[i + 1] += offsets[i]
+    fill = array("l", offsets[:-1])
+    targets = array("l", [0]) * len(keys)
+    edges = array("l", [0]) * len(keys)
+    for e, (k, v) in enumerate(zip(keys, values)):
+        slot = fill[k]
+        targets[slot] = v
+        edges[slot] = e
+        fill[k] = slot + 1
+    return offsets, targets, edges
+
+
+def _coerce_id(value: Any) -> Any:
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
+# The SnapshotBuilder Class
+# Collects vertices and edges (in any order, edges may come first) and packs
+# them into a GraphSnapshot.
+class SnapshotBuilder:
+    def __init__(self):
+        self._ids: List[Any] = []
+        self._rows: Dict[Any, int] = {}
+        self._labels = PropertyColumn()
+        self._columns: Dict[str, PropertyColumn] = {}
+        self._edges: List[Tuple[Any, Any, Any, str, Dict[str, Any]]] = []
+
+    # vertex is a normalized valueMap(True) row: {'id': .., 'label': .., ...}.
+    def add_vertex(self, vertex: Dict[str, Any]):
+        row = len(self._ids)
+        self._ids.append(vertex["id"])
+        self._rows[vertex["id"]] = row
+        self._labels.append(vertex["label"])
+        for key, value in vertex.items():
+            if key in ("id", "label"):
+                continue
+            column = self._columns.get(key)
+            if column is None:
+                column = self._columns[key] = PropertyColumn()
+            column.pad(row)
+            column.append(value)
+
+    def add_edge(self, edge_id: Any, label: str, out_id: Any, in_id: Any, properties: Dict[str, Any]):
+        self._edges.append((edge_id, out_id, in_id, label, properties))
+
+    def build(self, version: int = 0) -> "GraphSnapshot":
+        rows = len(self._ids)
+        for column in self._columns.values():
+            column.pad(rows)
+            column.freeze()
+
+        edge_ids: List[Any] = []
+        out_rows, in_rows = array("l"), array("l")
+        edge_labels = PropertyColumn()
+        edge_columns: Dict[str, PropertyColumn] = {}
+        dropped = 0
+        for edge_id, out_id, in_id, label, props in self._edges:
+            out_row, in_row = self._rows.get(out_id), self._rows.get(in_id)
+            if out_row is None or in_row is None:
+                # An endpoint outside the snapshot (e.g. a vertex label that
+                # was not pulled in, or added between the two reads).
+                dropped += 1
+                continue
+            e = len(edge_ids)
+            edge_ids.append(edge_id)
+            out_rows.append(out_row)
+            in_rows.append(in_row)
+            edge_labels.append(label)
+            for key, value in props.items():
+                column = edge_columns.get(key)
+                if column is None:
+                    column = edge_columns[key] = PropertyColumn()
+                column.pad(e)
+                column.append(value)
+        for column in edge_columns.values():
+            column.pad(len(edge_ids))
+            column.freeze()
+        self._edges = []
+
+        return GraphSnapshot(
+            version=version,
+            ids=_compact_ids(self._ids),
+            rows=self._rows,
+            labels=self._labels,
+            columns=self._columns,
+            edge_ids=_compact_ids(edge_ids),
+            edge_labels=edge_labels,
+            edge_columns=edge_columns,
+            out_csr=build_csr(rows, out_rows, in_rows),
+            in_csr=build_csr(rows, in_rows, out_rows),
+            dropped_edges=dropped,
+        )
+
+
+# Integer ids (what JanusGraph uses) go into a typed array, anything else stays
+# a list.
+def _compact_ids(ids: List[Any]):
+    if all(type(i) is int and -2 ** 63 <= i < 2 ** 63 for i in ids):
+        return array("q", ids)
+    return ids
+
+
+# The GraphSnapshot Class
+# Read-only view over what SnapshotBuilder packed. Vertex dicts come back in
+# the same shape as normalize_results() produces, so the API can return them
+# as they are.
+class GraphSnapshot:
+    def __init__(self, version: int, ids, rows: Dict[Any, int], labels: PropertyColumn,
+                 columns: Dict[str, PropertyColumn], edge_ids, edge_labels: PropertyColumn,
+                 edge_columns: Dict[str, PropertyColumn], out_csr: Tuple[array, array, array],
+                 in_csr: Tuple[array, array, array], dropped_edges: int = 0):
+        self.version = version
+        self.built_at = time.time()
+        self.build_seconds = 0.0
+        self.ids = ids
+        self.rows = rows
+        self.labels = labels
+        self.columns = columns
+        self.edge_ids = edge_ids
+        self.edge_labels = edge_labels
+        self.edge_columns = edge_columns
+        self.out_offsets, self.out_targets, self.out_edges = out_csr
+        self.in_offsets, self.in_sources, self.in_edges = in_csr
+        self.dropped_edges = dropped_edges
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_ids)
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.built_at)
+
+    # Row number of a vertex id, or None. Ids from URLs arrive as strings.
+    def row(self, vertex_id: Any) -> Optional[int]:
+        row = self.rows.get(vertex_id)
+        if row is None and isinstance(vertex_id, str):
+            row = self.rows.get(_coerce_id(vertex_id))
+        return row
+
+    def has_label(self, label: str) -> bool:
+        return self.labels.code_of(label) != NO_VALUE
+
+    def vertex_at(self, row: int, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        vertex = {"id": self.ids[row], "label": self.labels.get(row)}
+        for key in fields if fields else self.columns:
+            column = self.columns.get(key)
+            if column is not None:
+                value = column.get(row)
+                if value is not None:
+                    vertex[key] = value
+        return vertex
+
+    def vertex(self, vertex_id: Any, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        row = self.row(vertex_id)
+        return None if row is None else self.vertex_at(row, fields)
+
+    def label_rows(self, label: Optional[str] = None) -> Iterator[int]:
+        if label is None:
+            return iter(range(len(self.ids)))
+        code = self.labels.code_of(label)
+        if code == NO_VALUE:
+            return iter(())
+        return (row for row, c in enumerate(self.labels.codes) if c == code)
+
+    def vertices(self, label: Optional[str] = None, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return [self.vertex_at(row, fields) for row in self.label_rows(label)]
+
+    # (neighbour row, edge row) pairs of a row. direction is 'out', 'in' or
+    # 'both'; edge_label restricts the edges followed.
+    def adjacent(self, row: int, direction: str = "out", edge_label: Optional[str] = None) -> Iterator[Tuple[int, int]]:
+        label_code = None if edge_label is None else self.edge_labels.code_of(edge_label)
+        label_codes = self.edge_labels.codes
+        sides = []
+        if direction in ("out", "both"):
+            sides.append((self.out_offsets, self.out_targets, self.out_edges))
+        if direction in ("in", "both"):
+            sides.append((self.in_offsets, self.in_sources, self.in_edges))
+        for offsets, targets, edges in sides:
+            for slot in range(offsets[row], offsets[row + 1]):
+                e = edges[slot]
+                if label_code is None or label_codes[e] == label_code:
+                    yield targets[slot], e
+
+    def neighbors(self, vertex_id: Any, direction: str = "out", edge_label: Optional[str] = None) -> List[Any]:
+        row = self.row(vertex_id)
+        if row is None:
+            return []
+        return [self.ids[n] for n, _ in self.adjacent(row, direction, edge_label)]
+
+    # Rows level by level around row, the way janusgraph_crud's
+    # NeighborhoodExpansion walks the graph: each level holds the rows one
+    # edge away from the previous level that were not seen before, at most
+    # level_limit of them and max_vertices over all levels. Yields
+    # (rows, truncated) per level.
+    def neighborhood(self, row: int, hops: int, direction: str = "out", edge_label: Optional[str] = None,
+                     level_limit: int = 1000, max_vertices: int = 10000) -> Iterator[Tuple[List[int], bool]]:
+        seen = {row}
+        frontier = [row]
+        remaining = max_vertices
+        for _ in range(hops):
+            if not frontier or remaining <= 0:
+                return
+            cap = min(level_limit, remaining)
+            level: List[int] = []
+            for current in frontier:
+                for neighbour, _ in self.adjacent(current, direction, edge_label):
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        level.append(neighbour)
+                        if len(level) >= cap:
+                            break
+                if len(level) >= cap:
+                    break
+            yield level, len(level) >= cap
+            frontier = level
+            remaining -= len(level)
+
+    def degree(self, row: int, direction: str = "out") -> int:
+        degree = 0
+        if direction in ("out", "both"):
+            degree += self.out_offsets[row + 1] - self.out_offsets[row]
+        if direction in ("in", "both"):
+            degree += self.in_offsets[row + 1] - self.in_offsets[row]
+        return degree
+
+    def edge_property(self, edge_row: int, key: str) -> Any:
+        column = self.edge_columns.get(key)
+        return None if column is None else column.get(edge_row)
+
+    # Approximate bytes held by each part of the snapshot. The id index dict
+    # is usually the biggest single item.
+    def memory_footprint(self) -> Dict[str, Any]:
+        def ids_bytes(ids) -> int:
+            if isinstance(ids, array):
+                return sys.getsizeof(ids)
+            return sys.getsizeof(ids) + sum(sys.getsizeof(i) for i in ids)
+
+        parts = {
+            "vertex_ids": ids_bytes(self.ids),
+            "id_index": sys.getsizeof(self.rows),
+            "labels": self.labels.nbytes(),
+            "vertex_properties": sum(c.nbytes() for c in self.columns.values()),
+            "adjacency": sum(sys.getsizeof(a) for a in (
+                self.out_offsets, self.out_targets, self.out_edges,
+                self.in_offsets, self.in_sources, self.in_edges)),
+            "edge_ids": ids_bytes(self.edge_ids),
+            "edge_labels": self.edge_labels.nbytes(),
+            "edge_properties": sum(c.nbytes() for c in self.edge_columns.values()),
+        }
+        return {
+            "total_bytes": sum(parts.values()),
+            "parts": parts,
+            "vertex_property_columns": {k: c.nbytes() for k, c in self.columns.items()},
+            "edge_property_columns": {k: c.nbytes() for k, c in self.edge_columns.items()},
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "built_at": self.built_at,
+            "age_seconds": round(self.age(), 3),
+            "build_seconds": round(self.build_seconds, 3),
+            "vertices": self.vertex_count,
+            "edges": self.edge_count,
+            "dropped_edges": self.dropped_edges,
+            "memory": self.memory_footprint(),
+        }
+
+
+# Pulls a snapshot over a traversal source: every vertex (or the vertices of
+# vertex_labels) with all its properties, then the edges of edge_labels with
+# their endpoints and properties, both streamed in batches of batch_size.
+def build_snapshot(g: GraphTraversalSource, version: int = 0, vertex_labels: Optional[List[str]] = None,
+                   edge_labels: Iterable[str] = ("route",), batch_size: int = 2000) -> GraphSnapshot:
+    start = time.monotonic()
+    builder = SnapshotBuilder()
+    query = g.V()
+    if vertex_labels:
+        query = query.hasLabel(*vertex_labels)
+    for batch in iter_result_batches(g, value_map(query), batch_size, "snapshot_vertices"):
+        for vertex in normalize_results(batch):
+            builder.add_vertex(vertex)
+
+    edge_labels = list(edge_labels)
+    if edge_labels:
+        edges = (g.E().hasLabel(*edge_labels)
+                 .project("id", "label", "out", "in", "properties")
+                 .by(T.id).by(T.label).by(__.outV().id_()).by(__.inV().id_()).by(__.valueMap()))
+        for batch in iter_result_batches(g, edges, batch_size, "snapshot_edges"):
+            for e in batch:
+                builder.add_edge(e["id"], e["label"], e["out"], e["in"], e["properties"] or {})
+
+    snapshot = builder.build(version)
+    snapshot.build_seconds = time.monotonic() - start
+    return snapshot
+
+
+# The SnapshotReplica Class
+# Owns the current GraphSnapshot and keeps it fresh. refresh() builds a new
+# snapshot on a leased pool connection and swaps it in; start() does a first
+# refresh and then runs one every refresh_interval seconds in the background.
+# A failed refresh keeps the previous snapshot (its age keeps growing, which
+# shows in the responses) and is reported in stats(). Snapshots older than
+# max_age seconds (0 = no limit) are not handed out by current().
+class SnapshotReplica:
+    def __init__(self, manager, refresh_interval: float = 300.0, max_age: float = 0.0,
+                 vertex_labels: Optional[List[str]] = None, edge_labels: Iterable[str] = ("route",),
+                 batch_size: int = 2000):
+        self.manager = manager
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self.vertex_labels = list(vertex_labels) if vertex_labels else None
+        self.edge_labels = list(edge_labels)
+        self.batch_size = batch_size
+        self._snapshot: Optional[GraphSnapshot] = None
+        self._version = 0
+        self._refresh_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[GraphSnapshot], None]] = []
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    # Registers a callback run with every new snapshot, on the thread that
+    # built it, right after it was swapped in. Listener errors are printed and
+    # do not fail the refresh.
+    def add_listener(self, listener: Callable[["GraphSnapshot"], None]):
+        self._listeners.append(listener)
+
+    # The snapshot to serve from, or None when there is none (yet) or it is
+    # older than max_age.
+    def current(self) -> Optional[GraphSnapshot]:
+        snapshot = self._snapshot
+        if snapshot is None or (self.max_age and snapshot.age() > self.max_age):
+            return None
+        return snapshot
+
+    # True when label-filtered listings of this label can be answered from
+    # the snapshot, i.e. every vertex of the label was pulled in.
+    def covers_label(self, label: Optional[str]) -> bool:
+        if self.vertex_labels is None:
+            return True
+        return label is not None and label in self.vertex_labels
+
+    # True when the snapshot holds the edges of this label, so traversals over
+    # them (e.g. route searches) can run on it.
+    def covers_edge_label(self, edge_label: str) -> bool:
+        return edge_label in self.edge_labels
+
+    # Blocking: builds a new snapshot and swaps it in. Concurrent calls are
+    # serialized rather than building twice in parallel.
+    def refresh(self) -> GraphSnapshot:
+        with self._refresh_lock:
+            try:
+                with self.manager.lease() as g:
+                    snapshot = build_snapshot(g, self._version + 1, self.vertex_labels,
+                                              self.edge_labels, self.batch_size)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise RuntimeError(f"Failed to refresh the graph snapshot: {e}")
+            self._version = snapshot.version
+            self._snapshot = snapshot
+            self.refreshes += 1
+            self.last_error = None
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"Snapshot listener failed: {e}")
+        return snapshot
+
+    async def refresh_async(self) -> GraphSnapshot:
+        return await asyncio.get_running_loop().run_in_executor(None, self.refresh)
+
+    async def start(self):
+        try:
+            await self.refresh_async()
+        except RuntimeError as e:
+            # The API still works without a snapshot, only slower.
+            print(e)
+        if self.refresh_interval > 0:
+            self._task = asyncio.ensure_future(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_async()
+            except RuntimeError as e:
+                print(e)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "enabled": True,
+            "refresh_interval": self.refresh_interval,
+            "max_age": self.max_age,
+            "vertex_labels": self.vertex_labels,
+            "edge_labels": self.edge_labels,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "serving": self.current() is not None,
+            "snapshot": snapshot.stats() if snapshot is not None else None,
+        }
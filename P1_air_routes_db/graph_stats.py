@@ -0,0 +1,223 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from gremlin_python.process.graph_traversal import GraphTraversalSource, __
+from gremlin_python.process.traversal import T
+
+from graph_snapshot import GraphSnapshot, NO_VALUE
+from janusgraph_crud import iter_result_batches, wire_serializer
+from metrics import observe_traversal
+
+# Precomputed graph statistics for dashboards.
+#
+# Counting vertices per label, airports per country or routes per airport is
+# a full scan of the graph each time (like the g.V().count() of the setup
+# check). GraphStatsService computes all of them together in the background,
+# keeps the result in memory and hands it out as is, so GET /stats/* costs a
+# dict lookup whatever the size of the graph. Every result carries the time
+# it was computed at and where it came from:
+#  - 'graph': groupCount() traversals on JanusGraph, plus one streamed pass
+#    over the airports for their route degrees;
+#  - 'snapshot': counted from the in-memory snapshot (graph_snapshot.py)
+#    when one is being served, which needs no round trip at all. Edge counts
+#    then only cover the edge labels the snapshot holds.
+# The degree view keeps the in/out route degree of every airport, sorted, so
+# the top hubs are a slice and the degree of one airport a dict get.
+
+
+# The GraphStats Class
+# One immutable set of statistics.
+class GraphStats:
+    def __init__(self, source: str, vertex_labels: Dict[str, int], edge_labels: Dict[str, int],
+                 countries: Dict[str, int], degrees: List[Dict[str, Any]], snapshot_version: Optional[int] = None):
+        self.source = source
+        self.snapshot_version = snapshot_version
+        self.computed_at = time.time()
+        self.compute_seconds = 0.0
+        self.vertex_labels = vertex_labels
+        self.edge_labels = edge_labels
+        # Most airports first.
+        self.countries = dict(sorted(countries.items(), key=lambda kv: (-kv[1], kv[0])))
+        # Highest degree first; by_id indexes the same entries.
+        self.degrees = sorted(degrees, key=lambda d: (-d["degree"], str(d["id"])))
+        self.by_id = {str(d["id"]): d for d in self.degrees}
+
+    def age(self) -> float:
+        return max(0.0, time.time() - self.computed_at)
+
+    def header(self) -> Dict[str, Any]:
+        return {
+            "computed_at": self.computed_at,
+            "age_seconds": round(self.age(), 3),
+            "compute_seconds": round(self.compute_seconds, 3),
+            "source": self.source,
+            "snapshot_version": self.snapshot_version,
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            **self.header(),
+            "vertices": sum(self.vertex_labels.values()),
+            "edges": sum(self.edge_labels.values()),
+            "vertex_labels": self.vertex_labels,
+            "edge_labels": self.edge_labels,
+            "countries": len(self.countries),
+            "hubs": len(self.degrees),
+        }
+
+
+def _degree_entry(vertex_id: Any, code: Any, out_degree: int, in_degree: int) -> Dict[str, Any]:
+    return {"id": vertex_id, "code": code, "routes_out": out_degree, "routes_in": in_degree,
+            "degree": out_degree + in_degree}
+
+
+# Computes the statistics on the server. Labels and countries are single
+# groupCount() traversals; degrees come back in batches of batch_size so the
+# result for a large graph is never one huge response.
+def compute_from_graph(g: GraphTraversalSource, hub_label: str = "airport", route_label: str = "route",
+                       country_key: str = "country", batch_size: int = 2000) -> GraphStats:
+    start = time.monotonic()
+    with observe_traversal("stats_counts") as record:
+        record.leased(wire_serializer(g), waited=False)
+        vertex_labels = g.V().groupCount().by(T.label).next()
+        edge_labels = g.E().groupCount().by(T.label).next()
+        countries = g.V().hasLabel(hub_label).has(country_key).groupCount().by(country_key).next()
+        record.received(3)
+    degrees = []
+    query = (g.V().hasLabel(hub_label).project("id", "code", "out", "in")
+             .by(T.id).by(__.values("code").fold())
+             .by(__.outE(route_label).count()).by(__.inE(route_label).count()))
+    for batch in iter_result_batches(g, query, batch_size, "stats_degrees"):
+        for row in batch:
+            code = row["code"][0] if row["code"] else None
+            degrees.append(_degree_entry(row["id"], code, row["out"], row["in"]))
+    stats = GraphStats("graph", dict(vertex_labels), dict(edge_labels), dict(countries), degrees)
+    stats.compute_seconds = time.monotonic() - start
+    return stats
+
+
+def _count_codes(codes, values: List[Any]) -> Dict[Any, int]:
+    return {values[code]: n for code, n in Counter(codes).items() if code != NO_VALUE}
+
+
+# Computes the statistics from a snapshot, without touching the server.
+def compute_from_snapshot(snapshot: GraphSnapshot, hub_label: str = "airport", route_label: str = "route",
+                          country_key: str = "country") -> GraphStats:
+    start = time.monotonic()
+    vertex_labels = _count_codes(snapshot.labels.codes, snapshot.labels.values)
+    edge_labels = _count_codes(snapshot.edge_labels.codes, snapshot.edge_labels.values)
+    hubs = list(snapshot.label_rows(hub_label))
+    country = snapshot.columns.get(country_key)
+    countries = {}
+    if country is not None:
+        countries = {str(k): v for k, v in Counter(country.get(row) for row in hubs).items() if k is not None}
+    code = snapshot.columns.get("code")
+    degrees = []
+    for row in hubs:
+        out_degree = sum(1 for _ in snapshot.adjacent(row, "out", route_label))
+        in_degree = sum(1 for _ in snapshot.adjacent(row, "in", route_label))
+        degrees.append(_degree_entry(snapshot.ids[row], code.get(row) if code is not None else None,
+                                     out_degree, in_degree))
+    stats = GraphStats("snapshot", vertex_labels, edge_labels, countries, degrees, snapshot.version)
+    stats.compute_seconds = time.monotonic() - start
+    return stats
+
+
+# The GraphStatsService Class
+# Owns the current GraphStats and recomputes it every refresh_interval
+# seconds in the background, the way SnapshotReplica refreshes snapshots.
+# When a snapshot is being served the statistics are counted from it, and
+# recounted whenever the replica swaps in a new one (see
+# SnapshotReplica.add_listener); otherwise they are computed on a leased
+# pool connection. A failed refresh keeps the previous statistics and is
+# reported in status().
+class GraphStatsService:
+    def __init__(self, manager, snapshots=None, refresh_interval: float = 600.0, hub_label: str = "airport",
+                 route_label: str = "route", country_key: str = "country"):
+        self.manager = manager
+        self.snapshots = snapshots
+        self.refresh_interval = refresh_interval
+        self.hub_label = hub_label
+        self.route_label = route_label
+        self.country_key = country_key
+        self._stats: Optional[GraphStats] = None
+        self._refresh_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        if snapshots is not None and snapshots.covers_edge_label(route_label):
+            snapshots.add_listener(self._on_snapshot)
+
+    def _snapshot(self) -> Optional[GraphSnapshot]:
+        if self.snapshots is None or not self.snapshots.covers_edge_label(self.route_label):
+            return None
+        return self.snapshots.current()
+
+    # Runs on the thread that refreshed the snapshot.
+    def _on_snapshot(self, snapshot: GraphSnapshot):
+        try:
+            self.refresh()
+        except RuntimeError as e:
+            print(e)
+
+    # The current statistics, or None before the first refresh.
+    def current(self) -> Optional[GraphStats]:
+        return self._stats
+
+    # Blocking: computes new statistics and swaps them in.
+    def refresh(self) -> GraphStats:
+        with self._refresh_lock:
+            try:
+                snapshot = self._snapshot()
+                if snapshot is not None:
+                    stats = compute_from_snapshot(snapshot, self.hub_label, self.route_label, self.country_key)
+                else:
+                    with self.manager.lease() as g:
+                        stats = compute_from_graph(g, self.hub_label, self.route_label, self.country_key)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise RuntimeError(f"Failed to compute graph statistics: {e}")
+            self._stats = stats
+            self.refreshes += 1
+            self.last_error = None
+            return stats
+
+    async def refresh_async(self) -> GraphStats:
+        return await asyncio.get_running_loop().run_in_executor(None, self.refresh)
+
+    # Unlike the snapshot, the first computation does not hold up startup:
+    # /stats/* answer 503 until it is done.
+    async def start(self):
+        self._task = asyncio.ensure_future(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh_async()
+            except RuntimeError as e:
+                print(e)
+            if self.refresh_interval <= 0:
+                return
+            await asyncio.sleep(self.refresh_interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "refresh_interval": self.refresh_interval,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
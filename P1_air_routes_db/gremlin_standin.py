@@ -0,0 +1,1280 @@
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import random
+import struct
+import sys
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from aiohttp import web, WSMsgType
+from gremlin_python.process.traversal import (
+    Bytecode, Cardinality, Column, Direction, Merge, Order, P, Pop, Scope, T, TextP, Traverser,
+    TraversalStrategy,
+)
+from gremlin_python.structure.graph import Edge, Path, Vertex
+from gremlin_python.structure.io import graphbinaryV1, graphsonV2d0, graphsonV3d0
+from gremlin_python.structure.io.graphbinaryV1 import DataType
+from gremlin_python.structure.io.util import SymbolUtil
+
+from air_routes_loader import VERTEX, EDGE, iter_csv_vertices, iter_csv_edges, iter_graphml
+from air_routes_generator import AirRoutesGenerator
+
+# A stand-in for a Gremlin Server, good enough to run the API and its
+# benchmarks on a laptop without JanusGraph.
+#
+# It speaks the Gremlin Server WebSocket protocol (requests and responses in
+# GraphBinary 1.0, GraphSON 3.0 or GraphSON 2.0, results sent in frames of
+# batchSize) and evaluates traversal bytecode over an in-memory graph. Only the
+# steps the API uses are implemented; anything else is answered with a server
+# error, exactly as an unsupported step would fail on a real server. There are
+# no transactions, indexes or persistence: it is a test double, not a database.
+#
+# The graph is loaded from the same records as the bulk loader reads (GraphML
+# or Gremlin CSV, see air_routes_loader.py) or generated on the fly with
+# air_routes_generator.AirRoutesGenerator. Vertex and edge ids are assigned sequentially, like
+# the long ids JanusGraph gives out.
+#
+#   python gremlin_standin.py --port 8182 --airports 3500
+#   python gremlin_standin.py --port 8182 --vertices v.csv --edges e.csv
+
+MIME_GRAPHBINARY = "application/vnd.graphbinary-v1.0"
+MIME_GRAPHSON_V3 = "application/vnd.gremlin-v3.0+json"
+MIME_GRAPHSON_V2 = "application/vnd.gremlin-v2.0+json"
+
+# Gremlin Server response status codes.
+STATUS_SUCCESS = 200
+STATUS_NO_CONTENT = 204
+STATUS_PARTIAL_CONTENT = 206
+STATUS_REQUEST_ERROR_MALFORMED_REQUEST = 498
+STATUS_REQUEST_ERROR_INVALID_REQUEST_ARGUMENTS = 499
+STATUS_SERVER_ERROR = 500
+STATUS_SERVER_ERROR_EVALUATION = 597
+STATUS_SERVER_ERROR_TIMEOUT = 598
+
+# Same default as the server's resultIterationBatchSize.
+DEFAULT_BATCH_SIZE = 64
+
+
+# The in-memory graph. Vertex properties are lists of values (every key can be
+# multi-valued, as valueMap() shows them), edge properties single values.
+class StandInVertex:
+    __slots__ = ("id", "label", "properties", "out_edges", "in_edges")
+
+    def __init__(self, id: int, label: str, properties: Dict[str, List[Any]]):
+        self.id = id
+        self.label = label
+        self.properties = properties
+        self.out_edges: List["StandInEdge"] = []
+        self.in_edges: List["StandInEdge"] = []
+
+
+class StandInEdge:
+    __slots__ = ("id", "label", "properties", "out_v", "in_v")
+
+    def __init__(self, id: int, label: str, properties: Dict[str, Any], out_v: StandInVertex, in_v: StandInVertex):
+        self.id = id
+        self.label = label
+        self.properties = properties
+        self.out_v = out_v
+        self.in_v = in_v
+
+
+# Vertices are also indexed by property value, the way a composite index of
+# JanusGraph would be used, so that mergeV() finds its match without a scan.
+# Vertex properties are changed through set_property() to keep it current.
+class StandInGraph:
+    def __init__(self):
+        self.vertices: Dict[int, StandInVertex] = {}
+        self.edges: Dict[int, StandInEdge] = {}
+        self._next_id = 4096
+        self._by_value: Dict[Tuple[str, Any], Dict[int, StandInVertex]] = {}
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def add_vertex(self, label: str, properties: Dict[str, Any]) -> StandInVertex:
+        vertex = StandInVertex(self._new_id(), label,
+                               {k: list(v) if isinstance(v, list) else [v] for k, v in properties.items()})
+        self.vertices[vertex.id] = vertex
+        for key, values in vertex.properties.items():
+            for value in values:
+                self._index(vertex, key, value)
+        return vertex
+
+    def _index(self, vertex: StandInVertex, key: str, value: Any):
+        self._by_value.setdefault((key, _hashable(value)), {})[vertex.id] = vertex
+
+    def _unindex(self, vertex: StandInVertex, key: str, value: Any):
+        self._by_value.get((key, _hashable(value)), {}).pop(vertex.id, None)
+
+    # Sets a vertex property, replacing its values (single) or adding one
+    # (list / set).
+    def set_property(self, vertex: StandInVertex, key: str, value: Any, single: bool = True):
+        if single:
+            for old in vertex.properties.get(key, []):
+                self._unindex(vertex, key, old)
+            vertex.properties[key] = [value]
+        else:
+            vertex.properties.setdefault(key, []).append(value)
+        self._index(vertex, key, value)
+
+    # The vertices of label having every property of properties with that
+    # value.
+    def find_vertices(self, label: Optional[str], properties: Dict[str, Any]) -> List[StandInVertex]:
+        if not properties:
+            return [v for v in self.vertices.values() if label is None or v.label == label]
+        candidates = min((self._by_value.get((k, _hashable(v)), {}) for k, v in properties.items()), key=len)
+        return [v for v in candidates.values()
+                if (label is None or v.label == label)
+                and all(value in v.properties.get(key, []) for key, value in properties.items())]
+
+    def add_edge(self, label: str, out_v: StandInVertex, in_v: StandInVertex,
+                 properties: Dict[str, Any]) -> StandInEdge:
+        edge = StandInEdge(self._new_id(), label, dict(properties), out_v, in_v)
+        self.edges[edge.id] = edge
+        out_v.out_edges.append(edge)
+        in_v.in_edges.append(edge)
+        return edge
+
+    # Ids arrive as whatever the client sent: the API passes path parameters
+    # through as strings, so numeric strings are looked up as longs, the way
+    # JanusGraph converts them.
+    def vertex(self, vertex_id: Any) -> Optional[StandInVertex]:
+        return self.vertices.get(_coerce_id(vertex_id))
+
+    def edge(self, edge_id: Any) -> Optional[StandInEdge]:
+        return self.edges.get(_coerce_id(edge_id))
+
+    # Loads loader records (see air_routes_loader.iter_graphml / iter_csv_*).
+    # Edges whose endpoints are unknown are skipped. Returns the number of
+    # vertices and edges added.
+    def load(self, records: Iterable[Tuple]) -> Tuple[int, int]:
+        by_ext_id: Dict[str, StandInVertex] = {}
+        vertices = edges = 0
+        for record in records:
+            if record[0] == VERTEX:
+                _, ext_id, label, props = record
+                by_ext_id[ext_id] = self.add_vertex(label, props)
+                vertices += 1
+            elif record[0] == EDGE:
+                _, _, label, props, out_ext_id, in_ext_id = record
+                out_v, in_v = by_ext_id.get(out_ext_id), by_ext_id.get(in_ext_id)
+                if out_v is not None and in_v is not None:
+                    self.add_edge(label, out_v, in_v, props)
+                    edges += 1
+        return vertices, edges
+
+
+def _coerce_id(value: Any) -> Any:
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Request decoding
+# ---------------------------------------------------------------------------
+
+class StandInRequest:
+    def __init__(self, request_id: str, op: str, processor: str, args: Dict[str, Any]):
+        self.request_id = request_id
+        self.op = op
+        self.processor = processor
+        self.args = args
+
+
+def _make_p(cls, operator: str, args: List[Any]):
+    if operator in ("within", "without"):
+        return cls(operator, list(args))
+    if len(args) == 2:
+        return cls(operator, args[0], args[1])
+    return cls(operator, args[0] if args else None)
+
+
+# GraphBinaryReader only reads what a server sends back; requests also carry
+# predicates and strategies, which these add.
+class _PReader(graphbinaryV1._GraphBinaryTypeIO):
+    graphbinary_type = DataType.p
+    python_type = P
+
+    @classmethod
+    def objectify(cls, buff, reader, nullable=True):
+        return cls.is_null(buff, reader, cls._read_p, nullable)
+
+    @classmethod
+    def _read_p(cls, b, r):
+        operator = r.to_object(b, DataType.string, False)
+        args = [r.read_object(b) for _ in range(cls.read_int(b))]
+        return _make_p(cls.python_type, operator, args)
+
+
+class _TextPReader(_PReader):
+    graphbinary_type = DataType.textp
+    python_type = TextP
+
+
+class _StrategyReader(graphbinaryV1._GraphBinaryTypeIO):
+    graphbinary_type = DataType.traversalstrategy
+
+    @classmethod
+    def objectify(cls, buff, reader, nullable=True):
+        return cls.is_null(buff, reader, cls._read_strategy, nullable)
+
+    @classmethod
+    def _read_strategy(cls, b, r):
+        fqcn = r.to_object(b, DataType.string, False)
+        configuration = r.to_object(b, DataType.map, False)
+        return TraversalStrategy(fqcn.rsplit(".", 1)[-1], configuration, fqcn)
+
+
+_request_reader = graphbinaryV1.GraphBinaryReader({
+    DataType.p: _PReader,
+    DataType.textp: _TextPReader,
+    DataType.traversalstrategy: _StrategyReader,
+})
+
+
+def _read_graphbinary_request(b: io.BytesIO) -> StandInRequest:
+    b.read(1)  # version
+    high, low = struct.unpack(">QQ", b.read(16))
+    request_id = str(uuid.UUID(int=(high << 64) | low))
+    op = _request_reader.to_object(b, DataType.string, False)
+    processor = _request_reader.to_object(b, DataType.string, False)
+    args = {}
+    for _ in range(struct.unpack(">i", b.read(4))[0]):
+        key = _request_reader.read_object(b)
+        args[key] = _request_reader.read_object(b)
+    return StandInRequest(request_id, op, processor, args)
+
+
+_GRAPHSON_ENUMS = {"g:T": T, "g:Order": Order, "g:Scope": Scope, "g:Column": Column, "g:Pop": Pop,
+                   "g:Cardinality": Cardinality, "g:Merge": Merge}
+_GRAPHSON_NUMBERS = {"g:Int32", "g:Int64", "g:Float", "g:Double", "gx:Byte", "gx:BigInteger"}
+
+
+# The GraphSON readers of gremlin-python do not read bytecode, predicates or
+# tokens either, so request arguments are unpacked by hand.
+def _from_graphson(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_from_graphson(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "@type" not in value:
+        return {k: _from_graphson(v) for k, v in value.items()}
+    type_name, v = value["@type"], value.get("@value")
+    if type_name == "g:Bytecode":
+        bytecode = Bytecode()
+        bytecode.step_instructions = [[s[0]] + _from_graphson(s[1:]) for s in v.get("step", [])]
+        bytecode.source_instructions = [[s[0]] + _from_graphson(s[1:]) for s in v.get("source", [])]
+        return bytecode
+    if type_name in ("g:P", "g:TextP"):
+        cls = P if type_name == "g:P" else TextP
+        args = _from_graphson(v["value"])
+        if v["predicate"] in ("within", "without"):
+            return cls(v["predicate"], args if isinstance(args, list) else [args])
+        if isinstance(args, list):
+            return _make_p(cls, v["predicate"], args)
+        return cls(v["predicate"], args)
+    if type_name in _GRAPHSON_ENUMS:
+        return _GRAPHSON_ENUMS[type_name][SymbolUtil.to_snake_case(v)]
+    if type_name == "g:Direction":
+        return Direction[v]
+    if type_name in _GRAPHSON_NUMBERS:
+        return v
+    if type_name in ("g:List", "g:Set"):
+        return [_from_graphson(x) for x in v]
+    if type_name == "g:Map":
+        return {_hashable(_from_graphson(v[i])): _from_graphson(v[i + 1]) for i in range(0, len(v), 2)}
+    if type_name == "g:UUID":
+        return uuid.UUID(v)
+    if type_name.endswith("Strategy"):
+        return TraversalStrategy(type_name[2:], _from_graphson(v))
+    return _from_graphson(v)
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+def decode_request(message: bytes) -> Tuple[str, StandInRequest]:
+    mime_len = message[0]
+    mime = message[1:1 + mime_len].decode("utf-8")
+    body = message[1 + mime_len:]
+    if mime == MIME_GRAPHBINARY:
+        return mime, _read_graphbinary_request(io.BytesIO(body))
+    if mime in (MIME_GRAPHSON_V3, MIME_GRAPHSON_V2):
+        msg = json.loads(body)
+        request_id = msg["requestId"]
+        if isinstance(request_id, dict):
+            request_id = request_id["@value"]
+        return mime, StandInRequest(request_id, msg["op"], msg.get("processor", ""), _from_graphson(msg["args"]))
+    raise ValueError(f"Unsupported mime type: {mime}")
+
+
+# ---------------------------------------------------------------------------
+# Response encoding
+# ---------------------------------------------------------------------------
+
+# The result of profile(): the duration of the whole traversal and a
+# StepMetrics per step, durations in nanoseconds. Written as the server's
+# TraversalMetrics / Metrics types, which gremlin-python reads as plain maps.
+class StepMetrics:
+    __slots__ = ("id", "name", "dur", "counts", "annotations")
+
+    def __init__(self, id: str, name: str, dur: int, counts: Dict[str, int], annotations: Dict[str, Any]):
+        self.id = id
+        self.name = name
+        self.dur = dur
+        self.counts = counts
+        self.annotations = annotations
+
+    def as_map(self) -> Dict[str, Any]:
+        return {"id": self.id, "name": self.name, "dur": self.dur / 1e6, "counts": self.counts,
+                "annotations": self.annotations, "metrics": []}
+
+
+class TraversalProfile:
+    __slots__ = ("dur", "metrics")
+
+    def __init__(self, dur: int, metrics: List[StepMetrics]):
+        self.dur = dur
+        self.metrics = metrics
+
+    def as_map(self) -> Dict[str, Any]:
+        return {"dur": self.dur / 1e6, "metrics": self.metrics}
+
+
+class _MetricsIO(graphbinaryV1._GraphBinaryTypeIO):
+    graphbinary_type = DataType.metrics
+
+    @classmethod
+    def dictify(cls, obj: StepMetrics, writer, to_extend, as_value=False, nullable=True):
+        cls.prefix_bytes(cls.graphbinary_type, as_value, nullable, to_extend)
+        graphbinaryV1.StringIO.dictify(obj.id, writer, to_extend, True, False)
+        graphbinaryV1.StringIO.dictify(obj.name, writer, to_extend, True, False)
+        graphbinaryV1.LongIO.dictify(obj.dur, writer, to_extend, True, False)
+        graphbinaryV1.MapIO.dictify(obj.counts, writer, to_extend, True, False)
+        graphbinaryV1.MapIO.dictify(obj.annotations, writer, to_extend, True, False)
+        graphbinaryV1.ListIO.dictify([], writer, to_extend, True, False)
+        return to_extend
+
+
+class _TraversalMetricsIO(graphbinaryV1._GraphBinaryTypeIO):
+    graphbinary_type = DataType.traversalmetrics
+
+    @classmethod
+    def dictify(cls, obj: TraversalProfile, writer, to_extend, as_value=False, nullable=True):
+        cls.prefix_bytes(cls.graphbinary_type, as_value, nullable, to_extend)
+        graphbinaryV1.LongIO.dictify(obj.dur, writer, to_extend, True, False)
+        graphbinaryV1.ListIO.dictify(obj.metrics, writer, to_extend, True, False)
+        return to_extend
+
+
+# GraphSON sends the durations in milliseconds, as doubles.
+class _MetricsWriter:
+    graphson_type = "g:Metrics"
+
+    @classmethod
+    def dictify(cls, obj, writer) -> Dict[str, Any]:
+        return {"@type": cls.graphson_type, "@value": writer.to_dict(obj.as_map())}
+
+
+class _TraversalMetricsWriter(_MetricsWriter):
+    graphson_type = "g:TraversalMetrics"
+
+
+_graphbinary_writer = graphbinaryV1.GraphBinaryWriter({
+    StepMetrics: _MetricsIO,
+    TraversalProfile: _TraversalMetricsIO,
+})
+
+
+# gremlin-python reads g:Path but has no writer for it. GraphSON 3 types the
+# labels (a list of sets), GraphSON 2 leaves them as plain lists.
+class _PathWriter:
+    typed_labels = True
+
+    @classmethod
+    def dictify(cls, path: Path, writer) -> Dict[str, Any]:
+        labels = writer.to_dict(path.labels) if cls.typed_labels else [sorted(l) for l in path.labels]
+        return {"@type": "g:Path", "@value": {"labels": labels, "objects": writer.to_dict(path.objects)}}
+
+
+class _PathWriterV2(_PathWriter):
+    typed_labels = False
+
+
+_graphson_writers = {
+    MIME_GRAPHSON_V3: graphsonV3d0.GraphSONWriter({
+        Path: _PathWriter, StepMetrics: _MetricsWriter, TraversalProfile: _TraversalMetricsWriter,
+    }),
+    MIME_GRAPHSON_V2: graphsonV2d0.GraphSONWriter({
+        Path: _PathWriterV2, StepMetrics: _MetricsWriter, TraversalProfile: _TraversalMetricsWriter,
+    }),
+}
+
+
+# GraphSON 2 has no typed maps: T.id / T.label / Direction keys go out as
+# plain strings.
+def _string_keys(value: Any) -> Any:
+    if isinstance(value, Traverser):
+        return Traverser(_string_keys(value.object), value.bulk)
+    if isinstance(value, Path):
+        return Path(value.labels, _string_keys(value.objects))
+    if isinstance(value, dict):
+        return {(k.name if isinstance(k, (T, Direction)) else k): _string_keys(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_string_keys(v) for v in value]
+    return value
+
+
+def encode_response(mime: str, request_id: str, code: int, message: str = "", data: Any = None) -> bytes:
+    if mime == MIME_GRAPHBINARY:
+        buf = bytearray([0x81])
+        graphbinaryV1.UuidIO.dictify(uuid.UUID(request_id), _graphbinary_writer, buf, as_value=True, nullable=True)
+        buf.extend(struct.pack(">i", code))
+        graphbinaryV1.StringIO.dictify(message, _graphbinary_writer, buf, as_value=True, nullable=True)
+        graphbinaryV1.MapIO.dictify({}, _graphbinary_writer, buf, as_value=True, nullable=False)
+        graphbinaryV1.MapIO.dictify({}, _graphbinary_writer, buf, as_value=True, nullable=False)
+        _graphbinary_writer.to_dict(data, buf)
+        return bytes(buf)
+    if mime == MIME_GRAPHSON_V2:
+        data = _string_keys(data)
+    writer = _graphson_writers[mime]
+    return json.dumps({
+        "requestId": request_id,
+        "status": {"code": code, "message": message, "attributes": {}},
+        "result": {"data": writer.to_dict(data) if data is not None else None, "meta": {}},
+    }, separators=(",", ":")).encode("utf-8")
+
+
+# ---------------------------------------------------------------------------
+# Traversal evaluation
+# ---------------------------------------------------------------------------
+
+class UnsupportedStepError(Exception):
+    pass
+
+
+# The request's evaluationTimeout ran out. Checked between steps and between
+# repeat() iterations, so a single step is never cut short.
+class EvaluationTimeoutError(Exception):
+    pass
+
+
+# Steps that only configure the step before them (order().by(...)).
+MODULATORS = {"by", "with", "times", "until", "emit", "option", "from", "to", "as"}
+
+
+# Steps that make the interpreter track the path of every traverser.
+PATH_STEPS = {"repeat", "path", "simplePath", "cyclicPath", "loops"}
+# Steps that reduce all traversers at once; paths do not survive them.
+REDUCING_STEPS = {"count", "fold", "order", "groupCount"}
+# Most traversers a repeat() may hold before the request is failed, in place
+# of the server's evaluation timeout.
+MAX_REPEAT_TRAVERSERS = 1_000_000
+
+
+# state is per-traversal memory of the step (the seen set of a dedup(), the
+# count of a limit()). Inside repeat() the same Step runs on every iteration,
+# so, like on a real server, dedup() and limit() there act across iterations.
+class Step:
+    __slots__ = ("name", "args", "modulators", "state")
+
+    def __init__(self, name: str, args: List[Any]):
+        self.name = name
+        self.args = args
+        self.modulators: List[Tuple[str, List[Any]]] = []
+        self.state: Any = None
+
+    def modulator_args(self, name: str) -> List[List[Any]]:
+        return [args for n, args in self.modulators if n == name]
+
+
+def compile_steps(bytecode: Bytecode) -> List[Step]:
+    steps: List[Step] = []
+    for instruction in bytecode.step_instructions:
+        name, args = instruction[0], list(instruction[1:])
+        if name in MODULATORS and steps:
+            steps[-1].modulators.append((name, args))
+        else:
+            steps.append(Step(name, args))
+    return steps
+
+
+def _compare(op: str) -> Callable[[Any, Any], bool]:
+    def test(a, b):
+        try:
+            return {"lt": a < b, "lte": a <= b, "gt": a > b, "gte": a >= b}[op]
+        except TypeError:
+            return False
+    return test
+
+
+_P_OPERATORS: Dict[str, Callable[..., bool]] = {
+    "eq": lambda v, a, b: v == a,
+    "neq": lambda v, a, b: v != a,
+    "lt": lambda v, a, b: _compare("lt")(v, a),
+    "lte": lambda v, a, b: _compare("lte")(v, a),
+    "gt": lambda v, a, b: _compare("gt")(v, a),
+    "gte": lambda v, a, b: _compare("gte")(v, a),
+    "inside": lambda v, a, b: _compare("gt")(v, a) and _compare("lt")(v, b),
+    "outside": lambda v, a, b: _compare("lt")(v, a) or _compare("gt")(v, b),
+    "between": lambda v, a, b: _compare("gte")(v, a) and _compare("lt")(v, b),
+    "within": lambda v, a, b: v in a,
+    "without": lambda v, a, b: v not in a,
+    "startingWith": lambda v, a, b: isinstance(v, str) and v.startswith(a),
+    "endingWith": lambda v, a, b: isinstance(v, str) and v.endswith(a),
+    "containing": lambda v, a, b: isinstance(v, str) and a in v,
+    "notStartingWith": lambda v, a, b: isinstance(v, str) and not v.startswith(a),
+    "notEndingWith": lambda v, a, b: isinstance(v, str) and not v.endswith(a),
+    "notContaining": lambda v, a, b: isinstance(v, str) and a not in v,
+}
+
+
+def test_predicate(predicate: Any, value: Any) -> bool:
+    if not isinstance(predicate, P):
+        return value == predicate
+    if predicate.operator == "and":
+        return test_predicate(predicate.value, value) and test_predicate(predicate.other, value)
+    if predicate.operator == "or":
+        return test_predicate(predicate.value, value) or test_predicate(predicate.other, value)
+    if predicate.operator == "not":
+        return not test_predicate(predicate.value, value)
+    operator = _P_OPERATORS.get(predicate.operator)
+    if operator is None:
+        raise UnsupportedStepError(f"Predicate {predicate.operator} is not supported by the stand-in")
+    return operator(value, predicate.value, predicate.other)
+
+
+def _is_element(obj: Any) -> bool:
+    return isinstance(obj, (StandInVertex, StandInEdge))
+
+
+def _property_values(element: Any, key: str) -> List[Any]:
+    if isinstance(element, StandInVertex):
+        return element.properties.get(key, [])
+    if isinstance(element, StandInEdge):
+        return [element.properties[key]] if key in element.properties else []
+    if isinstance(element, dict):
+        return [element[key]] if key in element else []
+    return []
+
+
+def _token_value(element: Any, key: Any) -> List[Any]:
+    if key == T.id:
+        return [element.id]
+    if key == T.label:
+        return [element.label]
+    return _property_values(element, key)
+
+
+# A traverser of path-aware evaluation: the object, the objects it was reached
+# through (itself included) and the number of repeat() iterations it made.
+class Walker:
+    __slots__ = ("obj", "path", "loops")
+
+    def __init__(self, obj: Any, path: Tuple[Any, ...], loops: int = 0):
+        self.obj = obj
+        self.path = path
+        self.loops = loops
+
+
+# Evaluates bytecode over a StandInGraph. Traversers are plain Python objects
+# in a list (bulk is always 1); every step maps the list to the next one.
+# Traversals using repeat() or path() are evaluated with Walkers instead, see
+# walk().
+class Interpreter:
+    def __init__(self, graph: StandInGraph):
+        self.graph = graph
+        # time.monotonic() by which the running request must be done.
+        self.deadline: Optional[float] = None
+
+    def check_timeout(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise EvaluationTimeoutError()
+
+    def _handler(self, step: Step) -> Callable:
+        handler = getattr(self, "step_" + step.name.rstrip("_"), None)
+        if handler is None:
+            raise UnsupportedStepError(f"Step {step.name}() is not supported by the stand-in")
+        return handler
+
+    def run(self, bytecode: Bytecode, start: Optional[List[Any]] = None) -> List[Any]:
+        steps = compile_steps(bytecode)
+        if steps and steps[-1].name == "profile":
+            return [self.profile(steps[:-1], start)]
+        return self.evaluate(steps, start)
+
+    # timings, when given, gets a (step, nanoseconds, traversers out) tuple
+    # per top-level step.
+    def evaluate(self, steps: List[Step], start: Optional[List[Any]] = None,
+                 timings: Optional[List[Tuple[Step, int, int]]] = None) -> List[Any]:
+        if any(step.name in PATH_STEPS for step in steps):
+            walkers = None if start is None else [Walker(o, (o,)) for o in start]
+            return [w.obj for w in self.walk(steps, walkers, timings)]
+        objects = start
+        for step in steps:
+            self.check_timeout()
+            began = time.perf_counter_ns()
+            objects = self._handler(step)(objects, step)
+            if timings is not None:
+                timings.append((step, time.perf_counter_ns() - began, len(objects)))
+        return objects if objects is not None else []
+
+    # profile(): runs the traversal and reports the time spent in each step,
+    # the way the server's TraversalMetrics does (no storage backend
+    # metrics, there is no backend).
+    def profile(self, steps: List[Step], start: Optional[List[Any]] = None) -> TraversalProfile:
+        timings: List[Tuple[Step, int, int]] = []
+        began = time.perf_counter_ns()
+        self.evaluate(steps, start, timings)
+        total = time.perf_counter_ns() - began
+        metrics = []
+        for i, (step, dur, count) in enumerate(timings):
+            metrics.append(StepMetrics(
+                f"{i}.0.0()", _describe(step), dur,
+                {"traverserCount": count, "elementCount": count},
+                {"percentDur": dur * 100.0 / total if total else 0.0},
+            ))
+        return TraversalProfile(total, metrics)
+
+    # Path-aware evaluation. Steps with a walk_<name> method handle Walkers
+    # themselves; any other step is applied to each walker's object in turn,
+    # and every object it produces extends that walker's path (filters hand
+    # the same object back and keep the walker as it is). Reducing steps run
+    # over all objects at once and start new paths.
+    def walk(self, steps: List[Step], walkers: Optional[List[Walker]],
+             timings: Optional[List[Tuple[Step, int, int]]] = None) -> List[Walker]:
+        for step in steps:
+            self.check_timeout()
+            began = time.perf_counter_ns()
+            walkers = self._walk_step(step, walkers)
+            if timings is not None:
+                timings.append((step, time.perf_counter_ns() - began, len(walkers or ())))
+        return walkers if walkers is not None else []
+
+    def _walk_step(self, step: Step, walkers: Optional[List[Walker]]) -> List[Walker]:
+        name = step.name.rstrip("_")
+        special = getattr(self, "walk_" + name, None)
+        if special is not None:
+            return special(walkers, step)
+        handler = self._handler(step)
+        if walkers is None:
+            return [Walker(o, (o,)) for o in handler(None, step)]
+        if name in REDUCING_STEPS:
+            return [Walker(o, (o,)) for o in handler([w.obj for w in walkers], step)]
+        out = []
+        for w in walkers:
+            for o in handler([w.obj], step):
+                out.append(w if o is w.obj else Walker(o, w.path + (o,), w.loops))
+        return out
+
+    def _passes(self, bytecode: Any, walker: Walker) -> bool:
+        return bool(self.walk(compile_steps(bytecode), [walker]))
+
+    # repeat(body) with until() after it (checked after every iteration),
+    # times() and emit(). Traversers move one iteration at a time, all
+    # together, so results come out in breadth-first order.
+    def walk_repeat(self, walkers, step):
+        body = compile_steps(step.args[0])
+        until = [args[0] for args in step.modulator_args("until")]
+        times = [args[0] for args in step.modulator_args("times")]
+        emit = bool(step.modulator_args("emit"))
+        if not until and not times:
+            raise UnsupportedStepError("repeat() needs until() or times() in the stand-in")
+        out = []
+        frontier = walkers or []
+        while frontier:
+            following = []
+            for w in self.walk(body, frontier):
+                w = Walker(w.obj, w.path, w.loops + 1)
+                if (times and w.loops >= times[0]) or (until and self._passes(until[0], w)):
+                    out.append(Walker(w.obj, w.path))
+                else:
+                    following.append(w)
+                    if emit:
+                        out.append(Walker(w.obj, w.path))
+            self.check_timeout()
+            if len(following) > MAX_REPEAT_TRAVERSERS:
+                raise RuntimeError(f"repeat() exceeded {MAX_REPEAT_TRAVERSERS} traversers")
+            frontier = following
+        return out
+
+    def walk_loops(self, walkers, step):
+        return [Walker(w.loops, w.path + (w.loops,), w.loops) for w in walkers]
+
+    def walk_simplePath(self, walkers, step):
+        return [w for w in walkers if len(set(map(id, w.path))) == len(w.path)]
+
+    def walk_cyclicPath(self, walkers, step):
+        return [w for w in walkers if len(set(map(id, w.path))) != len(w.path)]
+
+    # path().by(a).by(b) applies the by()s round robin along the path.
+    def walk_path(self, walkers, step):
+        bys = [by[0] if by else None for by in step.modulator_args("by")] or [None]
+        out = []
+        for w in walkers:
+            path = Path([set() for _ in w.path],
+                        [self.value_of(o, bys[i % len(bys)]) for i, o in enumerate(w.path)])
+            out.append(Walker(path, w.path + (path,), w.loops))
+        return out
+
+    def walk_or(self, walkers, step):
+        return [w for w in walkers if any(self._passes(child, w) for child in step.args)]
+
+    def walk_and(self, walkers, step):
+        return [w for w in walkers if all(self._passes(child, w) for child in step.args)]
+
+    def walk_not(self, walkers, step):
+        return [w for w in walkers if not self._passes(step.args[0], w)]
+
+    def walk_dedup(self, walkers, step):
+        if step.state is None:
+            step.state = set()
+        out = []
+        for w in walkers:
+            key = w.obj.id if _is_element(w.obj) else _hashable(w.obj)
+            if key not in step.state:
+                step.state.add(key)
+                out.append(w)
+        return out
+
+    def walk_limit(self, walkers, step):
+        taken = step.state or 0
+        walkers = walkers[:max(0, step.args[-1] - taken)]
+        step.state = taken + len(walkers)
+        return walkers
+
+    # Evaluates a by() / has() argument against one object: a token, a
+    # property key or an anonymous traversal (first result).
+    def value_of(self, obj: Any, key: Any) -> Any:
+        if key is None:
+            return obj
+        if isinstance(key, Bytecode):
+            results = self.run(key, [obj])
+            return results[0] if results else None
+        values = _token_value(obj, key)
+        return values[0] if values else None
+
+    # --- start / filter steps ---
+
+    def step_V(self, objects, step):
+        ids = _flatten_ids(step.args)
+        if ids:
+            found = [self.graph.vertex(i) for i in ids]
+            vertices = [v for v in found if v is not None]
+        else:
+            vertices = list(self.graph.vertices.values())
+        return vertices if objects is None else [v for _ in objects for v in vertices]
+
+    def step_E(self, objects, step):
+        ids = _flatten_ids(step.args)
+        if ids:
+            edges = [e for e in (self.graph.edge(i) for i in ids) if e is not None]
+        else:
+            edges = list(self.graph.edges.values())
+        return edges if objects is None else [e for _ in objects for e in edges]
+
+    # g.inject(...) starts from the given values (health checks use it).
+    def step_inject(self, objects, step):
+        return list(step.args) if objects is None else list(objects) + list(step.args)
+
+    def step_hasLabel(self, objects, step):
+        labels = set(step.args)
+        return [o for o in objects if o.label in labels or any(
+            isinstance(l, P) and test_predicate(l, o.label) for l in step.args)]
+
+    def step_hasId(self, objects, step):
+        ids = {_coerce_id(i) for i in _flatten_ids(step.args) if not isinstance(i, P)}
+        predicates = [p for p in step.args if isinstance(p, P)]
+        return [o for o in objects if o.id in ids or any(test_predicate(p, o.id) for p in predicates)]
+
+    def step_has(self, objects, step):
+        args = step.args
+        if len(args) == 3:
+            label, key, predicate = args
+            objects = [o for o in objects if o.label == label]
+        elif len(args) == 2:
+            key, predicate = args
+        else:
+            return [o for o in objects if _token_value(o, args[0])]
+        if isinstance(predicate, Bytecode):
+            return [o for o in objects if any(self.run(predicate, [v]) for v in _token_value(o, key))]
+        if key == T.id and not isinstance(predicate, P):
+            predicate = _coerce_id(predicate)
+        return [o for o in objects if any(test_predicate(predicate, v) for v in _token_value(o, key))]
+
+    def step_hasNot(self, objects, step):
+        return [o for o in objects if not _token_value(o, step.args[0])]
+
+    def step_is(self, objects, step):
+        return [o for o in objects if test_predicate(step.args[0], o)]
+
+    def step_dedup(self, objects, step):
+        seen, out = set(), []
+        for o in objects:
+            key = o.id if _is_element(o) else _hashable(o)
+            if key not in seen:
+                seen.add(key)
+                out.append(o)
+        return out
+
+    def step_limit(self, objects, step):
+        return objects[:step.args[-1]]
+
+    def step_range(self, objects, step):
+        low, high = step.args[-2], step.args[-1]
+        return objects[low:] if high < 0 else objects[low:high]
+
+    def step_skip(self, objects, step):
+        return objects[step.args[-1]:]
+
+    def step_identity(self, objects, step):
+        return objects
+
+    def step_barrier(self, objects, step):
+        return objects
+
+    def step_or(self, objects, step):
+        return [o for o in objects if any(self.run(child, [o]) for child in step.args)]
+
+    def step_and(self, objects, step):
+        return [o for o in objects if all(self.run(child, [o]) for child in step.args)]
+
+    def step_not(self, objects, step):
+        return [o for o in objects if not self.run(step.args[0], [o])]
+
+    def step_order(self, objects, step):
+        objects = list(objects)
+        bys = step.modulator_args("by") or [[]]
+        for by in reversed(bys):
+            key = by[0] if by and not isinstance(by[0], Order) else None
+            order = next((a for a in by if isinstance(a, Order)), Order.asc)
+            if order == Order.shuffle:
+                random.shuffle(objects)
+                continue
+            objects.sort(key=lambda o: _sort_key(self.value_of(o, key)), reverse=order == Order.desc)
+        return objects
+
+    # --- navigation ---
+
+    def _adjacent(self, objects, step, edges_of: Callable, other_end: Optional[Callable]):
+        labels = set(step.args)
+        out = []
+        for v in objects:
+            for e in edges_of(v):
+                if not labels or e.label in labels:
+                    out.append(other_end(e, v) if other_end else e)
+        return out
+
+    def step_out(self, objects, step):
+        return self._adjacent(objects, step, lambda v: v.out_edges, lambda e, v: e.in_v)
+
+    def step_in(self, objects, step):
+        return self._adjacent(objects, step, lambda v: v.in_edges, lambda e, v: e.out_v)
+
+    def step_both(self, objects, step):
+        return self._adjacent(objects, step, lambda v: v.out_edges + v.in_edges,
+                              lambda e, v: e.in_v if e.out_v is v else e.out_v)
+
+    def step_outE(self, objects, step):
+        return self._adjacent(objects, step, lambda v: v.out_edges, None)
+
+    def step_inE(self, objects, step):
+        return self._adjacent(objects, step, lambda v: v.in_edges, None)
+
+    def step_bothE(self, objects, step):
+        return self._adjacent(objects, step, lambda v: v.out_edges + v.in_edges, None)
+
+    def step_outV(self, objects, step):
+        return [e.out_v for e in objects]
+
+    def step_inV(self, objects, step):
+        return [e.in_v for e in objects]
+
+    def step_bothV(self, objects, step):
+        return [v for e in objects for v in (e.out_v, e.in_v)]
+
+    # --- maps ---
+
+    def step_id(self, objects, step):
+        return [o.id for o in objects]
+
+    def step_label(self, objects, step):
+        return [o.label for o in objects]
+
+    def step_values(self, objects, step):
+        keys = step.args
+        out = []
+        for o in objects:
+            for key in keys or _keys(o):
+                out.extend(_property_values(o, key))
+        return out
+
+    def step_valueMap(self, objects, step):
+        args = list(step.args)
+        tokens = bool(args and isinstance(args[0], bool) and args.pop(0))
+        out = []
+        for o in objects:
+            row = {T.id: o.id, T.label: o.label} if tokens else {}
+            for key in args or _keys(o):
+                values = _property_values(o, key)
+                if values:
+                    row[key] = list(values) if isinstance(o, StandInVertex) else values[0]
+            out.append(row)
+        return out
+
+    def step_elementMap(self, objects, step):
+        out = []
+        for o in objects:
+            row = {T.id: o.id, T.label: o.label}
+            if isinstance(o, StandInEdge):
+                row[Direction.OUT] = {T.id: o.out_v.id, T.label: o.out_v.label}
+                row[Direction.IN] = {T.id: o.in_v.id, T.label: o.in_v.label}
+            for key in step.args or _keys(o):
+                values = _property_values(o, key)
+                if values:
+                    row[key] = values[-1]
+            out.append(row)
+        return out
+
+    def step_project(self, objects, step):
+        bys = step.modulator_args("by")
+        out = []
+        for o in objects:
+            row = {}
+            for i, key in enumerate(step.args):
+                by = bys[i % len(bys)] if bys else []
+                row[key] = self.value_of(o, by[0] if by else None)
+            out.append(row)
+        return out
+
+    def step_constant(self, objects, step):
+        return [step.args[0] for _ in objects]
+
+    # --- mutations ---
+
+    # property([cardinality,] key, value). Vertex properties are replaced
+    # with Cardinality.single (the default here) and appended to otherwise.
+    def step_property(self, objects, step):
+        args = list(step.args)
+        cardinality = args.pop(0) if isinstance(args[0], Cardinality) else Cardinality.single
+        key, value = args[0], args[1]
+        for o in objects:
+            if isinstance(o, StandInVertex):
+                self.graph.set_property(o, key, value, cardinality == Cardinality.single)
+            elif isinstance(o, StandInEdge):
+                o.properties[key] = value
+        return objects
+
+    # mergeV(search).option(onCreate, map).option(onMatch, map): the vertices
+    # matching search get the onMatch properties; when there is none, one is
+    # created from search and onCreate. Run once per incoming traverser.
+    # Unlike on the server, the writes of a failing traversal are not rolled
+    # back; the write queue only sends idempotent upserts, so a retry fixes
+    # what a failed batch left behind.
+    def step_mergeV(self, objects, step):
+        search = dict(step.args[0]) if step.args and step.args[0] else {}
+        on_create, on_match = self._merge_options(step)
+        label = search.pop(T.label, None)
+        vertex_id = search.pop(T.id, None)
+        out = []
+        for _ in objects if objects is not None else [None]:
+            if vertex_id is not None:
+                found = self.graph.vertex(vertex_id)
+                matches = [found] if found is not None and (label is None or found.label == label) \
+                    and all(v in found.properties.get(k, []) for k, v in search.items()) else []
+            else:
+                matches = self.graph.find_vertices(label, search)
+            if not matches:
+                created = {**search, **{k: v for k, v in on_create.items() if k not in (T.label, T.id)}}
+                out.append(self.graph.add_vertex(on_create.get(T.label, label or "vertex"), created))
+                continue
+            for vertex in matches:
+                for key, value in on_match.items():
+                    self.graph.set_property(vertex, key, value)
+                out.append(vertex)
+        return out
+
+    # mergeE(search) with the endpoints as Direction.OUT / Direction.IN ids,
+    # options as for mergeV(). Both vertices must exist.
+    def step_mergeE(self, objects, step):
+        search = dict(step.args[0]) if step.args and step.args[0] else {}
+        on_create, on_match = self._merge_options(step)
+        label = search.pop(T.label, None)
+        ends = {d: search.pop(d, None) for d in (Direction.OUT, Direction.IN)}
+        out = []
+        for _ in objects if objects is not None else [None]:
+            out_v, in_v = (self.graph.vertex(ends[d]) if ends[d] is not None else None
+                           for d in (Direction.OUT, Direction.IN))
+            if out_v is None or in_v is None:
+                raise RuntimeError(f"Vertex does not exist for mergeE: {ends[Direction.OUT]} -> {ends[Direction.IN]}")
+            matches = [e for e in out_v.out_edges
+                       if e.in_v is in_v and (label is None or e.label == label)
+                       and all(e.properties.get(k) == v for k, v in search.items())]
+            if not matches:
+                created = {**search, **{k: v for k, v in on_create.items() if not isinstance(k, (T, Direction))}}
+                out.append(self.graph.add_edge(on_create.get(T.label, label or "edge"), out_v, in_v, created))
+                continue
+            for edge in matches:
+                edge.properties.update(on_match)
+                out.append(edge)
+        return out
+
+    @staticmethod
+    def _merge_options(step: Step) -> Tuple[Dict[Any, Any], Dict[Any, Any]]:
+        options = {args[0]: dict(args[1] or {}) for args in step.modulator_args("option") if len(args) == 2}
+        return options.get(Merge.on_create, {}), options.get(Merge.on_match, {})
+
+    # union(a, b, ...): for every traverser, the results of each child in turn.
+    def step_union(self, objects, step):
+        out = []
+        for o in objects if objects is not None else [None]:
+            for child in step.args:
+                out.extend(self.run(child, None if o is None else [o]))
+        return out
+
+    # What iterate() appends: run everything, return nothing.
+    def step_none(self, objects, step):
+        return []
+
+    # --- reducing / flattening ---
+
+    def step_count(self, objects, step):
+        return [len(objects)]
+
+    def step_groupCount(self, objects, step):
+        bys = step.modulator_args("by")
+        key = bys[0][0] if bys and bys[0] else None
+        counts: Dict[Any, int] = {}
+        for o in objects:
+            value = self.value_of(o, key)
+            if value is not None:
+                value = _hashable(value)
+                counts[value] = counts.get(value, 0) + 1
+        return [counts]
+
+    def step_fold(self, objects, step):
+        return [list(objects)]
+
+    def step_unfold(self, objects, step):
+        out = []
+        for o in objects:
+            if isinstance(o, dict):
+                out.extend({k: v} for k, v in o.items())
+            elif isinstance(o, list):
+                out.extend(o)
+            else:
+                out.append(o)
+        return out
+
+
+def _flatten_ids(args: List[Any]) -> List[Any]:
+    ids = []
+    for a in args:
+        if isinstance(a, (list, tuple, set)):
+            ids.extend(a)
+        elif isinstance(a, (Vertex, Edge)):
+            ids.append(a.id)
+        else:
+            ids.append(a)
+    return ids
+
+
+# How a step shows up in a profile: its name and arguments, nested
+# traversals abbreviated.
+def _describe(step: Step) -> str:
+    args = ", ".join("[...]" if isinstance(a, Bytecode) else repr(a) for a in step.args)
+    return f"{step.name}({args})"
+
+
+def _keys(element: Any) -> List[str]:
+    if _is_element(element):
+        return list(element.properties)
+    if isinstance(element, dict):
+        return list(element)
+    return []
+
+
+# None sorts first and values of different types are kept apart instead of
+# raising TypeError.
+def _sort_key(value: Any) -> Tuple:
+    if value is None:
+        return (0, "", 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, "", value)
+    return (2, type(value).__name__, str(value) if not isinstance(value, str) else value)
+
+
+# Turns the interpreter's own objects into types the serializers can write.
+def to_wire(value: Any) -> Any:
+    if isinstance(value, StandInVertex):
+        return Vertex(value.id, value.label)
+    if isinstance(value, StandInEdge):
+        return Edge(value.id, Vertex(value.out_v.id, value.out_v.label), value.label,
+                    Vertex(value.in_v.id, value.in_v.label))
+    if isinstance(value, Path):
+        return Path(value.labels, [to_wire(o) for o in value.objects])
+    if isinstance(value, dict):
+        return {to_wire(k): to_wire(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_wire(v) for v in value]
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+# The GremlinStandIn Class
+# aiohttp application serving the WebSocket endpoint at /gremlin. Requests are
+# evaluated on the event loop one after the other (the graph is in memory, so
+# there is nothing to wait for) and the results are written back in frames of
+# batchSize, 206 for every frame but the last, like Gremlin Server does.
+class GremlinStandIn:
+    def __init__(self, graph: StandInGraph, batch_size: int = DEFAULT_BATCH_SIZE, latency: float = 0.0):
+        self.graph = graph
+        self.interpreter = Interpreter(graph)
+        self.batch_size = batch_size
+        # Seconds added before every response, to play a slow cluster node.
+        self.latency = latency
+        self.requests = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/gremlin", self._handle_ws)
+        return app
+
+    async def start(self, host: str = "localhost", port: int = 8182):
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        async for msg in ws:
+            if msg.type == WSMsgType.BINARY:
+                await self._handle_message(ws, msg.data)
+            elif msg.type == WSMsgType.TEXT:
+                await self._handle_message(ws, msg.data.encode("utf-8"))
+        return ws
+
+    async def _handle_message(self, ws: web.WebSocketResponse, message: bytes):
+        try:
+            mime, request = decode_request(message)
+        except Exception as e:
+            print(f"Malformed request: {e}", file=sys.stderr)
+            return
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for frame in self.respond(mime, request):
+            await ws.send_bytes(frame)
+            # Let the other connections' requests in between frames, the
+            # way the server's worker pool would serve them side by side.
+            await asyncio.sleep(0)
+
+    # Yields the response frames for one request.
+    def respond(self, mime: str, request: StandInRequest) -> Iterator[bytes]:
+        request_id = request.request_id
+        if request.op != "bytecode":
+            yield encode_response(mime, request_id, STATUS_REQUEST_ERROR_INVALID_REQUEST_ARGUMENTS,
+                                  f"Operation {request.op} is not supported by the stand-in")
+            return
+        bytecode = request.args.get("gremlin")
+        if not isinstance(bytecode, Bytecode):
+            yield encode_response(mime, request_id, STATUS_REQUEST_ERROR_MALFORMED_REQUEST, "Missing bytecode")
+            return
+        timeout = request.args.get("evaluationTimeout")
+        deadline = time.monotonic() + timeout / 1000.0 if timeout else None
+        self.interpreter.deadline = deadline
+        try:
+            results = [Traverser(to_wire(o), 1) for o in self.interpreter.run(bytecode)]
+        except EvaluationTimeoutError:
+            yield self._timeout_response(mime, request_id)
+            return
+        except UnsupportedStepError as e:
+            yield encode_response(mime, request_id, STATUS_SERVER_ERROR_EVALUATION, str(e))
+            return
+        except Exception as e:
+            yield encode_response(mime, request_id, STATUS_SERVER_ERROR, f"{type(e).__name__}: {e}")
+            return
+        if not results:
+            yield encode_response(mime, request_id, STATUS_NO_CONTENT)
+            return
+        batch_size = int(request.args.get("batchSize") or self.batch_size)
+        for start in range(0, len(results), batch_size):
+            # The timeout covers sending the results too, as on the server.
+            if deadline is not None and time.monotonic() > deadline:
+                yield self._timeout_response(mime, request_id)
+                return
+            last = start + batch_size >= len(results)
+            yield encode_response(mime, request_id, STATUS_SUCCESS if last else STATUS_PARTIAL_CONTENT,
+                                  data=results[start:start + batch_size])
+
+    @staticmethod
+    def _timeout_response(mime: str, request_id: str) -> bytes:
+        return encode_response(mime, request_id, STATUS_SERVER_ERROR_TIMEOUT,
+                               f"A timeout occurred during traversal evaluation of [{request_id}] "
+                               f"- consider increasing the limit given to evaluationTimeout")
+
+
+def build_graph(args: argparse.Namespace) -> StandInGraph:
+    graph = StandInGraph()
+    if args.graphml:
+        graph.load(iter_graphml(args.graphml))
+    elif args.vertices:
+        # Edges reference vertices by their external ids, so both files go
+        # through one load() call.
+        edges = iter_csv_edges(args.edges) if args.edges else ()
+        graph.load(itertools.chain(iter_csv_vertices(args.vertices), edges))
+    else:
+        graph.load(AirRoutesGenerator(args.airports, args.routes, seed=args.seed).records())
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory Gremlin Server stand-in")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8182)
+    parser.add_argument("--graphml", help="GraphML file to load")
+    parser.add_argument("--vertices", help="Gremlin CSV vertex file to load")
+    parser.add_argument("--edges", help="Gremlin CSV edge file to load (with --vertices)")
+    parser.add_argument("--airports", type=int, default=1000, help="synthetic graph size when no file is given")
+    parser.add_argument("--routes", type=int, default=8, help="synthetic routes per airport")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="delay before every response, e.g. to play a slow node behind a load balancer")
+    args = parser.parse_args()
+
+    graph = build_graph(args)
+    standin = GremlinStandIn(graph, batch_size=args.batch_size, latency=args.latency_ms / 1000.0)
+
+    async def serve():
+        await standin.start(args.host, args.port)
+        print(f"Gremlin stand-in on ws://{args.host}:{args.port}/gremlin "
+              f"({len(graph.vertices)} vertices, {len(graph.edges)} edges)", flush=True)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
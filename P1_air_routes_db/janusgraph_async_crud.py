@@ -0,0 +1,239 @@
+import asyncio
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
+from gremlin_python.driver.protocol import GremlinServerError
+from gremlin_python.structure.graph import Graph
+from gremlin_python.process.graph_traversal import GraphTraversalSource, GraphTraversal
+
+from connection_pool import ConnectionUnavailableError
+from deadlines import DeadlineExceededError, Deadline, SERVER_TIMEOUT_STATUS, current_deadline, wait_within
+from metrics import observe_traversal, TraversalRecord
+from single_flight import SingleFlight, traversal_key
+from janusgraph_crud import (
+    VertexNotFoundError, normalize_results, value_map, decode_cursor,
+    build_vertex_page_query, split_page, match_ids,
+    build_route_query, route_paths, NeighborhoodExpansion, wire_serializer, submit_bytecode,
+    build_upsert_query, WriteRejectedError,
+)
+
+
+# The async counterpart of GraphCRUDOperations. The traversals are the same,
+# but instead of the blocking terminal steps (.toList() / .next()) they are
+# submitted with promise(), which sends the bytecode through the driver's
+# submit_async() and hands back a concurrent.futures.Future. asyncio.wrap_future
+# turns that into something the event loop can await, so a request waiting on
+# JanusGraph holds no thread of its own.
+#
+# It can be created in two ways:
+#  - AsyncGraphCRUDOperations(g) runs every traversal on the remote connection
+#    g is bound to, like GraphCRUDOperations does.
+#  - AsyncGraphCRUDOperations(connections=janus_graph_manager) builds the
+#    traversals on an unbound source and leases a pooled connection only for
+#    the time a traversal is actually in flight. Requests answered without a
+#    traversal (cache hits, coalesced calls) never take a connection.
+# With single_flight, identical traversals running concurrently are sent once
+# and their result is shared, see single_flight.py. Every traversal honours
+# the deadline of the request (see deadlines.py). ConnectionUnavailableError
+# and DeadlineExceededError are passed through unwrapped so the API can answer
+# 503 / 504 instead of 500/404.
+class AsyncGraphCRUDOperations:
+    def __init__(self, g: Optional[GraphTraversalSource] = None, connections=None,
+                 single_flight: Optional[SingleFlight] = None):
+        if g is None and connections is None:
+            raise ValueError("Either a traversal source or a connection provider is required.")
+        self.g = g if g is not None else Graph().traversal()
+        self.connections = connections if g is None else None
+        self.single_flight = single_flight
+
+    # Submits the traversal and resolves to the list of its results, passed
+    # through normalize when given. Reported to the metrics under name (see
+    # metrics.py); a call coalesced into another one only reports its total.
+    # Every caller stops waiting at its own deadline, see _shared().
+    # coalesce=False sends the traversal even when single_flight is set.
+    async def _submit(self, traversal: GraphTraversal, name: str = "traversal", normalize=None,
+                      hedged: bool = False, coalesce: bool = True) -> Any:
+        deadline = current_deadline()
+        with observe_traversal(name, traversal) as record:
+            if self.single_flight is None or not coalesce:
+                results = await self._execute(traversal, record, deadline, hedged)
+            else:
+                results = await self._shared(traversal, record, deadline, hedged)
+            if normalize is not None:
+                results = normalize(results)
+                record.normalized()
+            return results
+
+    # Runs the traversal through single_flight. The shared execution runs
+    # under the deadline of the caller that started it, which is what tells
+    # the server when to stop. When that deadline passes, a caller that
+    # joined it with more time left does not fail with it: it runs the
+    # traversal again under its own deadline (or joins a rerun another
+    # caller already started). So a caller with a 1 ms budget cannot make
+    # the identical requests of others answer 504, and every caller waits
+    # no longer than its own deadline.
+    async def _shared(self, traversal: GraphTraversal, record: TraversalRecord,
+                      deadline: Optional[Deadline], hedged: bool) -> List[Any]:
+        key = traversal_key(traversal)
+        while True:
+            started = []
+
+            def execute():
+                started.append(True)
+                return self._execute(traversal, record, deadline, hedged)
+
+            try:
+                return await wait_within(self.single_flight.do(key, execute), deadline)
+            except DeadlineExceededError:
+                if started or (deadline is not None and deadline.expired()):
+                    raise
+
+    # The bytecode is sent with submit_bytecode(), which is what promise()
+    # does under the hood, on the bound g or on a leased connection. The
+    # driver's future resolves once every result has been received. Under a
+    # deadline the time left goes along as evaluationTimeout, and the wait
+    # ends at the deadline: the connection, which still has a response on
+    # its way, is then replaced by the pool (see connection_pool.must_replace).
+    # hedged=True lets a provider spread over several Gremlin Servers send
+    # the traversal to a second one when the first is slow to answer (see
+    # JanusGraphManager.run_hedged_async); only for idempotent reads.
+    async def _execute(self, traversal: GraphTraversal, record: TraversalRecord,
+                       deadline: Optional[Deadline] = None, hedged: bool = False) -> List[Any]:
+        if self.connections is None:
+            record.leased(wire_serializer(self.g), waited=False)
+            results = await self._send(self.g, traversal, deadline)
+            record.received(len(results))
+            return results
+        if hedged and hasattr(self.connections, "run_hedged_async"):
+            attempts = []
+
+            async def attempt(g: GraphTraversalSource) -> List[Any]:
+                # The metrics follow the first attempt's connection.
+                if not attempts:
+                    record.leased(wire_serializer(g))
+                attempts.append(g)
+                return await self._send(g, traversal, deadline)
+
+            results = await self.connections.run_hedged_async(attempt)
+            record.received(len(results))
+            return results
+        async with self.connections.lease_async() as g:
+            record.leased(wire_serializer(g))
+            results = await self._send(g, traversal, deadline)
+            record.received(len(results))
+            return results
+
+    async def _send(self, g: GraphTraversalSource, traversal: GraphTraversal,
+                    deadline: Optional[Deadline]) -> List[Any]:
+        if deadline is None:
+            return await asyncio.wrap_future(submit_bytecode(g, traversal.bytecode))
+        deadline.check()
+        future = submit_bytecode(g, traversal.bytecode, deadline.request_options())
+        try:
+            return await wait_within(asyncio.wrap_future(future), deadline, abandoned=True)
+        except GremlinServerError as e:
+            if e.status_code == SERVER_TIMEOUT_STATUS:
+                raise DeadlineExceededError(f"Deadline of {deadline.timeout * 1000:.0f} ms exceeded on the server: "
+                                            f"{e.status_message}")
+            raise
+
+    # Same as GraphCRUDOperations.get_all_vertices, awaited on the event loop.
+    async def get_all_vertices(self, label: Optional[str] = None, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        query = self.g.V()
+        if label:
+            query = query.hasLabel(label)
+        try:
+            return await self._submit(value_map(query, fields), "get_all_vertices", normalize_results)
+        except (ConnectionUnavailableError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to get vertices: {e}")
+
+    # Same as GraphCRUDOperations.get_vertex_page.
+    async def get_vertex_page(self, label: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None,
+                              fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        after_id = decode_cursor(cursor) if cursor else None
+        try:
+            rows = await self._submit(build_vertex_page_query(self.g, label, limit, after_id, fields),
+                                      "get_vertex_page", normalize_results)
+        except (ConnectionUnavailableError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to get vertices: {e}")
+        return split_page(rows, limit)
+
+    # Same as GraphCRUDOperations.get_vertex_by_id. An empty result list is
+    # how a missing vertex shows up here, since next() is not used. Hedged
+    # when the connection provider hedges reads.
+    async def get_vertex_by_id(self, vertex_id: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        try:
+            rows = await self._submit(value_map(self.g.V(vertex_id), fields), "get_vertex_by_id",
+                                      normalize_results, hedged=True)
+        except (ConnectionUnavailableError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Vertex {vertex_id} not found or query failed: {e}")
+        if not rows:
+            raise VertexNotFoundError(f"Vertex {vertex_id} not found or query failed: no such vertex")
+        return rows[0]
+
+    # Same as GraphCRUDOperations.get_vertices_by_ids, hedged as well.
+    async def get_vertices_by_ids(self, ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+        if not ids:
+            return {}
+        try:
+            rows = await self._submit(value_map(self.g.V(*ids), fields), "get_vertices_by_ids", normalize_results,
+                                      hedged=True)
+        except (ConnectionUnavailableError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to get vertices by id: {e}")
+        return match_ids(ids, rows)
+
+    # Same as GraphCRUDOperations.upsert_elements. Never hedged nor coalesced:
+    # identical writes running at the same time are each sent.
+    async def upsert_elements(self, writes: List[Any]) -> List[Any]:
+        if not writes:
+            return []
+        try:
+            return await self._submit(build_upsert_query(self.g, writes), "upsert_elements", list,
+                                      coalesce=False)
+        except (ConnectionUnavailableError, DeadlineExceededError):
+            raise
+        except GremlinServerError as e:
+            raise WriteRejectedError(f"Write of {len(writes)} elements rejected: {e}")
+        except Exception as e:
+            raise RuntimeError(f"Failed to write {len(writes)} elements: {e}")
+
+    # Same as GraphCRUDOperations.get_route_paths.
+    async def get_route_paths(self, from_id: str, to_id: str, edge_label: str = "route", max_hops: int = 4,
+                              weight_key: str = "dist", weighted: bool = False, budget: int = 10000,
+                              candidates: int = 100) -> List[Tuple[List[Any], List[Any]]]:
+        query = build_route_query(self.g, from_id, to_id, edge_label, max_hops, weight_key, weighted,
+                                  budget, candidates)
+        try:
+            return await self._submit(query, "get_route_paths", route_paths)
+        except (ConnectionUnavailableError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to search routes: {e}")
+
+    # Same as GraphCRUDOperations.iter_neighborhood, as an async generator.
+    # Each level leases a connection only while its traversal runs, so a
+    # deep expansion does not hold one for the whole request.
+    async def iter_neighborhood(self, vertex_id: str, hops: int, direction: str = "out",
+                                edge_label: Optional[str] = None, level_limit: int = 1000,
+                                max_vertices: int = 10000, max_edges: int = 100000,
+                                fields: Optional[List[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        start = await self.get_vertex_by_id(vertex_id, fields)
+        yield {"level": 0, "vertices": [start], "truncated": False}
+        expansion = NeighborhoodExpansion(start, hops, direction, edge_label, level_limit, max_vertices,
+                                          max_edges, fields)
+        query = expansion.next_query(self.g)
+        while query is not None:
+            try:
+                level = await self._submit(query, "neighborhood_level", normalize_results)
+            except (ConnectionUnavailableError, DeadlineExceededError):
+                raise
+            except Exception as e:
+                raise RuntimeError(f"Failed to expand the neighborhood of {vertex_id}: {e}")
+            yield expansion.add_level(level)
+            query = expansion.next_query(self.g)
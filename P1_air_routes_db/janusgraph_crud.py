@@ -1,6 +1,16 @@
-from typing import Optional, List, Dict, Any
-from gremlin_python.process.graph_traversal import GraphTraversalSource
-from gremlin_python.process.traversal import T
+import base64
+import binascii
+import json
+import queue
+import time
+from concurrent.futures import Future
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Tuple
+from gremlin_python.driver.driver_remote_connection import DriverRemoteConnection
+from gremlin_python.driver.protocol import GremlinServerError
+from gremlin_python.process.graph_traversal import GraphTraversalSource, GraphTraversal, __
+from gremlin_python.process.traversal import Bytecode, T, P, Order, Traverser, Direction, Merge
+
+from metrics import observe_traversal
 
 # When you use Gremlin's valueMap(True), it returns a dictionary which contains 
 # special keys like the element's ID and label, represented by T.id and T.label 
@@ -28,14 +38,436 @@ def normalize_result(raw: Dict[str, Any]) -> Dict[str, Any]:
     return normalized
 
 
+# Translated key names per key layout, e.g. (T.id, T.label, 'code', 'city')
+# -> ('id', 'label', 'code', 'city'). All vertices of a label come back with
+# the same keys in the same order, so in practice this holds one entry per
+# label (and per fields projection). Bounded so odd data cannot grow it forever.
+_KEY_SCHEMAS: Dict[Tuple[Any, ...], Tuple[str, ...]] = {}
+_MAX_KEY_SCHEMAS = 1024
+
+
+def _key_names(keys: Tuple[Any, ...]) -> Tuple[str, ...]:
+    names = _KEY_SCHEMAS.get(keys)
+    if names is None:
+        names = tuple(k.name if isinstance(k, T) else str(k) for k in keys)
+        if len(_KEY_SCHEMAS) >= _MAX_KEY_SCHEMAS:
+            _KEY_SCHEMAS.clear()
+        _KEY_SCHEMAS[keys] = names
+    return names
+
+
+# Bulk version of normalize_result for whole result batches, with the same
+# output. normalize_result pays for isinstance(k, T) and str(k) on every key of
+# every row; here the translated key names are looked up once per key layout.
+# Consecutive rows usually share their layout, and comparing the key tuple
+# with the previous one is mostly identity checks, so the schema lookup (which
+# has to hash the T enum keys) only happens when the layout changes. What is
+# left per row is one pass over the values and one dict construction.
+def normalize_results(rows: Iterable[Dict[Any, Any]]) -> List[Dict[str, Any]]:
+    normalized = []
+    append = normalized.append
+    last_keys = None
+    names: Tuple[str, ...] = ()
+    for raw in rows:
+        keys = tuple(raw)
+        if keys != last_keys:
+            names = _key_names(keys)
+            last_keys = keys
+        append({
+            name: v[0] if v.__class__ is list and len(v) == 1 else v
+            for name, v in zip(names, raw.values())
+        })
+    return normalized
+
+
+# Columnar flavour of normalize_results: one list per key instead of one dict
+# per row, e.g. {'id': [1, 2], 'code': ['AUS', 'DFW']}. A row that lacks a key
+# gets None in that column, so every column has one entry per row. Handy for
+# analytics code and compact JSON payloads.
+def normalize_columns(rows: Iterable[Dict[Any, Any]]) -> Dict[str, List[Any]]:
+    columns: Dict[str, List[Any]] = {}
+    count = 0
+    last_keys = None
+    targets: List[List[Any]] = []
+    for raw in rows:
+        keys = tuple(raw)
+        if keys != last_keys:
+            targets = []
+            for name in _key_names(keys):
+                column = columns.get(name)
+                if column is None:
+                    column = columns[name] = [None] * count
+                targets.append(column)
+            last_keys = keys
+        for column, v in zip(targets, raw.values()):
+            column.append(v[0] if v.__class__ is list and len(v) == 1 else v)
+        count += 1
+        # Pad the columns this row had no value for.
+        if len(targets) != len(columns):
+            for column in columns.values():
+                if len(column) < count:
+                    column.append(None)
+    return columns
+
+# Raised by get_vertex_by_id when the vertex does not exist, as opposed to the
+# query failing. It is a RuntimeError so existing callers keep working, while
+# callers that care (e.g. the read cache) can tell the two cases apart.
+class VertexNotFoundError(RuntimeError):
+    pass
+
+
+# Raised by upsert_elements when the Gremlin Server refused the writes (an
+# edge to a vertex that does not exist, a value of the wrong type), as
+# opposed to the request not getting through. Sending the same writes again
+# fails the same way.
+class WriteRejectedError(RuntimeError):
+    pass
+
+
+# Appends the valueMap step. With fields the property keys are pushed down into
+# the traversal as valueMap(True, *fields), so the server only reads and sends
+# those properties (plus id and label) instead of every property of every
+# vertex. Without fields it is the plain valueMap(True) used everywhere else.
+def value_map(query: GraphTraversal, fields: Optional[List[str]] = None) -> GraphTraversal:
+    if fields:
+        return query.valueMap(True, *fields)
+    return query.valueMap(True)
+
+
+# Pagination cursors are opaque to clients: the id of the last vertex of a page
+# wrapped in JSON (which keeps numeric JanusGraph ids numeric) and encoded as
+# url-safe base64. A cursor that cannot be decoded raises ValueError.
+def encode_cursor(last_id: Any) -> str:
+    raw = json.dumps({"after": last_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Any:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))["after"]
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+# Builds one page of a keyset-paginated vertex listing: vertices ordered by id,
+# starting right after after_id. Unlike range(offset, offset + n), which makes
+# the server produce and skip offset vertices first, the has(T.id, gt(...))
+# filter lets every page be computed as a top-n of the remaining vertices, so
+# page 1000 costs about the same as page 1. One extra vertex is fetched so the
+# caller can tell whether another page exists.
+def build_vertex_page_query(g: GraphTraversalSource, label: Optional[str], limit: int, after_id: Any = None,
+                            fields: Optional[List[str]] = None) -> GraphTraversal:
+    query = g.V()
+    if label:
+        query = query.hasLabel(label)
+    if after_id is not None:
+        query = query.has(T.id, P.gt(after_id))
+    return value_map(query.order().by(T.id, Order.asc).limit(limit + 1), fields)
+
+
+# Splits the limit + 1 normalized rows of build_vertex_page_query into the page
+# itself and the cursor for the next one (None on the last page).
+def split_page(rows: List[Dict[str, Any]], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1]["id"])
+    return rows, None
+
+
+# Lines the results of a g.V(*ids) multi-get up with the requested ids. The
+# server returns only the vertices it found, in no particular order, so each
+# requested id maps to its vertex or to None when it does not exist. Ids are
+# compared as strings because they come in from the URL/JSON as strings while
+# JanusGraph hands back numeric ids.
+def match_ids(ids: List[str], rows: List[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+    by_id = {str(row["id"]): row for row in rows}
+    return {vertex_id: by_id.get(str(vertex_id)) for vertex_id in ids}
+
+
+# Builds the bounded server-side search behind GET /routes/shortest. From
+# from_id the traversal follows edge_label edges out, one hop per repeat()
+# iteration, until it stands on to_id or has made max_hops hops; traversers
+# that ran out of hops are dropped by the hasId() after the loop. The path
+# comes back as [vertex id, [weight], vertex id, [weight], ..., vertex id],
+# the weights being the weight_key property of each edge (an empty list when
+# an edge lacks it).
+# - Fewest hops (weighted=False): the dedup() inside the loop keeps one
+#   traverser per vertex for the whole traversal and barrier() makes every
+#   iteration finish before the next starts, so this is a breadth-first
+#   search that visits each vertex once and the first path found has the
+#   fewest hops.
+# - Smallest total weight (weighted=True): every simple path is followed, so
+#   the limit(budget) inside the loop caps the traversers expanded over the
+#   whole search and at most candidates paths are returned, to be ranked by
+#   the caller. It is a bounded best effort, not an exact Dijkstra.
+def build_route_query(g: GraphTraversalSource, from_id: Any, to_id: Any, edge_label: str, max_hops: int,
+                      weight_key: str, weighted: bool = False, budget: int = 10000,
+                      candidates: int = 100) -> GraphTraversal:
+    step = __.outE(edge_label).inV().simplePath()
+    step = step.limit(budget) if weighted else step.dedup().barrier()
+    return (g.V(from_id)
+            .repeat(step)
+            .until(__.or_(__.hasId(to_id), __.loops().is_(P.gte(max_hops))))
+            .hasId(to_id)
+            .limit(candidates if weighted else 1)
+            .path().by(T.id).by(__.values(weight_key).fold()))
+
+
+# Splits the paths of build_route_query into (vertex ids, edge weights) pairs.
+# A weight is None when the edge has no such property.
+def route_paths(paths: Iterable[Any]) -> List[Tuple[List[Any], List[Any]]]:
+    routes = []
+    for path in paths:
+        objects = list(path.objects)
+        weights = [w[0] if w else None for w in objects[1::2]]
+        routes.append((objects[0::2], weights))
+    return routes
+
+
+# One level of a k-hop neighborhood: the vertices one edge_label edge away
+# (in direction 'out', 'in' or 'both') from the frontier ids, minus those
+# already visited, deduplicated. The first limit(max_edges) bounds the edges
+# the server walks from a frontier full of hubs, the second the vertices the
+# level returns.
+def build_neighborhood_query(g: GraphTraversalSource, frontier: List[Any], direction: str,
+                             edge_label: Optional[str], visited: List[Any], limit: int,
+                             max_edges: int, fields: Optional[List[str]] = None) -> GraphTraversal:
+    labels = [edge_label] if edge_label else []
+    query = g.V(*frontier)
+    if direction == "out":
+        query = query.out(*labels)
+    elif direction == "in":
+        query = query.in_(*labels)
+    elif direction == "both":
+        query = query.both(*labels)
+    else:
+        raise ValueError(f"Invalid direction: {direction!r}")
+    query = query.limit(max_edges).hasId(P.without(visited)).dedup().limit(limit)
+    return value_map(query, fields)
+
+
+# Bookkeeping of a level by level neighborhood expansion, shared by the sync
+# and async CRUD classes: which vertices were seen, which ones the next level
+# starts from and how many more the request may still return. next_query()
+# builds the traversal of the next level (None once there is nothing left to
+# do) and add_level() records its result and returns the level as one
+# response line: {'level': n, 'vertices': [...], 'truncated': bool}. A level
+# is truncated when it hit its limit, i.e. there may be more vertices at that
+# distance than were returned.
+class NeighborhoodExpansion:
+    def __init__(self, start: Dict[str, Any], hops: int, direction: str = "out", edge_label: Optional[str] = None,
+                 level_limit: int = 1000, max_vertices: int = 10000, max_edges: int = 100000,
+                 fields: Optional[List[str]] = None):
+        self.hops = hops
+        self.direction = direction
+        self.edge_label = edge_label
+        self.level_limit = level_limit
+        self.max_edges = max_edges
+        self.fields = fields
+        self.level = 0
+        self.visited = [start["id"]]
+        self.frontier = [start["id"]]
+        self.remaining = max_vertices
+        self._cap = 0
+
+    def next_query(self, g: GraphTraversalSource) -> Optional[GraphTraversal]:
+        if self.level >= self.hops or not self.frontier or self.remaining <= 0:
+            return None
+        self._cap = min(self.level_limit, self.remaining)
+        return build_neighborhood_query(g, self.frontier, self.direction, self.edge_label, self.visited,
+                                        self._cap, self.max_edges, self.fields)
+
+    def add_level(self, vertices: List[Dict[str, Any]]) -> Dict[str, Any]:
+        self.level += 1
+        self.frontier = [v["id"] for v in vertices]
+        self.visited.extend(self.frontier)
+        self.remaining -= len(vertices)
+        return {"level": self.level, "vertices": vertices, "truncated": len(vertices) >= self._cap}
+
+
+# Idempotent element writes, for the write API and the write-behind queue
+# (see write_queue.py). Every write is an upsert, so sending one twice, e.g.
+# after a timeout whose outcome is unknown, leaves the graph as sending it once.
+#
+# VertexUpsert: the vertex of label whose match properties have these values
+# (its natural key, e.g. {'code': 'AUS'} for an airport) gets properties set;
+# it is created, with match and properties, when there is none. A mergeV()
+# with the same map for onCreate and onMatch:
+#   mergeV([(T.label): 'airport', code: 'AUS'])
+#     .option(onCreate, [city: 'Austin']).option(onMatch, [city: 'Austin'])
+# onCreate is merged with the search map by the server, so the match keys are
+# not repeated in it. Two transactions creating the same vertex at the same
+# time both create it unless the match keys have a unique composite index.
+class VertexUpsert:
+    __slots__ = ("label", "match", "properties")
+
+    def __init__(self, label: str, match: Dict[str, Any], properties: Optional[Dict[str, Any]] = None):
+        if not match:
+            raise ValueError("A vertex upsert needs at least one match property.")
+        self.label = label
+        self.match = dict(match)
+        self.properties = {k: v for k, v in (properties or {}).items() if k not in self.match}
+
+    def traversal(self) -> GraphTraversal:
+        merge = __.merge_v({T.label: self.label, **self.match})
+        if self.properties:
+            merge = merge.option(Merge.on_create, self.properties).option(Merge.on_match, self.properties)
+        return merge
+
+
+# EdgeUpsert: the label edge from from_id to to_id gets properties set, or is
+# created with them. Both vertices must exist. A mergeE():
+#   mergeE([(T.label): 'route', (Direction.OUT): 4340, (Direction.IN): 4350])
+#     .option(onCreate, [dist: 809]).option(onMatch, [dist: 809])
+# Numeric string ids are sent as longs, the id type of JanusGraph.
+class EdgeUpsert:
+    __slots__ = ("label", "from_id", "to_id", "properties")
+
+    def __init__(self, label: str, from_id: Any, to_id: Any, properties: Optional[Dict[str, Any]] = None):
+        self.label = label
+        self.from_id = _graph_id(from_id)
+        self.to_id = _graph_id(to_id)
+        self.properties = dict(properties or {})
+
+    def traversal(self) -> GraphTraversal:
+        merge = __.merge_e({T.label: self.label, Direction.OUT: self.from_id, Direction.IN: self.to_id})
+        if self.properties:
+            merge = merge.option(Merge.on_create, self.properties).option(Merge.on_match, self.properties)
+        return merge
+
+
+def _graph_id(value: Any) -> Any:
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
+# Builds one traversal writing every element of the batch, vertices and edges
+# alike, and returning their ids in the same order:
+#   g.inject(0).union(mergeV(...).option(...), mergeE(...).option(...), ...).id()
+# The Gremlin Server runs a traversal in one transaction, so the batch is
+# committed as a whole or not at all.
+def build_upsert_query(g: GraphTraversalSource, writes: List[Any]) -> GraphTraversal:
+    return g.inject(0).union(*[write.traversal() for write in writes]).id_()
+
+
+# Finds the DriverRemoteConnection a traversal source was bound to with
+# withRemote(). gremlin-python keeps it inside the RemoteStrategy rather than
+# on the source itself, so it is looked up the same way g.tx() does it.
+def remote_connection(g: GraphTraversalSource):
+    for strategy in g.traversal_strategies.traversal_strategies:
+        if strategy.fqcn == "py:RemoteStrategy":
+            return strategy.remote_connection
+    raise RuntimeError("Traversal source is not bound to a remote connection.")
+
+
+# The message serializer of the connection g is bound to, which counts the
+# bytes and deserialization time of its responses (metrics.InstrumentedSerializer).
+def wire_serializer(g: GraphTraversalSource):
+    return getattr(remote_connection(g)._client, "_message_serializer", None)
+
+
+# Turns raw traversers coming back from the server into plain result objects.
+# A Traverser stands for bulk identical results, so it is expanded that many
+# times, which is what iterating a Traversal does as well.
+def traverser_objects(traversers: Iterable[Any]) -> List[Any]:
+    items = []
+    for item in traversers:
+        if isinstance(item, Traverser):
+            items.extend([item.object] * item.bulk)
+        else:
+            items.append(item)
+    return items
+
+
+# Sends bytecode over the connection g is bound to and returns a
+# concurrent.futures.Future of its result objects, like
+# DriverRemoteConnection.submit_async() does, except that request_options
+# (e.g. the evaluationTimeout of a deadline) are added to the ones set on the
+# traversal with with_(), without changing the bytecode itself.
+def submit_bytecode(g: GraphTraversalSource, bytecode: Bytecode,
+                    request_options: Optional[Dict[str, Any]] = None) -> Future:
+    options = dict(DriverRemoteConnection._extract_request_options(bytecode) or {})
+    options.update(request_options or {})
+    future: Future = Future()
+
+    def done(submitted: Future):
+        try:
+            future.set_result(traverser_objects(submitted.result().all().result()))
+        except Exception as e:
+            future.set_exception(e)
+
+    remote_connection(g)._client.submit_async(bytecode, request_options=options or None).add_done_callback(done)
+    return future
+
+
+# Submits a traversal and yields its results one server-side batch at a time.
+# The Gremlin Server sends results in frames of batchSize items (HTTP 206
+# partial responses); the driver puts each frame on the ResultSet's queue as it
+# arrives. DriverRemoteConnection.submit() waits for every frame before
+# returning, so for streaming the traversal's bytecode goes to the driver's
+# client directly and the queue is drained while the rest is still in flight.
+# Items arrive as Traversers and are expanded by traverser_objects().
+# The driver reads every frame as soon as it arrives, whatever pace the
+# consumer goes at, and its queue is unbounded: a consumer slower than the
+# server ends up holding the whole result in memory all the same. Fine for
+# the background jobs, which consume as fast as they can; a client-paced
+# stream should fetch keyset pages on demand instead (see app.py).
+# name is the query shape the stream is reported under in the metrics; the
+# time the consumer holds a batch is not counted as execution time.
+def iter_result_batches(g: GraphTraversalSource, traversal: GraphTraversal, batch_size: int,
+                        name: str = "stream") -> Iterator[List[Any]]:
+    with observe_traversal(name) as record:
+        client = remote_connection(g)._client
+        record.leased(getattr(client, "_message_serializer", None), waited=False)
+        result_set = client.submit(traversal.bytecode, request_options={"batchSize": batch_size})
+        stream = result_set.stream
+        rows = 0
+
+        while not result_set.done.done():
+            try:
+                batch = traverser_objects(stream.get(timeout=0.1))
+            except queue.Empty:
+                continue
+            rows += len(batch)
+            handed_at = time.perf_counter()
+            yield batch
+            record.paused(time.perf_counter() - handed_at)
+        # Frames that landed between the last get() and the end of the response.
+        while not stream.empty():
+            batch = traverser_objects(stream.get_nowait())
+            rows += len(batch)
+            handed_at = time.perf_counter()
+            yield batch
+            record.paused(time.perf_counter() - handed_at)
+        # Surfaces errors reported by the server (e.g. a failed traversal).
+        result_set.done.result()
+        record.received(rows)
+
+
 class GraphCRUDOperations:
     def __init__(self, g: GraphTraversalSource):
         self.g = g
 
+    # Runs a traversal to a list and normalizes the results, reported to the
+    # metrics under name (see metrics.py). The connection was leased before,
+    # for the whole request, so there is no connection wait to report. The
+    # query goes along to the slow query log (see slow_queries.py).
+    def _run(self, name: str, query: GraphTraversal, normalize=normalize_results) -> Any:
+        with observe_traversal(name, query) as record:
+            record.leased(wire_serializer(self.g), waited=False)
+            results = query.toList()
+            record.received(len(results))
+            normalized = normalize(results)
+            record.normalized()
+            return normalized
+
     # get_all_vertices function provides a flexible way to fetch vertex data 
     # from your graph, optionally filtering by label, and then processes the 
     # raw Gremlin output into a clean, Python-friendly dictionary format.
-    def get_all_vertices(self, label: Optional[str] = None) -> List[Dict[str, Any]]:
+    # fields optionally restricts the returned properties, see value_map().
+    def get_all_vertices(self, label: Optional[str] = None, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
         # self.g.V(): This is the starting point of your Gremlin traversal.
         # self.g: This is your GraphTraversalSource object, which is connected 
         # to your remote JanusGraph database. V(): This is a Gremlin step that 
@@ -48,22 +480,49 @@ class GraphCRUDOperations:
             # vertices (all vertices from .V()) to include only those that 
             # have the specified label.
             query = query.hasLabel(label)
-        vertices = []
         try:
             # Gremlin query is actually executed and the results are fetched.
             # It instructs the graph to retrieve all properties of the selected 
             # vertices. The True argument tells Gremlin to include the special 
             # id and label of each vertex in the returned map.
-            results = query.valueMap(True).toList()
-            for v in results:
-                vertices.append(normalize_result(v))
+            vertices = self._run("get_all_vertices", value_map(query, fields))
         except Exception as e:
             raise RuntimeError(f"Failed to get vertices: {e}")
         return vertices
 
+    # Keyset-paginated variant of get_all_vertices. Returns up to limit
+    # vertices ordered by id, starting after the cursor of the previous page,
+    # together with the cursor for the next page (None when this is the last
+    # one). An invalid cursor raises ValueError.
+    def get_vertex_page(self, label: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None,
+                        fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        after_id = decode_cursor(cursor) if cursor else None
+        try:
+            rows = self._run("get_vertex_page", build_vertex_page_query(self.g, label, limit, after_id, fields))
+        except Exception as e:
+            raise RuntimeError(f"Failed to get vertices: {e}")
+        return split_page(rows, limit)
+
+    # Streaming counterpart of get_all_vertices: yields lists of normalized
+    # vertices, one list per server-side result batch, so the normalized
+    # dicts for the whole graph are not built at once (the raw results are
+    # buffered as fast as they arrive, see iter_result_batches). Failures are
+    # raised as RuntimeError, like the other methods.
+    def iter_vertex_batches(self, label: Optional[str] = None, batch_size: int = 500,
+                            fields: Optional[List[str]] = None) -> Iterator[List[Dict[str, Any]]]:
+        query = self.g.V()
+        if label:
+            query = query.hasLabel(label)
+        try:
+            for batch in iter_result_batches(self.g, value_map(query, fields), batch_size, "iter_vertex_batches"):
+                yield normalize_results(batch)
+        except Exception as e:
+            raise RuntimeError(f"Failed to stream vertices: {e}")
+
     # get_vertex_by_id function, which is designed to retrieve a single vertex 
     # from your graph database based on its unique ID.
-    def get_vertex_by_id(self, vertex_id: str) -> Dict[str, Any]:
+    # fields optionally restricts the returned properties, see value_map().
+    def get_vertex_by_id(self, vertex_id: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
         try:
             # self.g.V(vertex_id): This directly starts a Gremlin traversal 
             # that attempts to select a vertex whose ID matches the vertex_id 
@@ -75,7 +534,83 @@ class GraphCRUDOperations:
             # vertex_id, calling .next() will raise an error (a StopIteration 
             # in Gremlin-Python, which the driver might wrap or which the 
             # Gremlin Server might send as a NoSuchElementException).
-            v = self.g.V(vertex_id).valueMap(True).next()
-            return normalize_result(v)
+            query = value_map(self.g.V(vertex_id), fields)
+            with observe_traversal("get_vertex_by_id", query) as record:
+                record.leased(wire_serializer(self.g), waited=False)
+                v = query.next()
+                record.received(1)
+                vertex = normalize_result(v)
+                record.normalized()
+                return vertex
+        except StopIteration:
+            raise VertexNotFoundError(f"Vertex {vertex_id} not found or query failed: no such vertex")
         except Exception as e:
             raise RuntimeError(f"Vertex {vertex_id} not found or query failed: {e}")
+
+    # Candidate routes from from_id to to_id over edge_label edges, as
+    # (vertex ids, edge weights) pairs, see build_route_query(). An empty list
+    # means no route within max_hops (or that an endpoint does not exist).
+    def get_route_paths(self, from_id: str, to_id: str, edge_label: str = "route", max_hops: int = 4,
+                        weight_key: str = "dist", weighted: bool = False, budget: int = 10000,
+                        candidates: int = 100) -> List[Tuple[List[Any], List[Any]]]:
+        query = build_route_query(self.g, from_id, to_id, edge_label, max_hops, weight_key, weighted,
+                                  budget, candidates)
+        try:
+            return self._run("get_route_paths", query, route_paths)
+        except Exception as e:
+            raise RuntimeError(f"Failed to search routes: {e}")
+
+    # Expands the neighborhood of vertex_id level by level, see
+    # NeighborhoodExpansion. Yields the vertex itself as level 0, then one
+    # line per level up to hops. Every level is a separate traversal.
+    # VertexNotFoundError when the vertex does not exist.
+    def iter_neighborhood(self, vertex_id: str, hops: int, direction: str = "out", edge_label: Optional[str] = None,
+                          level_limit: int = 1000, max_vertices: int = 10000, max_edges: int = 100000,
+                          fields: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        start = self.get_vertex_by_id(vertex_id, fields)
+        yield {"level": 0, "vertices": [start], "truncated": False}
+        expansion = NeighborhoodExpansion(start, hops, direction, edge_label, level_limit, max_vertices,
+                                          max_edges, fields)
+        query = expansion.next_query(self.g)
+        while query is not None:
+            try:
+                level = self._run("neighborhood_level", query)
+            except Exception as e:
+                raise RuntimeError(f"Failed to expand the neighborhood of {vertex_id}: {e}")
+            yield expansion.add_level(level)
+            query = expansion.next_query(self.g)
+
+    # Writes a batch of VertexUpsert / EdgeUpsert in one traversal and one
+    # transaction (see build_upsert_query) and returns the ids of the
+    # elements, in the order of writes. The API sends its writes through the
+    # write-behind queue (write_queue.py), which calls the async flavour of
+    # this; scripts can call it directly.
+    def upsert_elements(self, writes: List[Any]) -> List[Any]:
+        if not writes:
+            return []
+        try:
+            return self._run("upsert_elements", build_upsert_query(self.g, writes), list)
+        except GremlinServerError as e:
+            raise WriteRejectedError(f"Write of {len(writes)} elements rejected: {e}")
+        except Exception as e:
+            raise RuntimeError(f"Failed to write {len(writes)} elements: {e}")
+
+    # Single element flavours of upsert_elements. Return the element's id.
+    def upsert_vertex(self, label: str, match: Dict[str, Any], properties: Optional[Dict[str, Any]] = None) -> Any:
+        return self.upsert_elements([VertexUpsert(label, match, properties)])[0]
+
+    def upsert_edge(self, label: str, from_id: Any, to_id: Any, properties: Optional[Dict[str, Any]] = None) -> Any:
+        return self.upsert_elements([EdgeUpsert(label, from_id, to_id, properties)])[0]
+
+    # Bulk version of get_vertex_by_id. All ids are resolved with a single
+    # g.V(id1, id2, ...) traversal, so N lookups cost one round trip instead
+    # of N. Returns a dict keyed by the requested ids; ids that do not exist
+    # map to None.
+    def get_vertices_by_ids(self, ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+        if not ids:
+            return {}
+        try:
+            rows = self._run("get_vertices_by_ids", value_map(self.g.V(*ids), fields))
+        except Exception as e:
+            raise RuntimeError(f"Failed to get vertices by id: {e}")
+        return match_ids(ids, rows)
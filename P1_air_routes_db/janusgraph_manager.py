@@ -1,16 +1,91 @@
 import asyncio
-from typing import Optional
-from gremlin_python.structure.graph import Graph
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, Dict, Any, Awaitable, Callable, Sequence, Union
+from gremlin_python.driver.serializer import (
+    GraphBinarySerializersV1, GraphSONSerializersV2d0, GraphSONSerializersV3d0,
+)
 from gremlin_python.driver.driver_remote_connection import DriverRemoteConnection
+from gremlin_python.process.graph_traversal import GraphTraversalSource
+from gremlin_python.structure.graph import Graph
+
+from connection_pool import ConnectionPool, PooledConnection, ConnectionUnavailableError
+from janusgraph_crud import submit_bytecode
+from load_balancer import LoadBalancer, Endpoint
+from metrics import InstrumentedSerializer
+
+# Wire formats the driver can talk to the Gremlin Server in. GraphBinary is
+# the driver's default; GraphSON is JSON based and larger on the wire, but
+# readable and supported by older servers. bench_serializers.py compares them.
+SERIALIZERS = {
+    "graphbinary": GraphBinarySerializersV1,
+    "graphsonv3": GraphSONSerializersV3d0,
+    "graphsonv2": GraphSONSerializersV2d0,
+}
+DEFAULT_SERIALIZER = "graphbinary"
+
+
+# Creates the message serializer for one of the SERIALIZERS names. Raises
+# ValueError for an unknown name.
+def make_serializer(name: str = DEFAULT_SERIALIZER):
+    try:
+        return SERIALIZERS[name.lower()]()
+    except KeyError:
+        raise ValueError(f"Unknown serializer {name!r}, expected one of {', '.join(SERIALIZERS)}")
+
+
+# Opens one DriverRemoteConnection the way every pooled connection is opened.
+# Each one has a single websocket (pool_size=1), so the size of a pool is the
+# number of sockets open to the Gremlin Server. max_workers=2 because
+# submit_async() waits for the results on the driver's executor while the
+# receive loop needs a second worker; with a single worker promise() would
+# deadlock. The serializer is wrapped to count response bytes and
+# deserialization time for the metrics (see metrics.py).
+#
+# The websocket is opened here rather than on the first request: the driver
+# connects lazily from whichever thread writes first, and when that is the
+# event loop thread (the async CRUD path) its aiohttp transport cannot run its
+# own loop there. Must therefore be called off the event loop.
+def create_connection(url: str, serializer_name: str = DEFAULT_SERIALIZER) -> DriverRemoteConnection:
+    connection = DriverRemoteConnection(url, 'g', pool_size=1, max_workers=2,
+                                        message_serializer=InstrumentedSerializer(make_serializer(serializer_name)))
+    try:
+        _open_websocket(connection)
+    except Exception:
+        connection.close()
+        raise
+    return connection
+
+
+def _open_websocket(connection: DriverRemoteConnection):
+    sockets = connection._client._pool
+    socket = sockets.get()
+    try:
+        socket.connect()
+    finally:
+        sockets.put_nowait(socket)
+
+
+# Health check of one Gremlin Server for LoadBalancer's prober: g.inject(1)
+# on a connection of its own, which must answer within timeout seconds.
+def probe_endpoint(url: str, serializer_name: str = DEFAULT_SERIALIZER, timeout: float = 2.0):
+    connection = create_connection(url, serializer_name)
+    try:
+        g = Graph().traversal().withRemote(connection)
+        submit_bytecode(g, g.inject(1).bytecode,
+                        {"evaluationTimeout": max(1, int(timeout * 1000))}).result(timeout)
+    finally:
+        # Let a late answer arrive before the websocket goes away.
+        PooledConnection(connection)._close(drain_timeout=timeout)
 
 # The JanusGraphManager Class
 class JanusGraphManager:
     #  Hold the single instance of the JanusGraphManager class once it's created.
     _instance = None
-    # Hold the Gremlin Graph Traversal Source
-    _g = None
-    # Hold the DriverRemoteConnection object.
-    _connection = None
+    # Hold the ConnectionPool of DriverRemoteConnection objects. Each pooled
+    # connection carries its own Graph Traversal Source. With several
+    # Gremlin Servers it is a LoadBalancer over one pool per server, which
+    # is used exactly the same way.
+    _pool = None
     # A boolean flag to prevent multiple concurrent attempts to connect.
     _is_connecting = False
 
@@ -23,9 +98,37 @@ class JanusGraphManager:
         return cls._instance
 
     # Establishing the Connection
-    async def connect(self, url: str = 'ws://localhost:8182/gremlin'):
+    # min_size connections are opened straight away, the pool grows on demand
+    # up to max_size, and connections above min_size idle for idle_timeout
+    # seconds are closed again. lease_timeout bounds how long a request waits
+    # for a free connection when all of them are busy. serializer picks the
+    # wire format, one of the SERIALIZERS names.
+    #
+    # url may also be a list of Gremlin Server urls of the same cluster: every
+    # one gets a pool of its own with the sizes above and traversals are
+    # spread over them by a LoadBalancer (see load_balancer.py). A server
+    # failing eject_after times in a row is ejected and probed every
+    # probe_interval seconds (probe_timeout each) until it answers again;
+    # decay_time is how fast the latency it is judged on is forgotten.
+    # hedge_delay > 0 turns on hedged reads (run_hedged_async) for up to
+    # hedge_budget of them. With a single url all of these are ignored.
+    async def connect(
+        self,
+        url: Union[str, Sequence[str]] = 'ws://localhost:8182/gremlin',
+        min_size: int = 2,
+        max_size: int = 8,
+        idle_timeout: float = 300.0,
+        lease_timeout: float = 10.0,
+        serializer: str = DEFAULT_SERIALIZER,
+        eject_after: int = 3,
+        probe_interval: float = 5.0,
+        probe_timeout: float = 2.0,
+        decay_time: float = 10.0,
+        hedge_delay: float = 0.0,
+        hedge_budget: float = 0.1,
+    ):
         # 1. Check if already connected
-        if self._g and self._connection:
+        if self._pool:
             return
         # 2. Handle concurrent connection attempts
         # if self._is_connecting:: This checks if another part of the 
@@ -34,48 +137,124 @@ class JanusGraphManager:
         # is in progress, the function pauses for a short time and then 
         # re-checks. This prevents multiple callers from trying to establish 
         # the connection simultaneously, potentially causing issues. The 
-        # second if self._g and self._connection: after the while loop 
+        # second if self._pool: after the while loop 
         # ensures that if the connection was established by the other 
         # concurrent attempt, this one just returns.
         if self._is_connecting:
             while self._is_connecting:
                 await asyncio.sleep(0.1)
-            if self._g and self._connection:
+            if self._pool:
                 return
 
         # 3. Start connecting
         # The flag is set to indicate that a connection attempt is now active.
         self._is_connecting = True
         try:
-            # Create the remote connection object
-            self._connection = DriverRemoteConnection(url, 'g')
-            # Create a local graph instance
-            graph = Graph()
-            # Create the GraphTraversalSource and bind it to the remote connection
-            # It creates the Graph Traversal Source (g) that you'll use for all your 
-            # Gremlin queries. It binds this traversal source to the remote connection 
-            # established earlier. Now, any traversals built with self._g will be sent 
-            # over the network to your JanusGraph instance.
-            self._g = graph.traversal().withRemote(self._connection)
+            # Fail fast on a bad serializer name instead of on first use.
+            make_serializer(serializer)
+            urls = [url] if isinstance(url, str) else list(url)
+            if not urls:
+                raise ValueError("No JanusGraph url given.")
+
+            # The pool opens its connections with create_connection(). It
+            # creates the Graph Traversal Source (g) for each connection and
+            # binds it to it, so traversals built with a leased g are sent
+            # over that connection's websocket.
+            def make_pool(endpoint_url: str) -> ConnectionPool:
+                return ConnectionPool(
+                    lambda: create_connection(endpoint_url, serializer),
+                    min_size=min_size,
+                    max_size=max_size,
+                    idle_timeout=idle_timeout,
+                    lease_timeout=lease_timeout,
+                )
+
+            if len(urls) == 1:
+                pool = make_pool(urls[0])
+            else:
+                pool = LoadBalancer(
+                    [Endpoint(endpoint_url, lambda endpoint_url=endpoint_url: make_pool(endpoint_url))
+                     for endpoint_url in urls],
+                    probe=lambda endpoint_url: probe_endpoint(endpoint_url, serializer, probe_timeout),
+                    eject_after=eject_after,
+                    probe_interval=probe_interval,
+                    decay_time=decay_time,
+                    hedge_delay=hedge_delay,
+                    hedge_budget=hedge_budget,
+                )
+            # Opening connections blocks, keep it off the event loop.
+            await asyncio.get_running_loop().run_in_executor(None, pool.fill)
+            if isinstance(pool, LoadBalancer):
+                pool.start()
+            self._pool = pool
         except Exception as e:
-            self._g = None
-            self._connection = None
+            self._pool = None
             raise RuntimeError(f"Failed to connect to JanusGraph: {e}")
         finally:
             self._is_connecting = False
 
-    # Provides access to the _g (Graph Traversal Source) object.
+    def _get_pool(self) -> Union[ConnectionPool, LoadBalancer]:
+        if not self._pool:
+            raise ConnectionUnavailableError("Not connected to JanusGraph.")
+        return self._pool
+
+    def is_connected(self) -> bool:
+        return self._pool is not None
+
+    # Provides access to a Graph Traversal Source from the pool without
+    # leasing it. Handy for scripts; request handlers should lease instead.
     def get_g(self):
-        if not self._g:
-            raise RuntimeError("Not connected to JanusGraph.")
-        return self._g
+        return self._get_pool().any_g()
+
+    # Leases a pooled connection for exclusive use. Every acquire() must be
+    # paired with a release(); pass failed=True when the connection broke.
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        return self._get_pool().acquire(timeout)
+
+    # Same as acquire() but waits for a free connection on the event loop
+    # instead of blocking a thread.
+    async def acquire_async(self, timeout: Optional[float] = None) -> PooledConnection:
+        return await self._get_pool().acquire_async(timeout)
+
+    def release(self, pooled: PooledConnection, failed: bool = False):
+        if self._pool:
+            self._pool.release(pooled, failed=failed)
+        else:
+            pooled.close()
+
+    # with janus_graph_manager.lease() as g: ... leases a connection for the
+    # duration of the block and returns it afterwards.
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        with self._get_pool().lease(timeout) as g:
+            yield g
+
+    # async with janus_graph_manager.lease_async() as g: ... for coroutines.
+    @asynccontextmanager
+    async def lease_async(self, timeout: Optional[float] = None):
+        async with self._get_pool().lease_async(timeout) as g:
+            yield g
+
+    # Runs attempt(g) on a leased connection, hedged across Gremlin Servers
+    # when that is turned on (see LoadBalancer.run_hedged_async). Only for
+    # idempotent reads: a hedged attempt may run twice.
+    async def run_hedged_async(self, attempt: Callable[[GraphTraversalSource], Awaitable[Any]]) -> Any:
+        pool = self._get_pool()
+        if isinstance(pool, LoadBalancer):
+            return await pool.run_hedged_async(attempt)
+        async with pool.lease_async() as g:
+            return await attempt(g)
+
+    # Utilization counters of the connection pool; with several Gremlin
+    # Servers summed over them, plus the state of each one.
+    def pool_stats(self) -> Dict[str, Any]:
+        return self._get_pool().stats()
 
-    # Gracefully shutting down the connection.
+    # Gracefully shutting down every pooled connection.
     def close(self):
-        if self._connection:
-            self._connection.close()
-            self._g = None
-            self._connection = None
+        if self._pool:
+            self._pool.close()
+            self._pool = None
 
 
 janus_graph_manager = JanusGraphManager()
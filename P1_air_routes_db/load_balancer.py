@@ -0,0 +1,474 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from gremlin_python.process.graph_traversal import GraphTraversalSource
+
+from connection_pool import ConnectionPool, PooledConnection, ConnectionUnavailableError, must_replace
+from deadlines import DeadlineExceededError
+
+# Latency-aware load balancing over several Gremlin Server nodes.
+#
+# A JanusGraph cluster is usually several Gremlin Servers in front of the same
+# storage backend, each of which can answer any traversal. Sending everything
+# to one of them, or spreading it round-robin, ignores that one node may be
+# busy with a heavy traversal, in a GC pause or simply on a slower machine.
+# LoadBalancer keeps one ConnectionPool per node (an Endpoint) and offers the
+# same acquire/release/lease interface as a single pool, so the manager and
+# everything above it does not care how many nodes there are:
+#  - picking a node: power of two choices. Two healthy endpoints are drawn at
+#    random and the cheaper one is leased from, the cost being a peak-EWMA of
+#    its lease latency times the leases in flight on it (plus one). A slow or
+#    loaded node gets less traffic without the herding that always picking
+#    the single best one causes. Cost decays with time, so a node that was
+#    slow once and then left alone is tried again.
+#  - passive ejection: eject_after failures in a row on one node (a broken
+#    connection, a traversal abandoned at its deadline, see
+#    connection_pool.must_replace) take it out of rotation. When every node
+#    is ejected all of them are used anyway, a degraded answer being better
+#    than none.
+#  - re-probing: a background thread sends g.inject(1) on a fresh connection
+#    to every ejected node each probe_interval seconds and puts it back once
+#    it answers.
+#  - hedged reads (run_hedged_async): when hedge_delay is set, an idempotent
+#    read still unanswered after hedge_delay seconds is sent once more to a
+#    second node and the first answer wins. At most hedge_budget of the
+#    hedgeable reads are hedged, so a cluster that is slow everywhere is not
+#    sent twice the load.
+
+
+# Decays value as if elapsed seconds had passed without an observation.
+def _decayed(value: float, elapsed: float, decay_time: float) -> float:
+    if elapsed <= 0 or decay_time <= 0:
+        return value
+    return value * math.exp(-elapsed / decay_time)
+
+
+# Latency assumed for an endpoint nothing is known about yet (and the least
+# one is ever judged on), so a burst before the first answers is still
+# spread by the leases in flight.
+MIN_LATENCY = 0.001
+
+
+def _consume(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
+
+
+# The Endpoint Class
+# One Gremlin Server node: its connection pool and what the balancer knows
+# about it. pool_factory creates the pool; it is called again when a pool
+# that failed to open its first connections has to be replaced.
+class Endpoint:
+    def __init__(self, url: str, pool_factory: Callable[[], ConnectionPool]):
+        self.url = url
+        self._pool_factory = pool_factory
+        self.pool = pool_factory()
+        # Peak-EWMA of the lease latency in seconds, and when it was updated.
+        self.latency = 0.0
+        self.updated_at = time.monotonic()
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected = False
+        self.ejected_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.leases = 0
+        self.failures = 0
+        self.ejections = 0
+        self.probes = 0
+        self.probe_failures = 0
+
+    def reset_pool(self):
+        self.pool = self._pool_factory()
+
+    # Peak-EWMA: a latency above the average is taken as is, so a node that
+    # stalls is avoided at once; below it the average moves towards it the
+    # more the longer it has been since the last observation.
+    def observe(self, seconds: float, decay_time: float, now: float):
+        if seconds >= self.latency:
+            self.latency = seconds
+        else:
+            weight = _decayed(1.0, now - self.updated_at, decay_time)
+            self.latency = self.latency * weight + seconds * (1.0 - weight)
+        self.updated_at = now
+
+    def cost(self, decay_time: float, now: float) -> float:
+        latency = max(MIN_LATENCY, _decayed(self.latency, now - self.updated_at, decay_time))
+        return latency * (self.in_flight + 1)
+
+    def status(self, decay_time: float, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "ejected": self.ejected,
+            "ejected_for_seconds": round(now - self.ejected_at, 3) if self.ejected else None,
+            "latency_ms": _decayed(self.latency, now - self.updated_at, decay_time) * 1000,
+            "in_flight": self.in_flight,
+            "leases": self.leases,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "ejections": self.ejections,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+            "last_error": self.last_error,
+            "pool": self.pool.stats(),
+        }
+
+
+# Counters summed over the pools of every endpoint in stats().
+_SUMMED_POOL_STATS = ("min_size", "max_size", "size", "in_use", "idle", "unhealthy", "total_leases",
+                      "total_waits", "lease_timeouts", "opened", "evicted", "replaced")
+
+
+# The LoadBalancer Class
+# probe(url) must raise when the node at url does not answer; it runs on the
+# prober thread and may block up to its own timeout.
+class LoadBalancer:
+    def __init__(
+        self,
+        endpoints: Sequence[Endpoint],
+        probe: Callable[[str], None],
+        eject_after: int = 3,
+        probe_interval: float = 5.0,
+        decay_time: float = 10.0,
+        hedge_delay: float = 0.0,
+        hedge_budget: float = 0.1,
+    ):
+        if not endpoints:
+            raise ValueError("At least one endpoint is required.")
+        self.endpoints = list(endpoints)
+        self._probe = probe
+        self.eject_after = max(1, eject_after)
+        self.probe_interval = probe_interval
+        self.decay_time = decay_time
+        self.hedge_delay = hedge_delay
+        self.hedge_budget = hedge_budget
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+        self.hedgeable = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    # Opens the first connections of every endpoint. An endpoint that cannot
+    # be reached starts ejected and is left to the prober; only when none can
+    # be reached does fill() fail.
+    def fill(self):
+        errors = []
+        for endpoint in self.endpoints:
+            try:
+                endpoint.pool.fill()
+            except Exception as e:
+                # fill() closed the pool on its way out.
+                endpoint.reset_pool()
+                with self._lock:
+                    endpoint.last_error = str(e)
+                    self._eject_locked(endpoint)
+                errors.append(f"{endpoint.url}: {e}")
+        if len(errors) == len(self.endpoints):
+            self.close()
+            raise RuntimeError("No JanusGraph endpoint could be reached: " + "; ".join(errors))
+
+    # Starts the thread re-probing ejected endpoints.
+    def start(self):
+        if self._prober is None and self.probe_interval > 0:
+            self._stop.clear()
+            self._prober = threading.Thread(target=self._probe_loop, name="janusgraph-prober", daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            self.probe_ejected()
+
+    # Probes every ejected endpoint once and reinstates those that answer.
+    # Returns how many were reinstated.
+    def probe_ejected(self) -> int:
+        reinstated = 0
+        for endpoint in [e for e in self.endpoints if e.ejected]:
+            started = time.monotonic()
+            try:
+                self._probe(endpoint.url)
+            except Exception as e:
+                with self._lock:
+                    endpoint.probes += 1
+                    endpoint.probe_failures += 1
+                    endpoint.last_error = str(e)
+                continue
+            now = time.monotonic()
+            with self._lock:
+                endpoint.probes += 1
+                endpoint.ejected = False
+                endpoint.ejected_at = None
+                endpoint.consecutive_failures = 0
+                # Start from the probe's latency, not the one that got the
+                # endpoint ejected.
+                endpoint.latency = now - started
+                endpoint.updated_at = now
+                reinstated += 1
+            print(f"JanusGraph endpoint {endpoint.url} is back in rotation.")
+        return reinstated
+
+    def _eject_locked(self, endpoint: Endpoint):
+        if not endpoint.ejected:
+            endpoint.ejected = True
+            endpoint.ejected_at = time.monotonic()
+            endpoint.ejections += 1
+            print(f"JanusGraph endpoint {endpoint.url} ejected: {endpoint.last_error}")
+
+    # Picks an endpoint by power of two choices among the healthy ones not in
+    # exclude, and counts a lease in flight on it. With every candidate
+    # ejected they are all used, unless allow_ejected is False; None when
+    # there is no candidate at all.
+    def _choose(self, exclude: Sequence[Endpoint] = (), allow_ejected: bool = True) -> Optional[Endpoint]:
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude]
+            healthy = [e for e in candidates if not e.ejected]
+            if healthy or not allow_ejected:
+                candidates = healthy
+            if not candidates:
+                return None
+            if len(candidates) == 1:
+                chosen = candidates[0]
+            else:
+                now = time.monotonic()
+                first, second = random.sample(candidates, 2)
+                chosen = first if first.cost(self.decay_time, now) <= second.cost(self.decay_time, now) else second
+            chosen.in_flight += 1
+            return chosen
+
+    # Books the end of a lease on endpoint: its latency, from the moment the
+    # endpoint was chosen so that waiting for one of its connections counts
+    # too (None when there is nothing to go by), and whether the endpoint is
+    # to blame for a failure.
+    def _finish(self, endpoint: Endpoint, seconds: Optional[float], failed: bool = False,
+                error: Optional[BaseException] = None, leased: bool = True):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if seconds is not None:
+                endpoint.leases += leased
+                endpoint.observe(seconds, self.decay_time, time.monotonic())
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if error is not None:
+                    endpoint.last_error = str(error) or type(error).__name__
+                if endpoint.consecutive_failures >= self.eject_after:
+                    self._eject_locked(endpoint)
+            elif seconds is not None:
+                endpoint.consecutive_failures = 0
+
+    # A lease that could not be had on one endpoint: running out of time is
+    # not the endpoint's fault (though the time waited tells it is busy),
+    # failing to open a connection to it is, and the next endpoint is tried.
+    def _acquire_failed(self, endpoint: Endpoint, error: Exception, tried: List[Endpoint], chosen_at: float):
+        if isinstance(error, (ConnectionUnavailableError, DeadlineExceededError)):
+            self._finish(endpoint, time.monotonic() - chosen_at, leased=False)
+            raise error
+        self._finish(endpoint, None, failed=True, error=error)
+        tried.append(endpoint)
+
+    def _leased(self, pooled: PooledConnection, endpoint: Endpoint, chosen_at: float) -> PooledConnection:
+        pooled.endpoint = endpoint
+        pooled.leased_at = chosen_at
+        return pooled
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self._choose(tried)
+            if endpoint is None:
+                raise ConnectionUnavailableError("No JanusGraph endpoint could be reached.")
+            chosen_at = time.monotonic()
+            try:
+                return self._leased(endpoint.pool.acquire(timeout), endpoint, chosen_at)
+            except Exception as e:
+                self._acquire_failed(endpoint, e, tried, chosen_at)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> PooledConnection:
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self._choose(tried)
+            if endpoint is None:
+                raise ConnectionUnavailableError("No JanusGraph endpoint could be reached.")
+            pooled = await self._acquire_on_async(endpoint, timeout, tried)
+            if pooled is not None:
+                return pooled
+
+    async def _acquire_on_async(self, endpoint: Endpoint, timeout: Optional[float],
+                                tried: List[Endpoint]) -> Optional[PooledConnection]:
+        chosen_at = time.monotonic()
+        try:
+            return self._leased(await endpoint.pool.acquire_async(timeout), endpoint, chosen_at)
+        except asyncio.CancelledError:
+            self._finish(endpoint, None)
+            raise
+        except Exception as e:
+            self._acquire_failed(endpoint, e, tried, chosen_at)
+            return None
+
+    # Returns a leased connection to the pool it came from. failed=True is
+    # also counted against its endpoint, see must_replace().
+    def release(self, pooled: PooledConnection, failed: bool = False):
+        self._release(pooled, failed, failed)
+
+    def _release(self, pooled: PooledConnection, failed: bool, endpoint_failed: bool,
+                 error: Optional[BaseException] = None):
+        endpoint = pooled.endpoint
+        endpoint.pool.release(pooled, failed=failed)
+        self._finish(endpoint, time.monotonic() - pooled.leased_at, endpoint_failed, error)
+
+    # A cancelled request (the client went away) replaces its connection but
+    # says nothing about the endpoint.
+    @staticmethod
+    def _blame(error: BaseException):
+        failed = must_replace(error)
+        return failed, failed and not isinstance(error, asyncio.CancelledError)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None):
+        pooled = self.acquire(timeout)
+        failed = endpoint_failed = False
+        error = None
+        try:
+            yield pooled.g
+        except BaseException as e:
+            failed, endpoint_failed = self._blame(e)
+            error = e
+            raise
+        finally:
+            self._release(pooled, failed, endpoint_failed, error)
+
+    @asynccontextmanager
+    async def lease_async(self, timeout: Optional[float] = None):
+        pooled = await self.acquire_async(timeout)
+        async with self._leased_async(pooled) as g:
+            yield g
+
+    @asynccontextmanager
+    async def _leased_async(self, pooled: PooledConnection):
+        failed = endpoint_failed = False
+        error = None
+        try:
+            yield pooled.g
+        except BaseException as e:
+            failed, endpoint_failed = self._blame(e)
+            error = e
+            raise
+        finally:
+            self._release(pooled, failed, endpoint_failed, error)
+
+    # Runs attempt(g) on a leased connection. With hedging on, a second
+    # attempt is started on another healthy endpoint when the first has not
+    # finished after hedge_delay seconds (and the hedge budget allows it);
+    # the first successful result is returned. The attempt that loses runs
+    # to its end in the background (bounded by the request's deadline) and
+    # gives its connection back as usual, so attempt must be idempotent.
+    async def run_hedged_async(self, attempt: Callable[[GraphTraversalSource], Awaitable[Any]]) -> Any:
+        pooled = await self.acquire_async()
+        if self.hedge_delay <= 0:
+            async with self._leased_async(pooled) as g:
+                return await attempt(g)
+        with self._lock:
+            self.hedgeable += 1
+        first = asyncio.ensure_future(self._attempt(pooled, attempt))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        backup = None if done else self._hedge_endpoint(pooled.endpoint)
+        if backup is None:
+            return await first
+        settled = asyncio.get_running_loop().create_future()
+        second = asyncio.ensure_future(self._hedge(backup, attempt, settled))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled() or task.exception() is not None:
+                        error = error or (task.exception() if not task.cancelled() else asyncio.CancelledError())
+                        continue
+                    if task is second:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return task.result()
+            raise error
+        finally:
+            if not settled.done():
+                settled.set_result(None)
+            for task in pending:
+                task.add_done_callback(_consume)
+
+    async def _attempt(self, pooled: PooledConnection, attempt) -> Any:
+        async with self._leased_async(pooled) as g:
+            return await attempt(g)
+
+    # The endpoint a hedge goes to, or None when there is no other healthy
+    # one or the budget is spent.
+    def _hedge_endpoint(self, primary: Endpoint) -> Optional[Endpoint]:
+        with self._lock:
+            if self.hedged >= self.hedge_budget * self.hedgeable:
+                return None
+        endpoint = self._choose([primary], allow_ejected=False)
+        if endpoint is not None:
+            with self._lock:
+                self.hedged += 1
+        return endpoint
+
+    # A hedge that only gets its connection after the first attempt
+    # succeeded gives it straight back.
+    async def _hedge(self, endpoint: Endpoint, attempt, settled: asyncio.Future) -> Any:
+        pooled = await self._acquire_on_async(endpoint, None, [])
+        if pooled is None:
+            raise ConnectionUnavailableError(f"Hedge to {endpoint.url} could not get a connection.")
+        if settled.done():
+            endpoint.pool.release(pooled)
+            self._finish(endpoint, None)
+            raise asyncio.CancelledError()
+        return await self._attempt(pooled, attempt)
+
+    # A healthy endpoint's traversal source without leasing it, see
+    # ConnectionPool.any_g().
+    def any_g(self) -> GraphTraversalSource:
+        endpoint = self._choose()
+        if endpoint is None:
+            raise ConnectionUnavailableError("No JanusGraph endpoint could be reached.")
+        try:
+            return endpoint.pool.any_g()
+        finally:
+            self._finish(endpoint, None)
+
+    def evict_idle(self) -> int:
+        return sum(endpoint.pool.evict_idle() for endpoint in self.endpoints)
+
+    # The pool counters summed over every endpoint, so callers of a single
+    # pool's stats() keep working, plus the state of each endpoint.
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            endpoints = [endpoint.status(self.decay_time, now) for endpoint in self.endpoints]
+            hedging = {
+                "delay_ms": self.hedge_delay * 1000,
+                "budget": self.hedge_budget,
+                "hedgeable": self.hedgeable,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+            }
+        pools = [endpoint["pool"] for endpoint in endpoints]
+        stats: Dict[str, Any] = {key: sum(pool[key] for pool in pools) for key in _SUMMED_POOL_STATS}
+        waited_ms = sum(pool["avg_wait_ms"] * pool["total_waits"] for pool in pools)
+        stats["utilization"] = stats["in_use"] / stats["max_size"] if stats["max_size"] else 0.0
+        stats["avg_wait_ms"] = waited_ms / stats["total_waits"] if stats["total_waits"] else 0.0
+        stats["healthy_endpoints"] = sum(1 for endpoint in endpoints if not endpoint["ejected"])
+        stats["endpoints"] = endpoints
+        stats["hedging"] = hedging
+        return stats
+
+    def close(self):
+        self._stop.set()
+        prober, self._prober = self._prober, None
+        if prober is not None and prober is not threading.current_thread():
+            prober.join(timeout=1.0)
+        for endpoint in self.endpoints:
+            endpoint.pool.close()
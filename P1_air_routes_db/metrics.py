@@ -0,0 +1,369 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from connection_pool import ConnectionUnavailableError, is_connection_error
+from deadlines import DeadlineExceededError
+
+# Instrumentation of the traversals sent to JanusGraph, exposed in the
+# Prometheus text format by GET /metrics.
+#
+# Every traversal the CRUD layer sends runs inside observe_traversal(name),
+# name being the shape of the query ('get_vertex_by_id', 'snapshot_edges'
+# ...), never its arguments, so the number of series stays fixed. The
+# TraversalRecord it yields is told when the connection was in hand, when the
+# results were in and when they were normalized, and splits the latency into
+# phases:
+#  - connection_wait: waiting for a pooled connection (only where the lease
+#    is taken for the traversal itself, i.e. the async CRUD path);
+#  - execution: from sending the request to having every result, minus the
+#    time spent deserializing (server time plus the network);
+#  - deserialization: decoding the response frames, measured by the
+#    InstrumentedSerializer wrapped around each connection's serializer,
+#    which also counts the payload bytes;
+#  - normalize: normalize_result(s) and the like on the results;
+#  - total: the whole call.
+# Rows and payload bytes per traversal go to histograms of their own and
+# failures to a counter by kind. Each observation is a bisect and an
+# increment under a per-series lock, a few microseconds per traversal.
+#
+# Callers that pass the traversal itself (observe_traversal(name, query))
+# also have it handed to the registry's traversal hooks once it succeeded,
+# with its total duration; that is how slow_queries.py spots slow queries.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+BYTE_BUCKETS = (1024, 8192, 65536, 524288, 4194304, 33554432, 268435456)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# The Histogram Class
+# One series: counts per bucket (the last one is +Inf), sum and count.
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+
+    def lines(self, name: str, label_names: Sequence[str], label_values: Sequence[Any]) -> List[str]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = 'le="' + _format_value(float(bound)) + '"'
+            lines.append(f"{name}_bucket{_format_labels(label_names, label_values, le)} {cumulative}")
+        labels = _format_labels(label_names, label_values)
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+# The Counter Class
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def lines(self, name: str, label_names: Sequence[str], label_values: Sequence[Any]) -> List[str]:
+        return [f"{name}{_format_labels(label_names, label_values)} {_format_value(self.value)}"]
+
+
+# The MetricFamily Class
+# A metric name with its labels; labels(...) hands out (and creates on first
+# use) the series of one combination of label values.
+class MetricFamily:
+    def __init__(self, name: str, help: str, kind: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self._series: Dict[Tuple[Any, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: Any):
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.get(values)
+                if series is None:
+                    series = Histogram(self.buckets) if self.kind == "histogram" else Counter()
+                    self._series[values] = series
+        return series
+
+    def lines(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._series.items())
+        for values, series in sorted(items, key=lambda item: tuple(map(str, item[0]))):
+            lines.extend(series.lines(self.name, self.label_names, values))
+        return lines
+
+
+# A collector returns (name, kind, help, [(labels dict, value)]) tuples,
+# computed when /metrics is scraped (e.g. pool and cache gauges).
+Collector = Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]
+# A hook is called as hook(name, traversal, seconds) after a traversal that
+# was passed to observe_traversal() completed.
+TraversalHook = Callable[[str, Any, float], None]
+
+
+# The MetricsRegistry Class
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = True
+        self._families: List[MetricFamily] = []
+        self._collectors: List[Collector] = []
+        self.hooks: List[TraversalHook] = []
+
+    def histogram(self, name: str, help: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> MetricFamily:
+        family = MetricFamily(name, help, "histogram", label_names, buckets)
+        self._families.append(family)
+        return family
+
+    def counter(self, name: str, help: str, label_names: Sequence[str] = ()) -> MetricFamily:
+        family = MetricFamily(name, help, "counter", label_names)
+        self._families.append(family)
+        return family
+
+    def add_collector(self, collector: Collector):
+        self._collectors.append(collector)
+
+    # Hooks are called on the thread or event loop that ran the traversal,
+    # so they must be quick; they run even while recording is disabled.
+    def add_hook(self, hook: "TraversalHook"):
+        self.hooks.append(hook)
+
+    # The whole registry in the Prometheus text exposition format.
+    def render(self) -> str:
+        lines = []
+        for family in self._families:
+            lines.extend(family.lines())
+        for collector in self._collectors:
+            try:
+                collected = collector()
+            except Exception as e:
+                # A broken collector must not take the whole scrape down.
+                lines.append(f"# collector failed: {_escape(e)}")
+                continue
+            for name, kind, help, samples in collected:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} "
+                                 f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+traversal_seconds = registry.histogram(
+    "graph_traversal_seconds", "Latency of JanusGraph traversals by query shape and phase.", ("query", "phase"))
+traversal_rows = registry.histogram(
+    "graph_traversal_rows", "Results returned per traversal.", ("query",), ROW_BUCKETS)
+traversal_bytes = registry.histogram(
+    "graph_traversal_response_bytes", "Response payload bytes per traversal.", ("query",), BYTE_BUCKETS)
+traversal_errors = registry.counter(
+    "graph_traversal_errors_total", "Failed traversals by query shape and kind of failure.", ("query", "kind"))
+
+
+# The InstrumentedSerializer Class
+# Wraps a driver message serializer and adds up the bytes and time spent in
+# deserialize_message(). Pooled connections are leased to one traversal at a
+# time, so what accumulates between TraversalRecord.leased() and received()
+# belongs to that traversal. Everything else is passed through.
+class InstrumentedSerializer:
+    def __init__(self, serializer):
+        self._serializer = serializer
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self._serializer, name)
+
+    def serialize_message(self, request_id, request_message):
+        return self._serializer.serialize_message(request_id, request_message)
+
+    def deserialize_message(self, message):
+        start = time.perf_counter()
+        try:
+            return self._serializer.deserialize_message(message)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.bytes += len(message)
+
+    def reset(self):
+        self.bytes, self.seconds = 0, 0.0
+
+    def take(self) -> Tuple[int, float]:
+        taken = self.bytes, self.seconds
+        self.reset()
+        return taken
+
+
+def _error_kind(error: BaseException) -> str:
+    if isinstance(error, asyncio.CancelledError):
+        return "cancelled"
+    if isinstance(error, DeadlineExceededError):
+        return "deadline"
+    if isinstance(error, ConnectionUnavailableError):
+        return "unavailable"
+    if is_connection_error(error):
+        return "connection"
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    return "server"
+
+
+# The TraversalRecord Class
+# The timestamps of one traversal, turned into observations by finish().
+class TraversalRecord:
+    __slots__ = ("name", "start", "wait", "leased_at", "received_at", "normalized_at", "serializer",
+                 "rows", "bytes", "deserialize", "idle")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.wait: Optional[float] = None
+        self.leased_at: Optional[float] = None
+        self.received_at: Optional[float] = None
+        self.normalized_at: Optional[float] = None
+        self.serializer: Optional[InstrumentedSerializer] = None
+        self.rows: Optional[int] = None
+        self.bytes: Optional[int] = None
+        self.deserialize = 0.0
+        # Time a stream spent handed to its consumer, not waiting on the server.
+        self.idle = 0.0
+
+    # The connection is in hand. waited=False when it was leased before the
+    # traversal started (e.g. for the whole request), so there is no wait to
+    # report.
+    def leased(self, serializer: Any = None, waited: bool = True):
+        self.leased_at = time.perf_counter()
+        if waited:
+            self.wait = self.leased_at - self.start
+        if isinstance(serializer, InstrumentedSerializer):
+            self.serializer = serializer
+            serializer.reset()
+
+    # Every result is in.
+    def received(self, rows: Optional[int] = None):
+        self.received_at = time.perf_counter()
+        if rows is not None:
+            self.rows = rows
+        if self.serializer is not None:
+            self.bytes, self.deserialize = self.serializer.take()
+
+    def normalized(self):
+        self.normalized_at = time.perf_counter()
+
+    # A stream spent seconds handed to its consumer.
+    def paused(self, seconds: float):
+        self.idle += seconds
+
+    # Records the observations and returns the total duration in seconds.
+    def finish(self, error: Optional[BaseException] = None) -> float:
+        total = time.perf_counter() - self.start
+        if not registry.enabled:
+            return total
+        name = self.name
+        traversal_seconds.labels(name, "total").observe(total)
+        if self.wait is not None:
+            traversal_seconds.labels(name, "connection_wait").observe(self.wait)
+        if error is not None:
+            traversal_errors.labels(name, _error_kind(error)).inc()
+            return total
+        if self.received_at is not None:
+            sent_at = self.leased_at if self.leased_at is not None else self.start
+            execution = self.received_at - sent_at - self.deserialize - self.idle
+            traversal_seconds.labels(name, "execution").observe(max(0.0, execution))
+            if self.serializer is not None:
+                traversal_seconds.labels(name, "deserialization").observe(self.deserialize)
+                traversal_bytes.labels(name).observe(self.bytes)
+        if self.normalized_at is not None and self.received_at is not None:
+            traversal_seconds.labels(name, "normalize").observe(self.normalized_at - self.received_at)
+        if self.rows is not None:
+            traversal_rows.labels(name).observe(self.rows)
+        return total
+
+
+# The record handed out while metrics are disabled.
+class _NoRecord:
+    def leased(self, serializer: Any = None, waited: bool = True):
+        pass
+
+    def received(self, rows: Optional[int] = None):
+        pass
+
+    def normalized(self):
+        pass
+
+    def paused(self, seconds: float):
+        pass
+
+
+_NO_RECORD = _NoRecord()
+
+
+# with observe_traversal("get_vertex_by_id", query) as record: ... times one
+# traversal. StopIteration (next() on an empty result) and a stream closed
+# by its consumer are normal outcomes, not errors. The hooks only see
+# traversals that returned normally.
+@contextmanager
+def observe_traversal(name: str, traversal: Any = None) -> Iterator[TraversalRecord]:
+    hooks = registry.hooks if traversal is not None else ()
+    if not registry.enabled and not hooks:
+        yield _NO_RECORD
+        return
+    record = TraversalRecord(name)
+    try:
+        yield record
+    except (StopIteration, GeneratorExit):
+        record.finish()
+        raise
+    except BaseException as e:
+        record.finish(e)
+        raise
+    else:
+        seconds = record.finish()
+        for hook in hooks:
+            hook(name, traversal, seconds)
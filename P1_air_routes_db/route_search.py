@@ -0,0 +1,155 @@
+import heapq
+from typing import Any, Dict, List, Optional, Tuple
+
+from graph_snapshot import GraphSnapshot, NO_VALUE
+
+# Shortest routes between two vertices, for GET /routes/shortest.
+#
+# Over the in-memory snapshot (graph_snapshot.py) the searches are exact:
+#  - fewest hops: a bidirectional breadth-first search, growing one level at
+#    a time from whichever side has the smaller frontier (out edges from the
+#    origin, in edges from the destination) until the two meet. Between two
+#    hubs it touches a few hundred vertices instead of the whole graph.
+#  - smallest total weight (e.g. 'dist'): Dijkstra with the hop limit as a
+#    constraint, so a route of at most max_hops hops is found even when a
+#    shorter one with more hops exists.
+# Without a snapshot the API runs janusgraph_crud.build_route_query on the
+# server and picks the best of its candidate paths with best_route().
+#
+# Both searches return (vertex rows, edge rows) along the route, or None.
+
+Route = Tuple[List[int], List[int]]
+
+
+# Walks the parent links of both searches back from the vertex where they met.
+def _join(forward: Dict[int, Tuple[int, int]], backward: Dict[int, Tuple[int, int]], meet: int) -> Route:
+    rows, edges = [meet], []
+    row = meet
+    while forward[row][0] != NO_VALUE:
+        row, edge = forward[row]
+        rows.append(row)
+        edges.append(edge)
+    rows.reverse()
+    edges.reverse()
+    row = meet
+    while backward[row][0] != NO_VALUE:
+        row, edge = backward[row]
+        rows.append(row)
+        edges.append(edge)
+    return rows, edges
+
+
+def shortest_hops(snapshot: GraphSnapshot, source: int, target: int, edge_label: Optional[str] = None,
+                  max_hops: int = 4) -> Optional[Route]:
+    if source == target:
+        return [source], []
+    # row -> (row it was reached from, edge row); NO_VALUE marks the start.
+    forward = {source: (NO_VALUE, NO_VALUE)}
+    backward = {target: (NO_VALUE, NO_VALUE)}
+    forward_frontier, backward_frontier = [source], [target]
+    hops = 0
+    while forward_frontier and backward_frontier and hops < max_hops:
+        grow_forward = len(forward_frontier) <= len(backward_frontier)
+        if grow_forward:
+            frontier, parents, others, direction = forward_frontier, forward, backward, "out"
+        else:
+            frontier, parents, others, direction = backward_frontier, backward, forward, "in"
+        following = []
+        for row in frontier:
+            for neighbour, edge in snapshot.adjacent(row, direction, edge_label):
+                if neighbour in parents:
+                    continue
+                parents[neighbour] = (row, edge)
+                if neighbour in others:
+                    return _join(forward, backward, neighbour)
+                following.append(neighbour)
+        if grow_forward:
+            forward_frontier = following
+        else:
+            backward_frontier = following
+        hops += 1
+    return None
+
+
+# Dijkstra over (vertex, hops) labels: a vertex is settled again only when it
+# is reached with fewer hops than every earlier, shorter, settlement, which
+# is the only way a longer route to it could still help under the hop limit.
+# Edges without a numeric weight are not followed.
+def shortest_weighted(snapshot: GraphSnapshot, source: int, target: int, weight_key: str,
+                      edge_label: Optional[str] = None, max_hops: int = 4) -> Optional[Tuple[Route, float]]:
+    column = snapshot.edge_columns.get(weight_key)
+    if column is None:
+        raise ValueError(f"Edges have no '{weight_key}' property")
+    codes, values = column.codes, column.values
+    # Every label is (parent label, row, edge row).
+    labels: List[Tuple[int, int, int]] = [(NO_VALUE, source, NO_VALUE)]
+    heap: List[Tuple[float, int, int]] = [(0, 0, 0)]
+    settled: Dict[int, int] = {}
+    unreached = max_hops + 1
+    while heap:
+        distance, hops, label = heapq.heappop(heap)
+        row = labels[label][1]
+        if settled.get(row, unreached) <= hops:
+            continue
+        settled[row] = hops
+        if row == target:
+            rows, edges = [], []
+            while label != NO_VALUE:
+                parent, row, edge = labels[label]
+                rows.append(row)
+                if edge != NO_VALUE:
+                    edges.append(edge)
+                label = parent
+            rows.reverse()
+            edges.reverse()
+            return (rows, edges), distance
+        if hops == max_hops:
+            continue
+        for neighbour, edge in snapshot.adjacent(row, "out", edge_label):
+            code = codes[edge]
+            if code == NO_VALUE or settled.get(neighbour, unreached) <= hops + 1:
+                continue
+            weight = values[code]
+            if not isinstance(weight, (int, float)) or isinstance(weight, bool):
+                continue
+            labels.append((label, neighbour, edge))
+            heapq.heappush(heap, (distance + weight, hops + 1, len(labels) - 1))
+    return None
+
+
+# Sum of weight_key over the edges of a route, or None when an edge lacks it.
+def route_distance(snapshot: GraphSnapshot, edges: List[int], weight_key: str) -> Optional[float]:
+    total = 0
+    for edge in edges:
+        weight = snapshot.edge_property(edge, weight_key)
+        if not isinstance(weight, (int, float)):
+            return None
+        total += weight
+    return total
+
+
+# Same as route_distance for the weights of a server-side path.
+def total_weight(weights: List[Any]) -> Optional[float]:
+    if any(not isinstance(w, (int, float)) for w in weights):
+        return None
+    return sum(weights)
+
+
+# Picks the best of the (vertex ids, edge weights) candidates returned by
+# janusgraph_crud.build_route_query: the smallest total weight when weighted
+# (paths with a missing weight cannot be ranked and are skipped), otherwise
+# the fewest hops, ties going to the smaller total weight.
+def best_route(candidates: List[Tuple[List[Any], List[Any]]], weighted: bool = False
+               ) -> Optional[Tuple[List[Any], Optional[float]]]:
+    best, best_key = None, None
+    for ids, weights in candidates:
+        distance = total_weight(weights)
+        if weighted:
+            if distance is None:
+                continue
+            key = (distance, len(weights))
+        else:
+            key = (len(weights), distance if distance is not None else float("inf"))
+        if best_key is None or key < best_key:
+            best, best_key = (ids, distance), key
+    return best
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from gremlin_python.process.graph_traversal import GraphTraversal
+
+
+# Builds the single-flight key of a traversal from its bytecode: the source
+# instructions (with_(), withStrategies() ...) and the steps with their
+# arguments. Two traversals with the same key send the exact same request to
+# the Gremlin Server and therefore get the same answer.
+def traversal_key(traversal: GraphTraversal) -> Hashable:
+    bytecode = traversal.bytecode
+    return repr((bytecode.source_instructions, bytecode.step_instructions))
+
+
+# The SingleFlight Class
+# Deduplicates identical calls that are in flight at the same time. The first
+# caller for a key (the leader) starts the work as its own task; callers that
+# arrive with the same key before it finishes wait for that task instead of
+# starting their own, and everyone gets the same result or the same exception.
+# The task is awaited through asyncio.shield, so a caller that goes away
+# (client disconnect, timeout) does not cancel the work the others share. Once
+# the task is done the key is forgotten, so nothing is cached beyond the
+# lifetime of the call. Meant to be used from a single event loop.
+class SingleFlight:
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._calls = 0
+        self._executions = 0
+        self._coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self._calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            self._executions += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self._coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every waiter went away.
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self._calls,
+            "executions": self._executions,
+            "coalesced": self._coalesced,
+            "coalesced_ratio": self._coalesced / self._calls if self._calls else 0.0,
+            "in_flight": len(self._in_flight),
+        }
@@ -0,0 +1,227 @@
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, List, Optional
+
+from gremlin_python.process.translator import Translator
+from gremlin_python.process.traversal import Bytecode
+
+from janusgraph_crud import remote_connection, traverser_objects
+
+# Step-level profiles of slow traversals, served by GET /debug/slow-queries.
+#
+# The latency histograms of metrics.py tell that a query shape is slow, not
+# where the time goes: the storage backend, a missing index or our own
+# Python code. Gremlin answers that with profile(), which runs a traversal
+# and returns the time and traverser counts of every step (JanusGraph adds
+# the backend queries and indexes it used as nested metrics). SlowQueryLog is
+# a hook of the metrics registry and sees every traversal GraphCRUDOperations
+# and AsyncGraphCRUDOperations run, with its duration. It captures one when:
+#  - 'threshold': it took longer than threshold_ms, at most once every
+#    min_interval seconds per query shape so a slow endpoint under load is
+#    not profiled over and over;
+#  - 'request': the request it belongs to asked for it with ?profile=true
+#    (see profile_request()), whatever its duration.
+# Capturing re-runs the traversal's bytecode with profile() appended, on a
+# leased pool connection, on a single background thread, so the request
+# itself never waits for it; with max_pending captures already queued new
+# ones are dropped. Traversals that write are never re-run. The entries are
+# kept in a ring buffer of the last size captures.
+
+# Steps that change the graph; a traversal using any of them, at any depth,
+# is not re-run.
+WRITE_STEPS = {"addV", "addE", "property", "drop", "mergeV", "mergeE", "sideEffect"}
+
+# Query shapes that write, not re-run whatever their bytecode looks like.
+WRITE_QUERIES = {"upsert_elements", "analytics_write_back"}
+
+# Whether the traversals of the current request are to be profiled. Set by
+# profile_request() at the start of every request that runs traversals, so a
+# context shared by several requests cannot carry the flag over.
+_profile_requested: ContextVar[bool] = ContextVar("profile_requested", default=False)
+
+
+def profile_request(enabled: bool = True):
+    _profile_requested.set(enabled)
+
+
+def describe_traversal(bytecode: Bytecode) -> str:
+    try:
+        return Translator("g").translate(bytecode)
+    except Exception:
+        # Arguments the translator does not know still leave a readable list.
+        return str(bytecode)
+
+
+# Whether the bytecode or any traversal nested in its arguments (union(),
+# coalesce(), ... children, e.g. the mergeV() steps of build_upsert_query)
+# uses a write step.
+def writes_graph(bytecode: Bytecode) -> bool:
+    for instruction in bytecode.step_instructions:
+        if instruction[0] in WRITE_STEPS:
+            return True
+        for argument in instruction[1:]:
+            nested = getattr(argument, "bytecode", argument)
+            if isinstance(nested, Bytecode) and writes_graph(nested):
+                return True
+    return False
+
+
+# Durations come back as long nanoseconds in GraphBinary and as double
+# milliseconds in GraphSON.
+def _millis(duration: Any) -> float:
+    if isinstance(duration, int):
+        return duration / 1e6
+    return float(duration or 0.0)
+
+
+def _flatten_metrics(metrics: List[Dict[str, Any]], depth: int, steps: List[Dict[str, Any]]):
+    for metric in metrics or []:
+        counts = metric.get("counts") or {}
+        annotations = dict(metric.get("annotations") or {})
+        percent = annotations.pop("percentDur", None)
+        steps.append({
+            "name": metric.get("name"),
+            "depth": depth,
+            "dur_ms": _millis(metric.get("dur")),
+            "percent_dur": percent,
+            "traversers": counts.get("traverserCount"),
+            "elements": counts.get("elementCount"),
+            "annotations": annotations,
+        })
+        _flatten_metrics(metric.get("metrics"), depth + 1, steps)
+
+
+# Turns the TraversalMetrics map returned by profile() into the total
+# duration and one row per step, nested metrics (backend queries) following
+# their step with a greater depth.
+def summarize_profile(raw: Dict[str, Any]) -> Dict[str, Any]:
+    steps: List[Dict[str, Any]] = []
+    _flatten_metrics(raw.get("metrics"), 0, steps)
+    return {"dur_ms": _millis(raw.get("dur")), "steps": steps}
+
+
+# Runs the traversal once more with profile() appended and returns its
+# summarized metrics. Blocking.
+def profile_bytecode(g, bytecode: Bytecode) -> Dict[str, Any]:
+    profiled = Bytecode(bytecode)
+    profiled.add_step("profile")
+    results = traverser_objects(remote_connection(g).submit(profiled).traversers)
+    if not results or not isinstance(results[0], dict):
+        raise RuntimeError("profile() returned no metrics")
+    return summarize_profile(results[0])
+
+
+# The SlowQueryLog Class
+class SlowQueryLog:
+    def __init__(self, manager, threshold_ms: float = 1000.0, size: int = 100, min_interval: float = 60.0,
+                 max_pending: int = 4):
+        self.manager = manager
+        # None disables the automatic captures; ?profile=true still works.
+        self.threshold = threshold_ms / 1000.0 if threshold_ms > 0 else None
+        self.size = size
+        self.min_interval = min_interval
+        self.max_pending = max_pending
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._last_capture: Dict[str, float] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.captured = 0
+        self.failed = 0
+        self.dropped = 0
+        self.skipped_writes = 0
+
+    # The metrics hook (see MetricsRegistry.add_hook). Runs for every
+    # traversal, so the common case returns after a comparison.
+    def on_traversal(self, name: str, traversal: Any, seconds: float):
+        requested = _profile_requested.get()
+        if not requested and (self.threshold is None or seconds < self.threshold):
+            return
+        bytecode = getattr(traversal, "bytecode", traversal)
+        if not isinstance(bytecode, Bytecode):
+            return
+        if name in WRITE_QUERIES or writes_graph(bytecode):
+            self.skipped_writes += 1
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not requested and now - self._last_capture.get(name, -self.min_interval) < self.min_interval:
+                return
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self._last_capture[name] = now
+            self._pending += 1
+            entry = {
+                "id": next(self._ids),
+                "query": name,
+                "trigger": "request" if requested else "threshold",
+                "recorded_at": time.time(),
+                "duration_ms": seconds * 1000.0,
+                "traversal": describe_traversal(bytecode),
+                "status": "pending",
+                "profile": None,
+                "error": None,
+            }
+            self._entries.append(entry)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slow-query-profile")
+            executor = self._executor
+        executor.submit(self._capture, entry, Bytecode(bytecode))
+
+    def _capture(self, entry: Dict[str, Any], bytecode: Bytecode):
+        try:
+            with self.manager.lease() as g:
+                entry["profile"] = profile_bytecode(g, bytecode)
+            entry["status"] = "captured"
+            self.captured += 1
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = str(e)
+            self.failed += 1
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    # Newest first, optionally only one query shape or trigger.
+    def entries(self, limit: Optional[int] = None, query: Optional[str] = None,
+                trigger: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(reversed(self._entries))
+        entries = [e for e in entries if (query is None or e["query"] == query)
+                   and (trigger is None or e["trigger"] == trigger)]
+        return entries[:limit] if limit is not None else entries
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return next((e for e in self._entries if e["id"] == entry_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last_capture.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold * 1000.0 if self.threshold is not None else None,
+                "size": self.size,
+                "entries": len(self._entries),
+                "pending": self._pending,
+                "captured": self.captured,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "skipped_writes": self.skipped_writes,
+            }
+
+    # Captures still queued are abandoned.
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules of the project are imported flat (from metrics import ...), as
+# app.py does when run from this directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
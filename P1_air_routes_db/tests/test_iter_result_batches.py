@@ -0,0 +1,50 @@
+import queue
+from concurrent.futures import Future
+
+import pytest
+from gremlin_python.structure.graph import Graph
+
+import metrics
+from janusgraph_crud import iter_result_batches
+
+
+# Stands in for the driver's ResultSet: every frame is already on the queue
+# and the response is complete.
+class _ResultSet:
+    def __init__(self, frames):
+        self.stream = queue.Queue()
+        for frame in frames:
+            self.stream.put(frame)
+        self.done = Future()
+        self.done.set_result(None)
+
+
+class _Client:
+    def __init__(self, frames):
+        self.frames = frames
+
+    def submit(self, bytecode, request_options=None):
+        return _ResultSet(self.frames)
+
+
+class _RemoteConnection:
+    def __init__(self, frames):
+        self._client = _Client(frames)
+
+
+@pytest.fixture
+def metrics_disabled():
+    enabled = metrics.registry.enabled
+    metrics.registry.enabled = False
+    yield
+    metrics.registry.enabled = enabled
+
+
+def test_streams_batches_with_metrics_disabled(metrics_disabled):
+    g = Graph().traversal().withRemote(_RemoteConnection([[1, 2], [3]]))
+    assert list(iter_result_batches(g, g.V(), batch_size=2)) == [[1, 2], [3]]
+
+
+def test_streams_batches_with_metrics_enabled():
+    g = Graph().traversal().withRemote(_RemoteConnection([[1, 2], [3]]))
+    assert list(iter_result_batches(g, g.V(), batch_size=2)) == [[1, 2], [3]]
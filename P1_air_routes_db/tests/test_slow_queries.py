@@ -0,0 +1,28 @@
+from gremlin_python.process.graph_traversal import __
+from gremlin_python.structure.graph import Graph
+
+from janusgraph_crud import VertexUpsert, EdgeUpsert, build_upsert_query
+from slow_queries import SlowQueryLog, writes_graph
+
+g = Graph().traversal()
+
+
+def test_write_steps_nested_in_union_are_found():
+    query = build_upsert_query(g, [VertexUpsert("airport", {"code": "AUS"}), EdgeUpsert("route", 1, 2)])
+    assert writes_graph(query.bytecode)
+
+
+def test_write_steps_nested_deeper_are_found():
+    assert writes_graph(g.V().coalesce(__.out("route"), __.union(__.identity(), __.addV("airport"))).bytecode)
+
+
+def test_reads_are_not_writes():
+    assert not writes_graph(g.V().hasLabel("airport").union(__.out("route"), __.in_("route")).bytecode)
+
+
+def test_upserts_are_not_profiled():
+    log = SlowQueryLog(manager=None, threshold_ms=0.01)
+    log.on_traversal("upsert_elements", build_upsert_query(g, [VertexUpsert("airport", {"code": "AUS"})]), 1.0)
+    log.on_traversal("analytics_write_back", g.V().valueMap(), 1.0)
+    assert log.entries() == []
+    assert log.stats()["skipped_writes"] == 2
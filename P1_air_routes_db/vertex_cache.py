@@ -0,0 +1,215 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+from janusgraph_crud import VertexNotFoundError
+
+# Marker stored for negative entries, i.e. "we asked and the vertex does not
+# exist". It lets a cache hit on a missing vertex be told apart from a miss.
+NOT_FOUND = object()
+
+
+# The TTLCache Class
+# A bounded, thread-safe LRU cache where every entry also carries its own
+# expiry time. An OrderedDict keeps the entries in recency order: a hit moves
+# the entry to the end, and when the cache is full the entry at the front (the
+# least recently used one) is evicted. Expired entries are dropped lazily when
+# they are looked up. Counters for hits, misses, evictions and expirations are
+# kept so the hit rate can be read in production through stats().
+# Tuple keys are also grouped by their first element (the vertex id, the
+# label), so invalidate_prefix() only looks at the keys of that group instead
+# of scanning the whole cache: write paths drop vertices one by one.
+class TTLCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0, negative_ttl: float = 30.0):
+        if max_size < 1:
+            raise ValueError(f"Invalid cache size: {max_size}")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        # key -> (expires_at, value)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # key[0] -> tuple keys starting with it
+        self._groups: Dict[Hashable, Set[Hashable]] = {}
+
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    # Returns (True, value) on a hit and (False, None) on a miss. value is
+    # NOT_FOUND for a negative entry.
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self._drop(key)
+                self._expirations += 1
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            if value is NOT_FOUND:
+                self._negative_hits += 1
+            return True, value
+
+    # Stores value under key for ttl seconds (the cache's default ttl, or
+    # negative_ttl for NOT_FOUND entries, when not given).
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is NOT_FOUND else self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            if isinstance(key, tuple) and key:
+                self._groups.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+
+    # Removes one entry and its group membership. Called with the lock held.
+    def _drop(self, key: Hashable) -> bool:
+        if self._entries.pop(key, None) is None:
+            return False
+        if isinstance(key, tuple) and key:
+            group = self._groups.get(key[0])
+            if group is not None:
+                group.discard(key)
+                if not group:
+                    del self._groups[key[0]]
+        return True
+
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            if not self._drop(key):
+                return False
+            self._invalidations += 1
+            return True
+
+    # Drops every entry whose key is a tuple starting with prefix. Keys of
+    # the read cache look like (vertex_id, fields), so this removes a vertex
+    # whatever projection it was cached under. Only the group of prefix[0]
+    # is looked at.
+    def invalidate_prefix(self, *prefix: Any) -> int:
+        n = len(prefix)
+        if not n:
+            return 0
+        with self._lock:
+            keys = [k for k in self._groups.get(prefix[0], ()) if k[:n] == prefix]
+            for key in keys:
+                self._drop(key)
+            self._invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "negative_ttl": self.negative_ttl,
+                "hits": self._hits,
+                "negative_hits": self._negative_hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+
+def _fields_key(fields: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    return tuple(sorted(fields)) if fields else None
+
+
+# The VertexReadCache Class
+# Read-through cache in front of the two read paths that hit JanusGraph for
+# data that almost never changes: single vertices by id and label-filtered
+# vertex lists. Each path has its own TTLCache, so they can be sized, switched
+# on and off and measured independently. Misses for unknown vertex ids are
+# cached too (negative caching), so repeated lookups of a bad id do not keep
+# reaching the server.
+class VertexReadCache:
+    def __init__(self, vertex_cache: Optional[TTLCache] = None, label_cache: Optional[TTLCache] = None):
+        # None disables caching for that path.
+        self.vertices = vertex_cache
+        self.labels = label_cache
+
+    # crud is a GraphCRUDOperations-like object with an awaitable
+    # get_vertex_by_id (AsyncGraphCRUDOperations). Raises VertexNotFoundError
+    # for missing vertices, cached or not.
+    async def get_vertex_by_id(self, crud, vertex_id: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        if self.vertices is None:
+            return await crud.get_vertex_by_id(vertex_id, fields)
+        key = (str(vertex_id), _fields_key(fields))
+        hit, value = self.vertices.get(key)
+        if hit:
+            if value is NOT_FOUND:
+                raise VertexNotFoundError(f"Vertex {vertex_id} not found or query failed: no such vertex")
+            return value
+        try:
+            vertex = await crud.get_vertex_by_id(vertex_id, fields)
+        except VertexNotFoundError:
+            self.vertices.put(key, NOT_FOUND)
+            raise
+        self.vertices.put(key, vertex)
+        return vertex
+
+    # Label-filtered get_all_vertices. Unfiltered listings are passed through:
+    # they are the whole graph and would just flush everything else out.
+    async def get_all_vertices(self, crud, label: Optional[str] = None,
+                               fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if self.labels is None or not label:
+            return await crud.get_all_vertices(label, fields)
+        key = (label, _fields_key(fields))
+        hit, value = self.labels.get(key)
+        if hit:
+            return value
+        vertices = await crud.get_all_vertices(label, fields)
+        self.labels.put(key, vertices)
+        return vertices
+
+    # Invalidation API for write paths. A change to a vertex drops its cached
+    # copies and the cached lists of its label (of every label when the label
+    # is not known). Returns the number of entries removed.
+    def invalidate_vertex(self, vertex_id: Any, label: Optional[str] = None) -> int:
+        removed = 0
+        if self.vertices is not None:
+            removed += self.vertices.invalidate_prefix(str(vertex_id))
+        removed += self.invalidate_label(label)
+        return removed
+
+    # Drops the cached lists of one label, or of every label when None.
+    def invalidate_label(self, label: Optional[str] = None) -> int:
+        if self.labels is None:
+            return 0
+        if label is None:
+            size = self.labels.stats()["size"]
+            self.labels.clear()
+            return size
+        return self.labels.invalidate_prefix(label)
+
+    def clear(self):
+        for cache in (self.vertices, self.labels):
+            if cache is not None:
+                cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "read_vertex": self.vertices.stats() if self.vertices is not None else {"enabled": False},
+            "read_vertices": self.labels.stats() if self.labels is not None else {"enabled": False},
+        }
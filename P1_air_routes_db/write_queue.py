@@ -0,0 +1,224 @@
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+from connection_pool import ConnectionUnavailableError
+from deadlines import Deadline, deadline_scope, wait_within
+from janusgraph_async_crud import AsyncGraphCRUDOperations
+from janusgraph_crud import WriteRejectedError
+
+# Write-behind queue for the write API.
+#
+# Sent one by one, every upsert is a round trip and a transaction of its own
+# on JanusGraph, and the commit is where the time goes. WriteBehindQueue
+# collects the writes of all requests and sends them in groups, each group
+# one multi-element traversal and therefore one transaction (see
+# janusgraph_crud.build_upsert_query):
+#  - a group is sent once it holds max_batch_size writes, or max_linger
+#    seconds after its oldest write arrived, whichever comes first. Under
+#    load groups fill up at once and max_linger costs nothing; a lone write
+#    waits at most max_linger;
+#  - up to max_in_flight groups are sent at the same time. While all of them
+#    are busy the next group keeps growing instead of waiting in line;
+#  - every caller is answered when the group holding its writes has been
+#    committed, with the ids of its elements.
+# When the server rejects a group (WriteRejectedError: an edge to a vertex
+# that does not exist, a value of the wrong type), the group is split in two
+# and each half sent again, down to the single write that is at fault: one
+# bad write fails its own caller only. That is safe because every write is
+# an idempotent upsert. Any other failure (a lost connection, a timeout, no
+# free connection) fails the whole group at once; whether it was committed
+# is then unknown, and sending the writes again is the answer.
+
+
+# Raised to the callers when max_pending writes are already waiting.
+class WriteQueueFullError(RuntimeError):
+    pass
+
+
+class _PendingWrite:
+    __slots__ = ("write", "future", "enqueued_at")
+
+    def __init__(self, write: Any, future: asyncio.Future, enqueued_at: float):
+        self.write = write
+        self.future = future
+        self.enqueued_at = enqueued_at
+
+
+# The WriteBehindQueue Class
+# Lives on the event loop of the app. Listeners are called with the writes
+# of every committed group and their element ids, e.g. to drop cached copies
+# of the vertices written. write_timeout bounds each group's traversal.
+class WriteBehindQueue:
+    def __init__(self, manager, max_batch_size: int = 500, max_linger: float = 0.005, max_pending: int = 50000,
+                 max_in_flight: int = 4, write_timeout: float = 30.0):
+        if max_batch_size < 1 or max_in_flight < 1:
+            raise ValueError("max_batch_size and max_in_flight must be at least 1.")
+        self.crud = AsyncGraphCRUDOperations(connections=manager)
+        self.max_batch_size = max_batch_size
+        self.max_linger = max_linger
+        self.max_pending = max_pending
+        self.max_in_flight = max_in_flight
+        self.write_timeout = write_timeout
+        self._pending: Deque[_PendingWrite] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._listeners: List[Callable[[List[Any], List[Any]], None]] = []
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.splits = 0
+        self.abandoned = 0
+        self.listener_failures = 0
+        self.largest_batch = 0
+        self.last_error: Optional[str] = None
+
+    def add_listener(self, listener: Callable[[List[Any], List[Any]], None]):
+        self._listeners.append(listener)
+
+    def running(self) -> bool:
+        return self._task is not None and not self._stopping
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._stopping = False
+        self._task = asyncio.ensure_future(self._run())
+
+    # Sends what is still queued and waits for every group in flight.
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        self._task = None
+
+    # Queues the writes and resolves to their element ids once committed.
+    # A failed write raises its error, or with return_exceptions=True takes
+    # its place in the list. The wait ends at the deadline
+    # (DeadlineExceededError): the writes still queued then are dropped,
+    # those already sent may be committed.
+    async def submit(self, writes: List[Any], deadline: Optional[Deadline] = None,
+                     return_exceptions: bool = False) -> List[Any]:
+        if not self.running():
+            raise ConnectionUnavailableError("The write queue is not running.")
+        if len(self._pending) + len(writes) > self.max_pending:
+            raise WriteQueueFullError(f"The write queue is full ({self.max_pending} pending writes).")
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        futures = []
+        for write in writes:
+            future = loop.create_future()
+            self._pending.append(_PendingWrite(write, future, now))
+            futures.append(future)
+        self._wakeup.set()
+        results = await wait_within(asyncio.gather(*futures, return_exceptions=True), deadline)
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        return results
+
+    # Groups the queued writes: waits for a free slot, then until the group
+    # is full or the oldest write lingered max_linger, and sends it.
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._pending:
+                if self._stopping:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            await self._slots.acquire()
+            flush_at = self._pending[0].enqueued_at + self.max_linger
+            while len(self._pending) < self.max_batch_size and not self._stopping:
+                remaining = flush_at - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch_size))]
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushed)
+
+    def _flushed(self, task: asyncio.Task):
+        self._flushes.discard(task)
+        self._slots.release()
+
+    async def _flush(self, batch: List[_PendingWrite]):
+        # Callers that gave up before their write was sent are not written.
+        sent = [pending for pending in batch if not pending.future.done()]
+        self.abandoned += len(batch) - len(sent)
+        if sent:
+            await self._send(sent)
+
+    async def _send(self, batch: List[_PendingWrite]):
+        writes = [pending.write for pending in batch]
+        try:
+            with deadline_scope(self.write_timeout):
+                ids = await self.crud.upsert_elements(writes)
+        except WriteRejectedError as e:
+            if len(batch) == 1:
+                self.rejected += 1
+                self._fail(batch, e)
+                return
+            self.splits += 1
+            middle = len(batch) // 2
+            await self._send(batch[:middle])
+            await self._send(batch[middle:])
+            return
+        except RuntimeError as e:
+            self._fail(batch, e)
+            return
+        self.batches += 1
+        self.written += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.last_error = None
+        for pending, element_id in zip(batch, ids):
+            if not pending.future.done():
+                pending.future.set_result(element_id)
+        for listener in self._listeners:
+            try:
+                listener(writes, ids)
+            except Exception as e:
+                self.listener_failures += 1
+                self.last_error = f"Write listener failed: {e}"
+
+    def _fail(self, batch: List[_PendingWrite], error: Exception):
+        self.failed += len(batch)
+        self.last_error = str(error)
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running(),
+            "pending": len(self._pending),
+            "in_flight": len(self._flushes),
+            "max_batch_size": self.max_batch_size,
+            "max_linger_ms": self.max_linger * 1000.0,
+            "max_in_flight": self.max_in_flight,
+            "max_pending": self.max_pending,
+            "batches": self.batches,
+            "written": self.written,
+            "average_batch_size": self.written / self.batches if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "splits": self.splits,
+            "abandoned": self.abandoned,
+            "listener_failures": self.listener_failures,
+            "last_error": self.last_error,
+        }